@@ -4,9 +4,17 @@ from sklearn.cluster import KMeans
 from sklearn.manifold import TSNE # 替换 PCA 为 t-SNE
 import numpy as np
 from storage.repository import MovieRepository
+from utils.cache import VersionedCache
 import re
 
+# 聚类与相似推荐只需要的列 (按需投影，避免读取整行)
+MOVIE_COLUMNS = ("id", "info_link", "pic_link", "cname", "score", "introduction", "year_release", "directors", "category")
+
+
 class ClusteringService:
+    # 聚类结果与 TF-IDF 矩阵按数据版本缓存 (聚类包含 n_init=100 的 KMeans 和 t-SNE，开销很大)
+    _cache = VersionedCache(maxsize=32)
+
     def __init__(self, repo: MovieRepository):
         self.repo = repo
         self.stopwords = self._load_stopwords()
@@ -39,10 +47,19 @@ class ClusteringService:
         return self._clean_text(t).strip()
 
     def perform_clustering(self, n_clusters=8):
-        # 1. 获取数据
-        movies = self.repo.get_all_movies()
-        # 过滤掉简介过短的电影
-        valid_movies = [m for m in movies if m[6] and len(m[6]) > 10]
+        key = (self.repo.db_path, self.repo.table_name, "clusters", n_clusters)
+        version = self.repo.get_data_version()
+        cached = self._cache.get(key, version)
+        if cached is not None:
+            return cached
+        result = self._perform_clustering(n_clusters)
+        if result is not None:
+            self._cache.set(key, version, result)
+        return result
+
+    def _perform_clustering(self, n_clusters):
+        # 1. 流式读取数据，并过滤掉简介过短的电影
+        valid_movies = self._load_valid_movies()
         
         if not valid_movies:
             return None
@@ -54,21 +71,20 @@ class ClusteringService:
         titles = []
         ids = []
 
-        for m in valid_movies:
-            intro = self._clean_text(m[6])
+        for movie_id, link, pic, title, score, intro, year, directors, category in valid_movies:
+            intro = self._clean_text(intro)
             # 切词处理简介
             intro_words = [w for w in jieba.cut(intro) if w not in self.stopwords and len(w) > 1]
             
-            # 处理类型 (Type is at index 7) - 假设 Type 是 "剧情 犯罪" 这样的字符串
-            genre = self._clean_text(m[7])
+            # 处理类型
+            genre = self._clean_text(category)
             genre_words = [w for w in jieba.cut(genre)] * 3
             
-            # 处理导演 (Director is at index 10)
-            director = self._clean_text(m[10]) # 假设 index 10 是导演
+            # 处理导演
+            director = self._clean_text(directors)
             director_words = [w for w in jieba.cut(director)] * 5
 
             # 处理系列名，聚合续集/季
-            title = m[3]
             series_token = self._get_series_token(title)
             # 极高权重：让 TF-IDF 认为这是最重要的特征
             series_words = [w for w in jieba.cut(series_token) if len(w) > 1] * 10
@@ -77,8 +93,8 @@ class ClusteringService:
             full_text = " ".join(intro_words + genre_words + director_words + series_words)
             corpus.append(full_text)
             
-            titles.append(m[3])
-            ids.append(m[1])
+            titles.append(title)
+            ids.append(link)
 
         # 3. TF-IDF 向量化
         vectorizer = TfidfVectorizer(max_features=20, ngram_range=(1, 2)) # N-gram 支持 (1-gram 和 2-gram)，捕获固定搭配
@@ -122,60 +138,79 @@ class ClusteringService:
             
         return result
 
+    def _load_valid_movies(self):
+        """按 MOVIE_COLUMNS 流式读取电影，只保留简介长度超过 10 的记录."""
+        intro = MOVIE_COLUMNS.index("introduction")
+        return [m for m in self.repo.iter_movies(columns=MOVIE_COLUMNS) if m[intro] and len(m[intro]) > 10]
+
+    def _similarity_matrix(self):
+        """构建相似推荐使用的 TF-IDF 矩阵，返回 (有效电影列表, 矩阵)."""
+        key = (self.repo.db_path, self.repo.table_name, "similarity")
+        version = self.repo.get_data_version()
+        cached = self._cache.get(key, version)
+        if cached is not None:
+            return cached
+
+        valid_movies = self._load_valid_movies()
+
+        # 构建特征 (简化版逻辑，保持一致性)
+        corpus = []
+        for movie_id, link, pic, title, score, intro, year, directors, category in valid_movies:
+            intro = self._clean_text(intro)
+            intro_words = [w for w in jieba.cut(intro) if w not in self.stopwords and len(w) > 1]
+            genre_words = [w for w in jieba.cut(self._clean_text(category))] * 2
+            director_words = [w for w in jieba.cut(self._clean_text(directors))] * 2
+            
+            series_token = self._get_series_token(title)
+            series_words = [w for w in jieba.cut(series_token) if len(w) > 1] * 10
+            
+            corpus.append(" ".join(intro_words + genre_words + director_words + series_words))
+
+        # 向量化
+        X = None
+        if corpus:
+            vectorizer = TfidfVectorizer(max_features=1000, ngram_range=(1, 3))
+            X = vectorizer.fit_transform(corpus)
+
+        self._cache.set(key, version, (valid_movies, X))
+        return valid_movies, X
+
     def get_similar_movies(self, movie_id: int, n_top: int = 6):
         """基于内容(TF-IDF)计算最相似的电影"""
         from sklearn.metrics.pairwise import cosine_similarity
         
-        # 1. 获取所有有效数据
-        movies = self.repo.get_all_movies()
-        valid_movies = [m for m in movies if m[6] and len(m[6]) > 10]
+        # 1. 获取有效数据及其 TF-IDF 矩阵 (按数据版本缓存，不必每次请求都重新分词)
+        valid_movies, X = self._similarity_matrix()
         
         # 2. 找到目标电影的索引
         target_idx = -1
-        for i, m in enumerate(valid_movies):
-            if m[0] == movie_id:
+        for i, (mid, *_) in enumerate(valid_movies):
+            if mid == movie_id:
                 target_idx = i
                 break
         
         if target_idx == -1:
             return []
 
-        # 3. 构建特征 (简化版逻辑，保持一致性)
-        corpus = []
-        for m in valid_movies:
-            intro = self._clean_text(m[6])
-            intro_words = [w for w in jieba.cut(intro) if w not in self.stopwords and len(w) > 1]
-            genre_words = [w for w in jieba.cut(self._clean_text(m[7]))] * 2
-            director_words = [w for w in jieba.cut(self._clean_text(m[10]))] * 2
-            
-            series_token = self._get_series_token(m[3])
-            series_words = [w for w in jieba.cut(series_token) if len(w) > 1] * 10
-            
-            corpus.append(" ".join(intro_words + genre_words + director_words + series_words))
-
-        # 4. 向量化
-        vectorizer = TfidfVectorizer(max_features=1000, ngram_range=(1, 3))
-        X = vectorizer.fit_transform(corpus)
-        
-        # 5. 计算余弦相似度
+        # 3. 计算余弦相似度
         # 只计算目标向量与所有向量的距离
         target_vec = X[target_idx]
         sim_scores = cosine_similarity(target_vec, X).flatten()
         
-        # 6. 排序取 Top K (排除自己)
+        # 4. 排序取 Top K (排除自己)
         # argsort 返回从小到大的索引，取最后 n_top+1 个，然后逆序
         related_indices = sim_scores.argsort()[-(n_top+1):][:-1][::-1]
         
         recommendations = []
         for idx in related_indices:
             if idx == target_idx: continue
-            m = valid_movies[idx]
+            movie_id, link, pic, title, score, intro, year, directors, _ = valid_movies[idx]
             recommendations.append({
-                "id": m[0],
-                "title": m[3],
-                "pic": m[2],
-                "score": m[4],
-                "year": m[7],
+                "id": movie_id,
+                "title": title,
+                "pic": pic,
+                "score": score,
+                "year": year,
                 "similarity": round(sim_scores[idx] * 100, 1) # 相似度百分比
             })
             
@@ -0,0 +1,92 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from storage.repository import parse_score, parse_year
+
+
+class DictColumn:
+    """字典编码的文本列: 去重后的取值表 + 每行的编码.
+
+    条件只需在取值表上判断一次 (通常远少于行数)，再用编码映射回行.
+    """
+
+    def __init__(self, values: Iterable[Optional[str]]) -> None:
+        index: Dict[str, int] = {}
+        self.codes = np.asarray([index.setdefault(str(v or ""), len(index)) for v in values], dtype=np.int32)
+        self.vocab: List[str] = list(index)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, row: int) -> str:
+        return self.vocab[self.codes[row]]
+
+    def contains(self, term: str) -> np.ndarray:
+        """每行的原文是否包含 term (子串匹配)，返回布尔掩码."""
+        hits = np.array([i for i, value in enumerate(self.vocab) if term in value], dtype=np.int32)
+        return np.isin(self.codes, hits)
+
+
+class MovieSnapshot:
+    """语义检索过滤用的列式快照，行顺序与向量索引一致.
+
+    由向量索引已在内存中的元数据构建 (不再读数据库)，随索引一起重建。数值列为 NumPy 数组
+    (缺失值: 评分为 NaN，年份为 0)，文本列为字典编码，rows 为电影 id -> 行号。过滤条件对整列生成布尔掩码，
+    而不必对每个候选逐条判断.
+    """
+
+    def __init__(self, ids: Sequence[int], years: Sequence[Any], scores: Sequence[Any],
+                 countries: Sequence[Optional[str]], categories: Sequence[Optional[str]],
+                 directors: Sequence[Optional[str]], actors: Sequence[Optional[str]]) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.rows: Dict[int, int] = {movie_id: row for row, movie_id in enumerate(ids)}
+        self.year = np.asarray([parse_year(v) or 0 for v in years], dtype=np.int32)
+        score = [parse_score(v) for v in scores]
+        self.score = np.asarray([np.nan if v is None else v for v in score], dtype=np.float64)
+        self.countries = DictColumn(countries)
+        self.categories = DictColumn(categories)
+        self.directors = DictColumn(directors)
+        self.actors = DictColumn(actors)
+
+    @classmethod
+    def from_meta(cls, movie_ids: Sequence[int], id_to_meta: Dict[int, Dict[str, Any]]) -> "MovieSnapshot":
+        """由 VectorService 的 (movie_ids, id_to_meta) 构建."""
+        metas = [id_to_meta[i] for i in movie_ids]
+        return cls(movie_ids, [m.get("year") for m in metas], [m.get("score") for m in metas],
+                   [m.get("country") for m in metas], [m.get("category") for m in metas],
+                   [m.get("director") for m in metas], [m.get("actor") for m in metas])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, movie_id: int) -> Optional[int]:
+        """电影 id 对应的行号 (不在快照中时为 None)."""
+        return self.rows.get(movie_id)
+
+    def filter(self, year_min: Optional[int] = None, year_max: Optional[int] = None,
+               country: str = "", category: str = "", director: str = "", actor: str = "",
+               min_score: Optional[float] = None) -> np.ndarray:
+        """按条件生成行掩码. 文本条件为对原文的子串模糊匹配，年份取原文中的 4 位数字 (没有时按 0 比较).
+
+        未知的条件名抛出 TypeError，无法转换为数字的年份 / 评分抛出 ValueError.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if year_min is not None:
+            mask &= self.year >= int(year_min)
+        if year_max is not None:
+            mask &= self.year <= int(year_max)
+        if min_score is not None:
+            mask &= np.nan_to_num(self.score) >= float(min_score)
+        if country:
+            mask &= self.countries.contains(str(country))
+        if category:
+            mask &= self.categories.contains(str(category))
+        if director:
+            mask &= self.directors.contains(str(director))
+        if actor:
+            mask &= self.actors.contains(str(actor))
+        return mask
+
+
+__all__ = ["MovieSnapshot", "DictColumn"]
@@ -8,6 +8,15 @@ from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 from utils.logger import logger
 from storage.repository import MovieRepository
+from analysis.snapshot import MovieSnapshot
+
+# Columns needed to build the index (projected, so the full rows are never loaded)
+INDEX_COLUMNS = ("id", "info_link", "pic_link", "cname", "score", "introduction",
+                 "year_release", "country", "category", "directors", "actors")
+
+class InvalidFilterError(ValueError):
+    """Unknown or malformed search filters (the API answers 400)."""
+
 
 class VectorService:
     def __init__(self, repo: MovieRepository, model_name: str = "shibing624/text2vec-base-chinese"):
@@ -17,6 +26,8 @@ class VectorService:
         self.vectors = None # numpy array: [n_movies, 768]
         self.movie_ids = None # list: [n_movies] (matches vector index)
         self.id_to_meta = None # dict: id -> {title: '', score: ''} (for quick return)
+        self.snapshot = None # MovieSnapshot over id_to_meta, rows aligned with movie_ids (filtering, id -> row)
+        self.data_key = None # (table_name, data_version) the index was built from
         self.cache_path = os.path.join("data", "vectors.pkl")
         self.lock = threading.Lock()
         
@@ -36,20 +47,21 @@ class VectorService:
         Thread-safe: ensures only one build happens at a time.
         """
         with self.lock:
-            # If already loaded and not forcing refresh, skip
-            if not force_refresh and self.vectors is not None:
+            # Cache freshness is keyed on the repository's data version (cheap, catches in-place edits)
+            current_key = (self.repo.table_name, self.repo.get_data_version())
+
+            # If already loaded for the current data and not forcing refresh, skip
+            if not force_refresh and self.vectors is not None and self.data_key == current_key:
                 return
 
             if not force_refresh and os.path.exists(self.cache_path):
                 try:
                     self._load_from_cache()
-                    # Check if cache is stale (simple check: count match)
-                    db_count = len(self.repo.get_all_movies())
-                    if len(self.movie_ids) == db_count:
+                    if self.data_key == current_key:
                         logger.info("Vector index loaded from cache.")
                         return
                     else:
-                        logger.info(f"Cache stale (DB: {db_count}, Cache: {len(self.movie_ids)}). Rebuilding...")
+                        logger.info(f"Cache stale (DB: {current_key}, Cache: {self.data_key}). Rebuilding...")
                 except Exception as e:
                     logger.warning(f"Failed to load cache: {e}. Rebuilding...")
             
@@ -57,29 +69,16 @@ class VectorService:
             self._load_model()
             logger.info("Building vector index from database...")
             
-            movies = self.repo.get_all_movies()
-            # Filter movies with valid intros
-            valid_movies = [m for m in movies if m[6] and len(m[6].strip()) > 5]
-            
-            if not valid_movies:
-                logger.warning("No valid movies with introduction found for indexing.")
-                return
-
-            # 构建丰富语义文本: 片名 + 年份 + 国家 + 类型 + 导演 + 主演 + 简介 (Defensive)
+            # Stream only the columns we need; rows without a usable intro are skipped on the fly
             sentences = []
-            for m in valid_movies:
-                # m schema check: ensure enough columns
-                # 0:id, 1:url, 2:pic, 3:title, 4:score, 5:rated, 6:intro, 
-                # 7:year, 8:country, 9:category, 10:dirs, 11:actors
-                
-                title = m[3]
-                intro = m[6]
-                year = m[7] if len(m) > 7 else ''
-                country = m[8] if len(m) > 8 else ''
-                category = m[9] if len(m) > 9 else ''
-                directors = m[10] if len(m) > 10 else ''
-                actors = m[11] if len(m) > 11 else ''
-                
+            movie_ids = []
+            id_to_meta = {}
+            for movie_id, url, pic, title, score, intro, year, country, category, directors, actors in \
+                    self.repo.iter_movies(columns=INDEX_COLUMNS):
+                if not intro or len(intro.strip()) <= 5:
+                    continue
+
+                # 构建丰富语义文本: 片名 + 年份 + 国家 + 类型 + 导演 + 主演 + 简介
                 # 优化策略：使用自然语言构建，增强语义连贯性
                 # 相比 "Key: Value" 列表，自然语言更能被 BERT 类模型理解实体间的关系 (如 "由...执导")
                 meta_part = f"电影《{title}》"
@@ -91,27 +90,32 @@ class VectorService:
                 if directors: staff_part += f"。由{directors}执导"
                 if actors: staff_part += f"，{actors}主演"
                 
-                text = f"{meta_part}{staff_part}。剧情简介：{intro}"
-                sentences.append(text)
-
-            self.movie_ids = [m[0] for m in valid_movies]
-            self.id_to_meta = {
-                m[0]: {
-                    "title": m[3], 
-                    "score": m[4], 
-                    "pic": m[2], 
-                    "intro": m[6], 
-                    "url": m[1],
-                    "year": m[7],      # Added for filtering
-                    "country": m[8],   # Added for filtering
-                    "category": m[9],  # Added for filtering
-                    "director": m[10], # Added for filtering
-                    "actor": m[11]     # Added for filtering
-                } for m in valid_movies
-            }
+                sentences.append(f"{meta_part}{staff_part}。剧情简介：{intro}")
+                movie_ids.append(movie_id)
+                id_to_meta[movie_id] = {
+                    "title": title,
+                    "score": score,
+                    "pic": pic,
+                    "intro": intro,
+                    "url": url,
+                    "year": year,          # Added for filtering
+                    "country": country,    # Added for filtering
+                    "category": category,  # Added for filtering
+                    "director": directors, # Added for filtering
+                    "actor": actors        # Added for filtering
+                }
+
+            if not sentences:
+                logger.warning("No valid movies with introduction found for indexing.")
+                return
+
+            self.movie_ids = movie_ids
+            self.id_to_meta = id_to_meta
+            self.snapshot = MovieSnapshot.from_meta(movie_ids, id_to_meta)
             
             logger.info(f"Encoding {len(sentences)} movies (Rich Content) using CPU/GPU...")
             self.vectors = self.model.encode(sentences, normalize_embeddings=True)
+            self.data_key = current_key
             
             self._save_to_cache()
             logger.info("Vector index built and saved.")
@@ -121,7 +125,8 @@ class VectorService:
             pickle.dump({
                 "vectors": self.vectors,
                 "movie_ids": self.movie_ids,
-                "id_to_meta": self.id_to_meta
+                "id_to_meta": self.id_to_meta,
+                "data_key": self.data_key
             }, f)
 
     def _load_from_cache(self):
@@ -130,6 +135,8 @@ class VectorService:
             self.vectors = data["vectors"]
             self.movie_ids = data["movie_ids"]
             self.id_to_meta = data["id_to_meta"]
+            self.snapshot = MovieSnapshot.from_meta(self.movie_ids, self.id_to_meta)
+            self.data_key = data.get("data_key") # absent in caches written by older versions
 
     def search(self, query: str, top_k: int = 5, filters: Dict = None) -> List[Dict]:
         """
@@ -146,50 +153,24 @@ class VectorService:
         query_vec = self.model.encode([query], normalize_embeddings=True)
         similarity = cosine_similarity(query_vec, self.vectors)[0]
         
-        # Sort all
-        sorted_indices = np.argsort(similarity)[::-1]
-        
+        # Metadata filters are evaluated as vectorized masks over the in-memory snapshot of id_to_meta
+        # (same fuzzy substring semantics as before; no database reads)
+        candidates = np.arange(len(self.movie_ids))
+        filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+        if filters:
+            try:
+                candidates = np.flatnonzero(self.snapshot.filter(**filters))
+            except (TypeError, ValueError) as e:
+                # Unknown keys or non-numeric year/score: report instead of silently returning unfiltered results
+                raise InvalidFilterError(f"Invalid search filters {filters}: {e}") from e
+
+        top_indices = candidates[np.argsort(-similarity[candidates], kind="stable")[:top_k]]
+
         results = []
-        filters = filters or {}
-        
-        for idx in sorted_indices:
-            if len(results) >= top_k:
-                break
-                
+        for idx in top_indices:
             score = similarity[idx]
             movie_id = self.movie_ids[idx]
             meta = self.id_to_meta[movie_id]
-            
-            # --- Filtering Logic ---
-            try:
-                # Year Filter
-                if "year_min" in filters or "year_max" in filters:
-                    y_str = re.search(r'\d{4}', str(meta.get("year", "")))
-                    y = int(y_str.group()) if y_str else 0
-                    if "year_min" in filters and y < filters["year_min"]: continue
-                    if "year_max" in filters and y > filters["year_max"]: continue
-                
-                # Country Filter (Fuzzy)
-                if "country" in filters and filters["country"]:
-                    if filters["country"] not in str(meta.get("country", "")): continue
-
-                # Category Filter (Fuzzy)
-                if "category" in filters and filters["category"]:
-                    if filters["category"] not in str(meta.get("category", "")): continue
-
-                # Director Filter (Fuzzy)
-                if "director" in filters and filters["director"]:
-                    if filters["director"] not in str(meta.get("director", "")): continue
-
-                # Actor Filter (Fuzzy)
-                if "actor" in filters and filters["actor"]:
-                    if filters["actor"] not in str(meta.get("actor", "")): continue
-                    
-            except Exception as e:
-                # On error (e.g. data missing), skip filtering or skip item? 
-                # Safe to skip item or just log and proceed. I'll proceed (lenient).
-                pass
-            # -----------------------
 
             results.append({
                 "id": movie_id,
@@ -211,11 +192,10 @@ class VectorService:
         if self.vectors is None:
             self.build_index()
 
-        if movie_id not in self.movie_ids:
+        # Find the vector for the target movie (id -> row index, no list scan)
+        idx = self.snapshot.row(movie_id) if self.snapshot is not None else None
+        if idx is None:
             return []
-
-        # Find the vector for the target movie
-        idx = self.movie_ids.index(movie_id)
         target_vec = self.vectors[idx].reshape(1, -1)
 
         # Calculate Cosine Similarity
@@ -1,6 +1,6 @@
 import os
-import sqlite3
 import threading
+import time
 from functools import wraps
 from io import BytesIO
 
@@ -18,7 +18,7 @@ app.secret_key = "douban_secret_key123" # Flask的session密钥
 
 # 初始化数据仓库
 # 初始化业务服务
-from analysis.vector_service import VectorService
+from analysis.vector_service import InvalidFilterError, VectorService
 from analysis.llm_service import LLMService
 
 repo = MovieRepository(DB_PATH)
@@ -85,10 +85,27 @@ def home():
 # 显示电影列表
 @app.route("/movie")
 def movie():
-    page = int(request.args.get("page", 1)) # 获取当前页码
+    page = max(int(request.args.get("page", 1)), 1) # 获取当前页码
+    sort = request.args.get("sort", "id") # 排序方式: id / score / year
+    cursor = request.args.get("cursor") # 上一页/下一页携带的游标
+    backward = request.args.get("dir") == "prev"
     limit = 50 # 每页显示数量
-    movies, total_pages = repo.get_paginated_movies(page, limit)
-    return render_template("movie.html", movies=movies, page=page, total_pages=total_pages)
+    if sort not in ("id", "score", "year"):
+        sort = "id"
+
+    total_pages = max((repo.count_movies() + limit - 1) // limit, 1) # 总数来自计数器，不做全表 count
+    next_cursor = prev_cursor = None
+    try:
+        # 顺序翻页走 keyset 分页，避免深分页的 OFFSET 扫描
+        if cursor or page == 1:
+            movies, next_cursor, prev_cursor = repo.get_movies_page(cursor, limit, sort=sort, backward=backward)
+        else:
+            movies, total_pages = repo.get_paginated_movies(page, limit, sort=sort)
+    except ValueError:
+        # 游标无效时回退到按页码读取
+        movies, total_pages = repo.get_paginated_movies(page, limit, sort=sort)
+    return render_template("movie.html", movies=movies, page=page, total_pages=total_pages, sort=sort,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor)
 
 
 # 显示电影详情
@@ -110,6 +127,36 @@ def movie_detail(movie_id):
     return render_template("detail.html", movie=movie, rec_tfidf=rec_tfidf, rec_embedding=rec_embedding)
 
 
+# 评分/评价人数变化轨迹 API (?since=&until= 为 Unix 时间戳)
+@app.route("/api/movie/<int:movie_id>/trend")
+def api_movie_trend(movie_id):
+    movie = repo.get_movie_by_id(movie_id)
+    if not movie:
+        return jsonify({"error": "未找到电影"}), 404
+    try:
+        trend = repo.get_trend(movie[1], since=request.args.get("since", type=float),
+                               until=request.args.get("until", type=float))
+        return jsonify({"id": movie_id, "trend": trend})
+    except Exception as e:
+        logger.error(f"Trend query failed: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# 变化最大的电影 API (?days=7&field=score|votes&limit=10)
+@app.route("/api/movers")
+def api_movers():
+    try:
+        days = request.args.get("days", 7, type=float)
+        field = request.args.get("field", "score")
+        limit = min(request.args.get("limit", 10, type=int), 100)
+        return jsonify(repo.get_biggest_movers(time.time() - days * 86400, field=field, limit=limit))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Movers query failed: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 # 词云
 @app.route("/word")
 def word():
@@ -204,8 +251,14 @@ def help():
 @app.route("/search")
 def search():
     keyword = request.args.get("q", "")
-    datalist = repo.search_movies(keyword)
-    return render_template("search.html", movies=datalist, keyword=keyword)
+    page = max(int(request.args.get("page", 1)), 1) # 获取当前页码
+    limit = 60 # 每页显示数量
+    # 全文检索: 按相关度排序，分页返回，附带简介高亮摘要
+    datalist = repo.search_movies(keyword, limit=limit, offset=(page - 1) * limit, with_snippet=True)
+    total = repo.count_search_results(keyword)
+    total_pages = max((total + limit - 1) // limit, 1)
+    return render_template("search.html", movies=datalist, keyword=keyword, total=total,
+                           page=page, total_pages=total_pages)
 
 
 # 数据分析
@@ -246,19 +299,15 @@ def cluster_page():
 def export_data():
     import openpyxl
 
-    movies = repo.get_all_movies()
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "豆瓣电影数据"
-    
-
+    # write_only 模式逐行写出，配合流式读取，内存占用不随数据量增长
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("豆瓣电影数据")
     
     # 表头
     headers = ["ID", "链接", "封面", "片名", "评分", "评价人数", "简介", "年份", "国家/地区", "类型", "导演", "主演"]
     ws.append(headers)
     
-    for movie in movies:
+    for movie in repo.iter_movies():
         ws.append(movie)
         
     out = BytesIO()
@@ -394,10 +443,7 @@ def admin():
     status = load_status()
     # 获取当前数据库的所有表名
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        tables = [r[0] for r in cur.execute("SELECT name FROM sqlite_master WHERE type='table' and name != 'sqlite_sequence'").fetchall()]
-        conn.close()
+        tables = repo.get_all_tables() # 不含副表
     except Exception as e:
         print(f"Error fetching tables: {e}")
         tables = []
@@ -463,6 +509,9 @@ def api_rag_search():
             "answer": answer,
             "movies": movies
         })
+    except InvalidFilterError as e:
+        logger.warning(f"RAG Search rejected: {e}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"RAG Search failed: {e}")
         return jsonify({"error": str(e)}), 500
@@ -503,6 +552,17 @@ def api_rag_rebuild():
         logger.error(f"Rebuild failed: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/stats/rebuild", methods=["POST"])
+@login_required
+def api_stats_rebuild():
+    """全量重建当前数据表的物化统计"""
+    try:
+        repo.rebuild_stats()
+        return jsonify({"status": "success", "stats": repo.get_stats()})
+    except Exception as e:
+        logger.error(f"Stats rebuild failed: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/admin/tables", methods=["GET"])
 @login_required
 def api_admin_tables():
@@ -583,6 +643,7 @@ def api_crawl():
     # 新增参数
     target_table_arg = data.get("target_table", "").strip()
     append_mode = data.get("append", False)
+    resume = bool(data.get("resume", False)) # 断点续爬
     
     # 兼容旧逻辑 no_clear
     no_clear = data.get("no_clear", False)
@@ -625,19 +686,22 @@ def api_crawl():
 
     def task():
         try:
-            logger.info(f"Starting Background Crawl: {crawl_type}, Pages: {pages}, Limit: {limit}, Table: {final_table}, Append: {append_mode}")
+            logger.info(f"Starting Background Crawl: {crawl_type}, Pages: {pages}, Limit: {limit}, Table: {final_table}, Append: {append_mode}, Resume: {resume}")
             main.run_crawl(
                 base_url=base_url,
                 tag=tag,
                 pages=pages,
                 limit=limit, # 传递 limit
-                delay=3.0, # 增加延迟防封 (3秒)
+                delay=3.0, # 初始间隔 3 秒，之后由自适应节奏按服务器反馈调整
+                adaptive=True,
+                min_delay=1.0, # 后台任务保守一些: 间隔最低 1 秒
                 db_path="data/movie.db",
                 clear=not append_mode,
                 target_table=final_table,
                 sort=sort,
                 verbose=False,
-                progress_callback=on_progress
+                progress_callback=on_progress,
+                resume=resume
             )
             logger.info("Background Crawl Finished Successfully.")
             
@@ -1,12 +1,29 @@
+import os
+import secrets
 import sys
+import time
 import subprocess
 import argparse
+import threading
+from typing import Dict, List, Optional
 from utils.logger import logger
 import concurrent.futures
 
-def run_single_tag(tag, limit_per_tag, sort, delay, table, start):
+from spider.dedup import SeenSubjects
+from spider.douban_spider import DoubanSpider
+from spider.pacing import AdaptivePacer, RequestPacing
+from spider.parsers import get_parser
+from spider.pipeline import start_parse_pool
+from spider.ratelimit import HostRateLimiter
+from spider.transport import OriginRewriteTransport, PooledTransport, Transport
+from storage.frontier import FRONTIER_DB, CrawlFrontier, CrawlJob
+from storage.ingest import INGEST_KEY_ENV, IngestServer
+from storage.repository import MovieRepository
+from storage.writer import BufferedWriter
+
+def run_single_tag(tag, limit_per_tag, sort, delay, table, start, db_path=None, ingest="", authkey=""):
     """
-    单独抓取一个标签的任务函数
+    单独抓取一个标签的任务函数 (ingest 为入库服务地址时，写入交给入库服务，authkey 为其连接密钥)
     """
     logger.info(f"🚀 开始抓取: {tag} ...")
     cmd = [
@@ -20,17 +37,24 @@ def run_single_tag(tag, limit_per_tag, sort, delay, table, start):
         "--table", table,
         "--start", str(start)
     ]
+    if db_path:
+        cmd += ["--db", db_path]
+    if ingest:
+        cmd += ["--ingest", ingest]
     try:
-        subprocess.run(cmd, check=True)
+        env = dict(os.environ, **{INGEST_KEY_ENV: authkey}) if authkey else None
+        subprocess.run(cmd, check=True, env=env)
         logger.info(f"✅ 标签 {tag} 抓取完成。")
         return True
     except subprocess.CalledProcessError as e:
         logger.error(f"❌ 抓取标签 {tag} 时出错: {e}")
         return False
 
-def run_batch_crawl(tags, limit_per_tag, sorts, delay, table, start, workers):
+def run_batch_subprocess(tags, limit_per_tag, sorts, delay, table, start, workers, db_path=None, single_writer=True):
     """
-    并发调用 main.py 来爬取多个标签，支持多种排序方式混合抓取。
+    (旧模式, --subprocess) 并发调用 main.py 来爬取多个标签，支持多种排序方式混合抓取。
+    每个子进程各自限速，workers 越多总请求速率越高，且不同标签间重复的电影会被重复抓取。
+    single_writer=True 时在本进程启动入库服务，子进程的写入经它合并提交，不再各自争用数据库写锁。
     """
     # 生成所有任务组合 (Tag x Sort)
     tasks = []
@@ -40,7 +64,22 @@ def run_batch_crawl(tags, limit_per_tag, sorts, delay, table, start, workers):
             
     total_tasks = len(tasks)
     logger.info(f"正在使用 {workers} 个并发进程进行抓取，共 {total_tasks} 个子任务 (标签 x 排序)...")
-    
+
+    server = None
+    ingest = ""
+    authkey = ""
+    if single_writer: # 每次运行生成一次性密钥，经环境变量传给子进程
+        authkey = secrets.token_hex(16)
+        server = IngestServer(db_path or os.path.join("data", "movie.db"), ("127.0.0.1", 0),
+                              authkey=authkey.encode()).start()
+        ingest = "%s:%d" % server.address
+    try:
+        _run_subprocesses(tasks, limit_per_tag, delay, table, start, workers, db_path, ingest, authkey)
+    finally:
+        if server:
+            server.close()
+
+def _run_subprocesses(tasks, limit_per_tag, delay, table, start, workers, db_path, ingest, authkey=""):
     with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
         # 提交所有任务
         # task[0] is tag, task[1] is sort
@@ -52,7 +91,10 @@ def run_batch_crawl(tags, limit_per_tag, sorts, delay, table, start, workers):
                 task[1], 
                 delay, 
                 table, 
-                start
+                start,
+                db_path,
+                ingest,
+                authkey
             ): f"{task[0]}-{task[1]}" for task in tasks
         }
         
@@ -63,6 +105,109 @@ def run_batch_crawl(tags, limit_per_tag, sorts, delay, table, start, workers):
             except Exception as e:
                 logger.error(f"任务 {task_name} 抛出异常: {e}")
 
+def run_batch_crawl(tags: List[str], limit_per_tag: int, sorts: List[str], delay: float, table: str, start: int,
+                    workers: int, db_path: str = os.path.join("data", "movie.db"), engine: str = "async",
+                    concurrency: int = 4, rate: float = 2.0, adaptive: bool = False, min_delay: float = 0.2,
+                    parse_workers: int = 2, origin: str = "", transport: Optional[Transport] = None,
+                    flush_records: int = 500, flush_seconds: float = 30.0, resume: bool = False,
+                    frontier_db: str = FRONTIER_DB) -> Dict[str, float]:
+    """
+    进程内调度: 所有 (标签 x 排序) 子任务在 workers 个线程中运行，共享
+    - 一个 transport (keep-alive 连接池) 与一份全局速率预算 (一个令牌桶，或 --adaptive 时一个 AIMD 节奏控制器)，
+      因此 workers 只提高并行度，不会把总请求速率放大 workers 倍；
+    - 一个已认领电影集合: 同一部电影只由第一个遇到它的子任务抓取详情；
+    - pipeline 引擎时一个解析进程池 (parse_workers 个进程)，而不是每个子任务各建一个；
+    - 一个缓冲写入器: 所有子任务的记录合并成大事务写入同一张表。
+    返回汇总统计 (请求数、写入记录数、跨标签去重数、吞吐量).
+    """
+    if adaptive and engine == "async":
+        # async 引擎的自适应并发槽绑定在单个事件循环上，多个任务共享节奏控制器时改用线程化的 pipeline 引擎
+        logger.info("Adaptive pacing is shared across jobs: using the pipeline engine.")
+        engine = "pipeline"
+    tasks = [(tag, sort_type) for tag in tags for sort_type in sorts]
+    logger.info(f"正在使用 {workers} 个并发任务 (进程内共享限速与去重) 进行抓取，共 {len(tasks)} 个子任务 (标签 x 排序)...")
+
+    parent = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(parent, exist_ok=True)
+    repo = MovieRepository(db_path, table)
+    repo.create_table_if_not_exists()
+
+    if transport is None:
+        transport = OriginRewriteTransport(PooledTransport(), origin) if origin else PooledTransport()
+    limiter = HostRateLimiter(rate, burst=2.0)
+    pacing = None
+    if adaptive:
+        pacing = RequestPacing(AdaptivePacer(interval=delay or 1.0, min_interval=min_delay,
+                                             max_concurrency=max(1, workers * concurrency)))
+    seen = SeenSubjects()
+
+    frontier = CrawlFrontier(frontier_db)
+    jobs: List[CrawlJob] = []
+    jobs_lock = threading.Lock()
+
+    def _flush_saved():
+        with jobs_lock:
+            opened = list(jobs)
+        for job in opened:
+            job.flush_saved()
+
+    writer = BufferedWriter(repo, max_records=flush_records, max_seconds=flush_seconds, on_flush=_flush_saved)
+
+    def _run(tag: str, sort_type: str) -> CrawlJob:
+        job = frontier.open_job({
+            "db": os.path.abspath(db_path), "table": table, "base_url": "JSON_API", "tag": tag,
+            "sort": sort_type, "pages": 10, "limit": limit_per_tag, "start": start,
+        }, resume=resume)
+        job.defer_saved = True
+        with jobs_lock:
+            jobs.append(job)
+        logger.info(f"🚀 开始抓取: {tag} ({sort_type}) ...")
+        spider = DoubanSpider(base_url="JSON_API", tag=tag, sort=sort_type, limit=limit_per_tag, delay=delay,
+                              start=start, engine=engine, concurrency=concurrency, transport=transport,
+                              frontier=job, parse_workers=parse_workers, limiter=limiter, pacing=pacing, seen=seen,
+                              parse_pool=parse_pool)
+        spider.fetch(lambda current, total: writer.checkpoint(), save_callback=writer.add)
+        logger.info(f"✅ 标签 {tag} ({sort_type}) 抓取完成。")
+        return job
+
+    # 在启动任何线程之前创建共享的解析进程池 (fork 时进程内只有当前线程)
+    parse_pool = start_parse_pool(parse_workers, get_parser("auto").name) if engine == "pipeline" else None
+    started = time.perf_counter()
+    done: List[CrawlJob] = []
+    failed = 0
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(_run, tag, sort_type): f"{tag}-{sort_type}" for tag, sort_type in tasks}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    done.append(future.result())
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"任务 {futures[future]} 抛出异常: {e}")
+    finally:
+        try:
+            writer.close() # 已完整抓取的页面先入库；未完成的子任务可用 --resume 接着抓
+        finally:
+            if parse_pool is not None:
+                parse_pool.shutdown()
+    for job in done: # 记录入库后才把子任务标记为完成
+        job.finish()
+
+    elapsed = time.perf_counter() - started
+    requests = transport.stats.requests
+    records = int(writer.stats["records"])
+    summary = {
+        "jobs": len(tasks), "failed": failed, "requests": requests, "records": records,
+        "new": int(writer.stats["new"]), "duplicates": seen.duplicates, "seconds": elapsed,
+        "requests_per_sec": requests / elapsed if elapsed else 0.0,
+        "records_per_sec": records / elapsed if elapsed else 0.0,
+    }
+    logger.info(f"Batch crawl: {len(tasks)} jobs ({failed} failed) in {elapsed:.1f}s, "
+                f"{requests} requests ({summary['requests_per_sec']:.1f}/s), "
+                f"{records} records written ({summary['records_per_sec']:.1f}/s, {summary['new']} new), "
+                f"{seen.duplicates} cross-tag duplicates skipped")
+    return summary
+
 def main():
     parser = argparse.ArgumentParser(description="批量抓取多个类型的电影")
     parser.add_argument("--tags", type=str, default="剧情,喜剧,动作,科幻,悬疑,恐怖,爱情,动画,纪录片", 
@@ -75,6 +220,17 @@ def main():
     parser.add_argument("--table", type=str, default="movies", help="保存到的数据库表名")
     parser.add_argument("--start", type=int, default=0, help="起始偏移量")
     parser.add_argument("--workers", type=int, default=1, help="并发数量")
+    parser.add_argument("--db", type=str, default=os.path.join("data", "movie.db"), help="数据库保存路径")
+    parser.add_argument("--engine", type=str, default="async", choices=["async", "pipeline"], help="子任务的抓取引擎 (默认: async)")
+    parser.add_argument("--concurrency", type=int, default=4, help="每个子任务的详情页并发数 / 抓取线程数 (默认: 4)")
+    parser.add_argument("--rate", type=float, default=2.0, help="全局速率预算: 所有子任务合计每个域名每秒的最大请求数 (默认: 2.0)")
+    parser.add_argument("--adaptive", action="store_true", help="所有子任务共享一个自适应节奏控制器 (以 --delay 为初始间隔)")
+    parser.add_argument("--min-delay", type=float, default=0.2, help="自适应模式下的最小请求间隔 (秒, 默认: 0.2)")
+    parser.add_argument("--parse-workers", type=int, default=2, help="pipeline 引擎的解析进程数 (默认: 2)")
+    parser.add_argument("--origin", type=str, default="", help="把请求改发到该地址 (例如本地回放服务器)")
+    parser.add_argument("--resume", action="store_true", help="断点续爬: 各子任务接着上一次未完成的进度继续")
+    parser.add_argument("--subprocess", action="store_true", help="旧模式: 每个子任务启动一个 main.py 子进程 (各自限速、不去重)")
+    parser.add_argument("--no-ingest", action="store_true", help="旧模式下不启动入库服务，各子进程直接写数据库")
     
     args = parser.parse_args()
     
@@ -89,7 +245,14 @@ def main():
         return
 
     logger.info(f"开启批量抓取任务：共 {len(tag_list)} 个标签 x {len(sort_list)} 种排序，单任务目标 {args.limit} 部，存入 {args.table}。")
-    run_batch_crawl(tag_list, args.limit, sort_list, args.delay, args.table, args.start, args.workers)
+    if args.subprocess:
+        run_batch_subprocess(tag_list, args.limit, sort_list, args.delay, args.table, args.start, args.workers,
+                             db_path=args.db, single_writer=not args.no_ingest)
+    else:
+        run_batch_crawl(tag_list, args.limit, sort_list, args.delay, args.table, args.start, args.workers,
+                        db_path=args.db, engine=args.engine, concurrency=args.concurrency, rate=args.rate,
+                        adaptive=args.adaptive, min_delay=args.min_delay, parse_workers=args.parse_workers,
+                        origin=args.origin, resume=args.resume)
     logger.info("所有批量抓取任务已结束。")
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+"""爬虫端到端吞吐量基准.
+
+启动本地回放服务器 (benchmarks/replay_server.py)，用 main.run_crawl 以不同抓取引擎完整爬取一遍，
+每次写入临时数据库，报告请求数、pages/sec、抓取延迟 p50/p99 (客户端测得) 与端到端 records/sec.
+
+用法:
+    python -m benchmarks.crawl [--synthetic] [--type top250 | --type tag --tag 剧情 --limit 100]
+        [--engines sync,async,pipeline] [--concurrency 8] [--rate 50] [--latency 50] [--error-rate 0.01]
+
+注意: sync 引擎每个详情页前固定等待 0.5 秒 (--adaptive 时除外)，页数多时耗时很长，可先用 --pages 2 试跑.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.replay_server import ReplayServer, SyntheticCorpus, add_behavior_args, behavior_from_args, load_corpus
+from main import run_crawl
+from spider.douban_spider import ENGINES
+from spider.transport import OriginRewriteTransport, PooledTransport
+from storage.repository import MovieRepository
+from utils.logger import logger
+
+
+def run_once(server: ReplayServer, engine: str, args: argparse.Namespace) -> Dict[str, float]:
+    transport = OriginRewriteTransport(PooledTransport(), server.url)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "movie.db")
+        started = time.perf_counter()
+        run_crawl(
+            base_url="JSON_API" if args.type == "tag" else "https://movie.douban.com/top250",
+            tag=args.tag if args.type == "tag" else "",
+            pages=args.pages, limit=args.limit, delay=args.delay, db_path=db_path, verbose=False,
+            engine=engine, concurrency=args.concurrency, rate=args.rate, adaptive=args.adaptive,
+            min_delay=args.min_delay, parse_workers=args.parse_workers, transport=transport,
+            frontier_db=os.path.join(tmp, "frontier.db"),
+        )
+        elapsed = time.perf_counter() - started
+        records = MovieRepository(db_path, "movies").count_movies()
+    transport.close()
+    stats = transport.stats
+    return {
+        "requests": stats.requests,
+        "seconds": elapsed,
+        "pages_per_sec": stats.requests / elapsed if elapsed else 0.0,
+        "p50_ms": stats.percentile(0.5) * 1000,
+        "p99_ms": stats.percentile(0.99) * 1000,
+        "records": records,
+        "records_per_sec": records / elapsed if elapsed else 0.0,
+    }
+
+
+def report(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'engine':<9} {'requests':>8} {'seconds':>8} {'pages/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'records':>8} {'records/s':>10}")
+    for engine, r in results.items():
+        print(f"{engine:<9} {r['requests']:>8} {r['seconds']:>8.2f} {r['pages_per_sec']:>8.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['records']:>8} {r['records_per_sec']:>10.1f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="爬虫端到端吞吐量基准 (本地回放服务器)")
+    add_behavior_args(parser)
+    parser.add_argument("--type", choices=["top250", "tag"], default="top250", help="爬取模式 (默认: top250)")
+    parser.add_argument("--tag", default="剧情", help="tag 模式下的标签 (合成语料对任意标签都有数据)")
+    parser.add_argument("--pages", type=int, default=4, help="Top250 页数 (默认: 4)")
+    parser.add_argument("--limit", type=int, default=100, help="tag 模式下的数量 (默认: 100)")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="参与比较的抓取引擎，逗号分隔")
+    parser.add_argument("--delay", type=float, default=0.0, help="sync 引擎的请求间隔 (秒, 默认: 0)")
+    parser.add_argument("--concurrency", type=int, default=8, help="async 并发数 / pipeline 抓取线程数 (默认: 8)")
+    parser.add_argument("--rate", type=float, default=50.0, help="令牌桶速率 (请求/秒, 默认: 50)")
+    parser.add_argument("--parse-workers", type=int, default=2, help="pipeline 解析进程数 (默认: 2)")
+    parser.add_argument("--adaptive", action="store_true", help="启用自适应节奏 (AIMD + 熔断)")
+    parser.add_argument("--min-delay", type=float, default=0.0, help="自适应模式下的最小请求间隔 (秒, 默认: 0)")
+    args = parser.parse_args()
+
+    engines: List[str] = [e.strip() for e in args.engines.split(",") if e.strip()]
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        print(f"未知的抓取引擎: {', '.join(unknown)} (可选: {', '.join(ENGINES)})")
+        return 1
+
+    corpus = load_corpus(args.corpus, args.synthetic, args.subjects)
+    results: Dict[str, Dict[str, float]] = {}
+    with ReplayServer(corpus, behavior_from_args(args)) as server:
+        print(f"Replay server {server.url}: {len(corpus)} pages{' (synthetic)' if isinstance(corpus, SyntheticCorpus) else ''}, "
+              f"latency {args.latency}±{args.jitter} ms, error rate {args.error_rate}, throttle {args.throttle_rps or '-'} rps")
+        for engine in engines:
+            logger.info(f"Benchmarking engine={engine} ...")
+            results[engine] = run_once(server, engine, args)
+        print(f"Responses served: {dict(server.stats)}")
+    report(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""HTML 解析器基准测试.
+
+在录制好的页面语料上比较各解析器 (spider/parsers.py) 的单页解析耗时与内存峰值，
+并以原有实现 (soup) 的输出为基准校验其他解析器的结果是否完全一致.
+内存峰值由 tracemalloc 统计，只包含 Python 层的分配 (lxml 在 C 层的内存不计入).
+
+语料来源 (任选其一):
+    1. 磁盘响应缓存: 先用 `python main.py --cache ...` 爬取一次，页面会保存在 data/http_cache
+    2. 一个包含 .html 文件的目录 (按内容自动识别列表页/详情页)
+
+用法:
+    python -m benchmarks.parsers [--corpus data/http_cache] [--repeat 5] [--parsers lxml,soup-fast,soup]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from spider.cache import DEFAULT_CACHE_DIR, ResponseCache
+from spider.parsers import PARSERS, get_parser
+
+BASELINE = "soup"
+
+
+def classify(html: str, url: str = "") -> str:
+    """判断页面类型: list (Top250 列表页) / detail (电影详情页) / "" (其他, 如 JSON)."""
+    if "/top250" in url or 'class="grid_view"' in html:
+        return "list"
+    if "/subject/" in url or 'id="info"' in html:
+        return "detail"
+    return ""
+
+
+def load_corpus(path: str) -> List[Tuple[str, str, str]]:
+    """返回 [(页面类型, 名称, html)]."""
+    pages = []
+    if os.path.isdir(path) and any(name.endswith(".html") for name in os.listdir(path)):
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".html"):
+                with open(os.path.join(path, name), encoding="utf-8") as f:
+                    html = f.read()
+                pages.append((classify(html), name, html))
+    else:
+        for entry in ResponseCache(path).iter_entries():
+            html = entry.to_response().text()
+            pages.append((classify(html, entry.url), entry.url, html))
+    return [p for p in pages if p[0]]
+
+
+def _parse(parser, kind: str, html: str):
+    return parser.parse_list(html) if kind == "list" else parser.parse_details(html)
+
+
+def bench(names: List[str], pages: List[Tuple[str, str, str]], repeat: int) -> Dict[Tuple[str, str], Dict]:
+    parsers = {name: get_parser(name) for name in names}
+    baseline = {name: _parse(get_parser(BASELINE), kind, html) for kind, name, html in pages}
+    results = {}
+    for pname, parser in parsers.items():
+        for kind in ("list", "detail"):
+            subset = [(name, html) for k, name, html in pages if k == kind]
+            if not subset:
+                continue
+            times, peaks, mismatches = [], [], []
+            for name, html in subset:
+                out = _parse(parser, kind, html)
+                if out != baseline[name]:
+                    mismatches.append(name)
+                # 耗时: 重复 repeat 次取最小值，减少调度抖动的影响
+                best = float("inf")
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    _parse(parser, kind, html)
+                    best = min(best, time.perf_counter() - started)
+                times.append(best)
+                # 内存: 单独一轮在 tracemalloc 下解析，记录峰值
+                tracemalloc.start()
+                _parse(parser, kind, html)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            results[(pname, kind)] = {
+                "pages": len(subset),
+                "mean_ms": statistics.mean(times) * 1000,
+                "p95_ms": sorted(times)[max(0, int(len(times) * 0.95) - 1)] * 1000,
+                "peak_kb": statistics.mean(peaks) / 1024,
+                "mismatches": mismatches,
+            }
+    return results
+
+
+def report(results: Dict[Tuple[str, str], Dict]) -> None:
+    print(f"{'parser':<10} {'page':<7} {'pages':>5} {'mean ms':>9} {'p95 ms':>9} {'peak KB':>9} {'speedup':>8}  same output")
+    for (pname, kind), r in results.items():
+        base = results.get((BASELINE, kind))
+        speedup = base["mean_ms"] / r["mean_ms"] if base and r["mean_ms"] else 0.0
+        same = "yes" if not r["mismatches"] else f"NO ({len(r['mismatches'])}: {r['mismatches'][0]} ...)"
+        print(f"{pname:<10} {kind:<7} {r['pages']:>5} {r['mean_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['peak_kb']:>9.0f} {speedup:>7.1f}x  {same}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="HTML 解析器基准测试")
+    parser.add_argument("--corpus", default=DEFAULT_CACHE_DIR, help="语料: 响应缓存目录或 .html 文件目录 (默认: data/http_cache)")
+    parser.add_argument("--repeat", type=int, default=5, help="每个页面重复解析次数 (默认: 5)")
+    parser.add_argument("--parsers", default=",".join(p for p in PARSERS if p != "auto"), help="参与比较的解析器，逗号分隔")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        print(f"语料为空: {args.corpus}。请先运行 `python main.py --cache ...` 录制页面，或用 --corpus 指定 .html 目录。")
+        return 1
+    names = [n.strip() for n in args.parsers.split(",") if n.strip()]
+    print(f"Corpus: {args.corpus} ({sum(k == 'list' for k, _, _ in pages)} list pages, "
+          f"{sum(k == 'detail' for k, _, _ in pages)} detail pages)")
+    results = bench(names, pages, args.repeat)
+    report(results)
+    return 0 if all(not r["mismatches"] for r in results.values()) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
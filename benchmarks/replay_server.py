@@ -0,0 +1,299 @@
+"""本地回放服务器: 代替 movie.douban.com 回放录制好的响应，用于离线的爬虫吞吐量基准与回归测试.
+
+回放的页面:
+    /top250?start=N                 Top250 列表页
+    /j/new_search_subjects?...      标签搜索 API (JSON)
+    /subject/<id>/                  电影详情页
+
+语料来源 (任选其一):
+    1. 磁盘响应缓存: 先用 `python main.py --cache ...` 爬取一次，页面会保存在 data/http_cache
+    2. --synthetic: 生成结构与豆瓣一致的合成页面 (Top250 + 任意标签的 API 分页 + 详情页)
+
+可配置的服务器行为: 固定延迟 + 随机抖动、随机 5xx 错误率、超过限速阈值时返回 429 (模拟反爬限流).
+响应支持 gzip、keep-alive 与 ETag 条件请求 (304).
+
+用法:
+    python -m benchmarks.replay_server [--corpus data/http_cache | --synthetic] [--port 8800]
+        [--latency 50] [--jitter 20] [--error-rate 0.01] [--throttle-rps 20]
+    python main.py --origin http://127.0.0.1:8800 ...   # 爬虫请求改发到回放服务器
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from spider.cache import DEFAULT_CACHE_DIR, ResponseCache
+
+UPSTREAM = "https://movie.douban.com"
+HTML = "text/html; charset=utf-8"
+JSON = "application/json; charset=utf-8"
+
+
+def normalize(url: str) -> str:
+    """路径 + 排序后的查询参数，作为语料的查找键 (与参数顺序、域名无关)."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return parts.path + ("?" + query if query else "")
+
+
+class Corpus:
+    """录制的响应: 查找键 -> (Content-Type, 响应体)."""
+
+    def __init__(self, pages: Optional[Dict[str, Tuple[str, bytes]]] = None) -> None:
+        self.pages = pages or {}
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def add(self, url: str, content_type: str, body: bytes) -> None:
+        self.pages[normalize(url)] = (content_type, body)
+
+    def lookup(self, path: str) -> Optional[Tuple[str, bytes]]:
+        return self.pages.get(normalize(path))
+
+    @classmethod
+    def from_cache(cls, root: str = DEFAULT_CACHE_DIR) -> "Corpus":
+        corpus = cls()
+        for entry in ResponseCache(root).iter_entries():
+            if entry.url.startswith(UPSTREAM):
+                corpus.add(entry.url, entry.headers.get("content-type", HTML), entry.body)
+        return corpus
+
+
+class SyntheticCorpus(Corpus):
+    """合成语料: subjects 部电影的 Top250 列表页与详情页；标签 API 对任意标签/排序都按 start 分页返回这些电影."""
+
+    PAGE_SIZE = 20 # 标签 API 每页条数
+
+    def __init__(self, subjects: int = 250, seed: int = 1) -> None:
+        super().__init__()
+        self.subjects = subjects
+        rng = random.Random(seed)
+        for start in range(0, subjects, 25):
+            items = "".join(self._list_item(i) for i in range(start, min(start + 25, subjects)))
+            self.add(f"/top250?start={start}", HTML, self._page(f'<div class="article"><ol class="grid_view">{items}</ol></div>'))
+        for i in range(subjects):
+            self.add(f"/subject/{1000 + i}/", HTML, self._page(self._detail(i, rng)))
+
+    def lookup(self, path: str) -> Optional[Tuple[str, bytes]]:
+        parts = urlsplit(path)
+        if parts.path.rstrip("/") == "/j/new_search_subjects":
+            start = int(dict(parse_qsl(parts.query)).get("start", 0) or 0)
+            data = [{"id": str(1000 + i), "url": f"{UPSTREAM}/subject/{1000 + i}/", "title": f"电影{i}",
+                     "rate": f"{8 + i % 20 / 10:.1f}", "cover": f"https://img2.doubanio.com/view/photo/p{i}.jpg",
+                     "directors": [f"导演{i}"], "casts": [f"演员{i}"]}
+                    for i in range(start, min(start + self.PAGE_SIZE, self.subjects))]
+            return JSON, json.dumps({"data": data}, ensure_ascii=False).encode("utf-8")
+        return super().lookup(path)
+
+    @staticmethod
+    def _page(content: str) -> bytes:
+        head = ('<!DOCTYPE html><html lang="zh-CN"><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8">'
+                '<title>豆瓣电影</title>' + "".join(f'<link rel="stylesheet" href="https://img3.doubanio.com/f/{i}.css">' for i in range(10))
+                + '</head><body><div id="db-global-nav">' + '<a href="#">导航</a>' * 50 + '</div><div id="wrapper"><div id="content">')
+        tail = '</div></div><div id="footer">' + '<span>footer</span>' * 100 + '</div><script>' + 'var x=1;' * 200 + '</script></body></html>'
+        return (head + content + tail).encode("utf-8")
+
+    @staticmethod
+    def _list_item(i: int) -> str:
+        link = f"{UPSTREAM}/subject/{1000 + i}/"
+        quote = f'<p class="quote"><span class="inq">第{i}句短评。</span></p>' if i % 4 else ""
+        return (f'<li><div class="item"><div class="pic"><em class="">{i + 1}</em><a href="{link}"><img width="100" alt="电影{i}" '
+                f'src="https://img2.doubanio.com/view/photo/p{i}.jpg" class=""></a></div><div class="info"><div class="hd">'
+                f'<a href="{link}" class=""><span class="title">电影{i}</span><span class="title">&nbsp;/&nbsp;Movie {i}</span></a></div>'
+                f'<div class="bd"><p class="">\n    导演: 导演{i}&nbsp;&nbsp;&nbsp;主演: 演员{i} / 演员B<br>\n'
+                f'    {1950 + i % 70}&nbsp;/&nbsp;美国 英国&nbsp;/&nbsp;犯罪 剧情\n</p><div class="star"><span class="rating_num" '
+                f'property="v:average">{8 + i % 20 / 10:.1f}</span><span property="v:best" content="10.0"></span>'
+                f'<span>{(i + 1) * 1234}人评价</span></div>{quote}</div></div></div></li>')
+
+    @staticmethod
+    def _detail(i: int, rng: random.Random) -> str:
+        actors = " / ".join(f'<a href="/celebrity/{k}/" rel="v:starring">演员{k}</a>' for k in range(rng.randint(1, 8)))
+        genres = " / ".join(f'<span property="v:genre">{g}</span>' for g in rng.sample(["剧情", "犯罪", "爱情", "动作", "科幻"], rng.randint(1, 3)))
+        intro = "<br>\n　　".join(f"电影{i}的第{k}段剧情简介。" for k in range(rng.randint(1, 4)))
+        info = (f'<div id="info"><span ><span class="pl">导演</span>: <span class="attrs"><a href="/celebrity/1/" rel="v:directedBy">导演{i}</a></span></span><br/>'
+                f'<span class="actor"><span class="pl">主演</span>: <span class="attrs">{actors}</span></span><br/>'
+                f'<span class="pl">类型:</span> {genres}<br/><span class="pl">制片国家/地区:</span> 美国 / 英国<br/>'
+                f'<span class="pl">上映日期:</span> <span property="v:initialReleaseDate" content="{1950 + i % 70}-09-10">{1950 + i % 70}-09-10(美国)</span><br/></div>')
+        rating = (f'<div id="interest_sectl"><strong class="ll rating_num" property="v:average">{8 + i % 20 / 10:.1f}</strong>'
+                  f'<a href="comments" class="rating_people"><span property="v:votes">{(i + 1) * 1234}</span>人评价</a></div>')
+        summary = (f'<div class="related-info"><h2>剧情简介</h2><div class="indent" id="link-report-intra">'
+                   f'<span property="v:summary" class="">　　{intro}</span></div></div>')
+        return (f'<h1><span property="v:itemreviewed">电影{i}</span></h1><div class="article"><div class="subject clearfix">'
+                f'{info}</div>{rating}{summary}' + '<div class="comment">短评<a>x</a></div>' * 60 + '</div>')
+
+
+@dataclass
+class ReplayBehavior:
+    """服务器行为: 延迟 (毫秒)、随机错误率、限流阈值 (请求/秒, 0 表示不限流) 与限流时的状态码."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    throttle_rps: float = 0.0
+    throttle_status: int = 429
+    seed: Optional[int] = None
+
+
+class ReplayServer:
+    """在后台线程中运行的回放服务器 (ThreadingHTTPServer, 每个连接一个线程).
+
+    with ReplayServer(SyntheticCorpus(), ReplayBehavior(latency_ms=50)) as server:
+        run_crawl(..., origin=server.url)
+    """
+
+    def __init__(self, corpus: Corpus, behavior: Optional[ReplayBehavior] = None,
+                 host: str = "127.0.0.1", port: int = 0) -> None:
+        self.corpus = corpus
+        self.behavior = behavior or ReplayBehavior()
+        self.stats: Counter = Counter() # 按状态码统计已返回的响应
+        self._rng = random.Random(self.behavior.seed)
+        self._lock = threading.Lock()
+        # 服务器端令牌桶: 超出 throttle_rps 的请求直接返回限流状态码
+        self._tokens = max(1.0, self.behavior.throttle_rps)
+        self._refilled = time.monotonic()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _throttled(self) -> bool:
+        rate = self.behavior.throttle_rps
+        if rate <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(max(1.0, rate), self._tokens + (now - self._refilled) * rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return False
+            return True
+
+    def _draw(self) -> Tuple[float, bool]:
+        """本次响应的延迟 (秒) 与是否注入错误."""
+        b = self.behavior
+        with self._lock:
+            jitter = self._rng.uniform(-b.jitter_ms, b.jitter_ms) if b.jitter_ms else 0.0
+            failed = b.error_rate > 0 and self._rng.random() < b.error_rate
+        return max(0.0, b.latency_ms + jitter) / 1000, failed
+
+    def respond(self, path: str, headers) -> Tuple[int, Dict[str, str], bytes]:
+        """按配置的行为生成响应: (状态码, 响应头, 响应体)."""
+        delay, failed = self._draw()
+        if delay:
+            time.sleep(delay)
+        if self._throttled():
+            return self.behavior.throttle_status, {"Retry-After": "1"}, b""
+        if failed:
+            return 503, {}, b""
+        page = self.corpus.lookup(path)
+        if page is None:
+            return 404, {}, b""
+        content_type, body = page
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        resp_headers = {"Content-Type": content_type, "ETag": etag}
+        if "gzip" in headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            resp_headers["Content-Encoding"] = "gzip"
+        return 200, resp_headers, body
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive
+            wbufsize = -1 # 响应头与响应体一起发送，避免 Nagle 算法带来的额外延迟
+
+            def do_GET(self) -> None:
+                status, headers, body = server.respond(self.path, self.headers)
+                with server._lock:
+                    server.stats[status] += 1
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None: # 不输出每个请求的访问日志
+                pass
+
+        return Handler
+
+
+def load_corpus(path: str = DEFAULT_CACHE_DIR, synthetic: bool = False, subjects: int = 250) -> Corpus:
+    """读取录制的语料；synthetic=True 或缓存为空时使用合成语料."""
+    corpus = Corpus() if synthetic else Corpus.from_cache(path)
+    return corpus if len(corpus) else SyntheticCorpus(subjects)
+
+
+def add_behavior_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--corpus", default=DEFAULT_CACHE_DIR, help="录制的语料 (响应缓存目录, 默认: data/http_cache)")
+    parser.add_argument("--synthetic", action="store_true", help="使用合成语料 (缓存为空时自动使用)")
+    parser.add_argument("--subjects", type=int, default=250, help="合成语料中的电影数 (默认: 250)")
+    parser.add_argument("--latency", type=float, default=50.0, help="每个响应的固定延迟 (毫秒, 默认: 50)")
+    parser.add_argument("--jitter", type=float, default=20.0, help="延迟的随机抖动 (± 毫秒, 默认: 20)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 503 的比例 (默认: 0)")
+    parser.add_argument("--throttle-rps", type=float, default=0.0, help="超过该请求速率时返回限流状态码 (默认: 0, 不限流)")
+    parser.add_argument("--throttle-status", type=int, default=429, help="限流时返回的状态码 (默认: 429, 豆瓣实际多为 403)")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子 (抖动与错误注入可复现)")
+
+
+def behavior_from_args(args: argparse.Namespace) -> ReplayBehavior:
+    return ReplayBehavior(latency_ms=args.latency, jitter_ms=args.jitter, error_rate=args.error_rate,
+                          throttle_rps=args.throttle_rps, throttle_status=args.throttle_status, seed=args.seed)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="豆瓣页面本地回放服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    add_behavior_args(parser)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.synthetic, args.subjects)
+    server = ReplayServer(corpus, behavior_from_args(args), args.host, args.port)
+    print(f"Replaying {len(corpus)} recorded pages{' (synthetic)' if isinstance(corpus, SyntheticCorpus) else ''} "
+          f"on {server.url} — crawl with `python main.py --origin {server.url} ...`")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+        print(f"Responses: {dict(server.stats)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
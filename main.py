@@ -1,8 +1,14 @@
 import argparse
 import os
+from typing import Optional
 
+from spider.cache import ResponseCache
 from spider.douban_spider import DoubanSpider
+from spider.transport import OriginRewriteTransport, PooledTransport, Transport
+from storage.frontier import FRONTIER_DB, CrawlFrontier
+from storage.ingest import IngestClient, parse_address
 from storage.repository import MovieRepository
+from storage.writer import BufferedWriter
 from utils.logger import logger
 
 
@@ -24,7 +30,26 @@ def run_crawl(
     sort: str = "recommend",
     verbose: bool = True,
     progress_callback = None,
-    start: int = 0
+    start: int = 0,
+    engine: str = "sync",
+    concurrency: int = 4,
+    rate: float = 2.0,
+    cache: bool = False,
+    cache_ttl: float = 6 * 3600,
+    offline: bool = False,
+    incremental: bool = False,
+    refresh_known: bool = False,
+    parser: str = "auto",
+    resume: bool = False,
+    frontier_db: str = FRONTIER_DB,
+    adaptive: bool = False,
+    min_delay: float = 0.2,
+    parse_workers: int = 2,
+    origin: str = "",
+    transport: Optional[Transport] = None,
+    flush_records: int = 500,
+    flush_seconds: float = 30.0,
+    ingest: str = ""
 ) -> None:
     # Determine table name based on logic
     # 逻辑现在由外部（args）控制，这里直接用 target_table
@@ -36,20 +61,58 @@ def run_crawl(
     
     ensure_dir(db_path)
     repo = MovieRepository(db_path, table_name)
+    # 单写者入库: 写操作交给入库服务 (storage/ingest.py) 合并提交，本进程只读数据库
+    sink = IngestClient(parse_address(ingest), table_name) if ingest else repo
+
+    # 爬取任务写入持久化前沿: 中断后以相同参数 resume 可从断点继续
+    job = CrawlFrontier(frontier_db).open_job({
+        "db": os.path.abspath(db_path), "table": table_name, "base_url": base_url, "tag": tag,
+        "sort": sort, "pages": pages, "limit": limit, "start": start,
+    }, resume=resume)
     
-    if clear:
-        repo.clear_table()
+    if clear and not incremental and not job.resumed: # 增量模式依赖已有数据，续爬时保留已入库的部分，都不清空
+        sink.clear_table()
     else:
-        repo.create_table_if_not_exists()
+        sink.create_table_if_not_exists()
+
+    known_links = repo.get_known_links() if incremental else None
+    if known_links is not None and verbose:
+        logger.info(f"Incremental mode: {len(known_links)} known movies in {table_name}")
+
+    # 跨页缓冲写入: 攒够 flush_records 条或缓冲超过 flush_seconds 秒才写一次 (一个事务)；
+    # 列表页在其记录真正写入后才在前沿中标记为已入库，中断时续爬不会丢数据
+    job.defer_saved = True
+    writer = BufferedWriter(sink, max_records=flush_records, max_seconds=flush_seconds,
+                            on_flush=job.flush_saved, verbose=verbose)
 
-    # Define incremental save callback
-    def _save_chunk(chunk):
-        saved_count = repo.save_all(chunk)
-        if verbose:
-            logger.info(f"  [Saved {saved_count} records]")
+    def _on_progress(current, total):
+        writer.checkpoint()
+        if progress_callback:
+            progress_callback(current, total)
 
-    spider = DoubanSpider(base_url=base_url, tag=tag, sort=sort, pages=pages, limit=limit, delay=delay, start=start)
-    movies = spider.fetch(progress_callback, save_callback=_save_chunk)
+    response_cache = ResponseCache(ttl=cache_ttl) if cache or offline else None
+    if origin and transport is None: # 请求改发到其他地址 (例如 benchmarks/replay_server.py 本地回放服务器)
+        transport = OriginRewriteTransport(PooledTransport(), origin)
+    spider = DoubanSpider(base_url=base_url, tag=tag, sort=sort, pages=pages, limit=limit, delay=delay, start=start,
+                          engine=engine, concurrency=concurrency, rate=rate, cache=response_cache, offline=offline,
+                          known_links=known_links, refresh_known=refresh_known, parser=parser, frontier=job,
+                          adaptive=adaptive, min_delay=min_delay, parse_workers=parse_workers,
+                          transport=transport)
+    try:
+        try:
+            movies = spider.fetch(_on_progress, save_callback=writer.add)
+        except BaseException:
+            try:
+                writer.close() # 已完整抓取的页面先入库，续爬时跳过
+            except Exception as e:
+                logger.error(f"Failed to flush buffered records: {e}")
+            logger.warning(f"Crawl job #{job.id} interrupted at {job.progress()}; rerun with --resume to continue.")
+            raise
+        writer.close()
+    finally:
+        if ingest:
+            sink.close()
+    job.finish()
     
     if verbose:
         logger.info(f"Fetched total {len(movies)} movies from {spider.base_url}")
@@ -73,6 +136,23 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--table", type=str, default="", help="指定数据表名 (默认: movies, 或根据 tag 自动生成)")
     parser.add_argument("--append", action="store_true", help="追加模式: 如果表存在，不清空数据直接追加 (默认: 每次爬取前清空)")
     parser.add_argument("--start", type=int, default=0, help="从第几部开始爬取 (默认: 0)")
+    parser.add_argument("--engine", type=str, default="sync", choices=["sync", "async", "pipeline"], help="抓取引擎: sync (串行, 固定间隔)、async (并发, 令牌桶限速) 或 pipeline (抓取线程 + 解析进程池 + 批量写入)")
+    parser.add_argument("--concurrency", type=int, default=4, help="async 模式下详情页的最大并发数 / pipeline 模式下的抓取线程数 (默认: 4)")
+    parser.add_argument("--rate", type=float, default=2.0, help="async / pipeline 模式下每个域名每秒的最大请求数 (默认: 2.0)")
+    parser.add_argument("--cache", action="store_true", help="启用磁盘响应缓存 (data/http_cache)，过期页面发送条件请求")
+    parser.add_argument("--cache-ttl", type=float, default=6 * 3600, help="缓存有效期 (秒, 默认: 21600)")
+    parser.add_argument("--offline", action="store_true", help="离线模式: 只使用缓存中的页面重新解析，不发送网络请求")
+    parser.add_argument("--incremental", action="store_true", help="增量模式: 不清空数据表，已入库的电影不再抓取详情页")
+    parser.add_argument("--refresh-known", action="store_true", help="增量模式下用列表页/API 数据刷新已入库电影的评分与评价人数")
+    parser.add_argument("--resume", action="store_true", help="断点续爬: 接着上一次参数相同但未完成的任务继续，跳过已完成的页面")
+    parser.add_argument("--parse-workers", type=int, default=2, help="pipeline 模式下的解析进程数, 0 表示在线程内解析 (默认: 2)")
+    parser.add_argument("--flush-records", type=int, default=500, help="缓冲写入: 累计多少条记录写一次数据库 (默认: 500)")
+    parser.add_argument("--flush-seconds", type=float, default=30.0, help="缓冲写入: 记录最多缓冲多少秒 (默认: 30)")
+    parser.add_argument("--ingest", type=str, default="", help="把写入交给单写者入库服务 (host:port, 见 python -m storage.ingest)，避免多进程争用数据库写锁")
+    parser.add_argument("--origin", type=str, default="", help="把对 movie.douban.com 的请求改发到该地址 (例如本地回放服务器 http://127.0.0.1:8800)")
+    parser.add_argument("--adaptive", action="store_true", help="自适应节奏: 以 --delay 为初始间隔，健康时加快、被限流时成倍退避，连续失败时熔断暂停")
+    parser.add_argument("--min-delay", type=float, default=0.2, help="自适应模式下的最小请求间隔 (秒, 默认: 0.2)")
+    parser.add_argument("--parser", type=str, default="auto", choices=["auto", "lxml", "soup-fast", "soup"], help="HTML 解析器 (默认 auto: 安装了 lxml 时使用 lxml)")
     
     return parser.parse_args()
 
@@ -120,5 +200,22 @@ if __name__ == "__main__":
         target_table=final_table, # 传递表名
         sort=args.sort,
         verbose=True,
-        start=args.start # 传递 start
+        start=args.start, # 传递 start
+        engine=args.engine,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        cache=args.cache,
+        cache_ttl=args.cache_ttl,
+        offline=args.offline,
+        incremental=args.incremental,
+        refresh_known=args.refresh_known,
+        parser=args.parser,
+        resume=args.resume,
+        adaptive=args.adaptive,
+        min_delay=args.min_delay,
+        parse_workers=args.parse_workers,
+        origin=args.origin,
+        flush_records=args.flush_records,
+        flush_seconds=args.flush_seconds,
+        ingest=args.ingest
     )
@@ -0,0 +1,59 @@
+"""按优先级重新抓取已入库电影的评分与评价人数 (见 spider/refresh.py).
+
+用法:
+    python recrawl.py --table movies --budget 600              # 处理当前所有到期的电影，每小时最多 600 个请求
+    python recrawl.py --table movies --budget 300 --forever    # 常驻运行，持续刷新
+    python recrawl.py --status
+"""
+import argparse
+import os
+import sys
+import time
+
+from spider.douban_spider import DoubanSpider
+from spider.refresh import RefreshScheduler
+from spider.transport import OriginRewriteTransport, PooledTransport
+from storage.ingest import IngestClient, parse_address
+from storage.repository import MovieRepository
+from utils.logger import logger
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="按优先级重新抓取已入库电影的评分与评价人数")
+    parser.add_argument("--db", default=os.path.join("data", "movie.db"), help="数据库路径")
+    parser.add_argument("--table", default="movies", help="数据表名 (默认: movies)")
+    parser.add_argument("--budget", type=float, default=600.0, help="每小时的请求预算 (默认: 600)")
+    parser.add_argument("--max-requests", type=int, default=0, help="本次最多发出多少个请求 (默认: 0 不限)")
+    parser.add_argument("--batch", type=int, default=20, help="每批处理的电影数 (默认: 20)")
+    parser.add_argument("--retry-delay", type=float, default=3600.0, help="抓取失败的电影推迟多少秒再试 (默认: 3600)")
+    parser.add_argument("--forever", action="store_true", help="常驻运行: 没有到期电影时等待")
+    parser.add_argument("--origin", default="", help="把请求改发到该地址 (例如本地回放服务器)")
+    parser.add_argument("--parser", default="auto", choices=["auto", "lxml", "soup-fast", "soup"], help="HTML 解析器")
+    parser.add_argument("--ingest", default="", help="把写入交给单写者入库服务 (host:port)")
+    parser.add_argument("--status", action="store_true", help="只显示调度概况")
+    args = parser.parse_args()
+
+    repo = MovieRepository(args.db, args.table)
+    if args.status:
+        summary = repo.get_refresh_summary()
+        if summary["oldest_fetch"]:
+            summary["oldest_fetch"] = time.strftime("%Y-%m-%d %H:%M", time.localtime(summary["oldest_fetch"]))
+        print(summary)
+        return 0
+
+    transport = OriginRewriteTransport(PooledTransport(), args.origin) if args.origin else None
+    spider = DoubanSpider(transport=transport, parser=args.parser)
+    sink = IngestClient(parse_address(args.ingest), args.table) if args.ingest else repo
+    try:
+        RefreshScheduler(repo, spider, budget_per_hour=args.budget, batch_size=args.batch,
+                         retry_delay=args.retry_delay, sink=sink).run(args.max_requests or None, forever=args.forever)
+    except KeyboardInterrupt:
+        logger.info("Refresh interrupted.")
+    finally:
+        if args.ingest:
+            sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, replace
+from typing import Dict, Iterator, Optional
+
+from spider.transport import Response, Transport, TransportError
+from utils.logger import logger
+
+DEFAULT_CACHE_DIR = os.path.join("data", "http_cache")
+# 需要随缓存一起保存的响应头 (用于条件请求与解码)
+KEPT_HEADERS = ("etag", "last-modified", "content-type")
+_HEADER = struct.Struct(">I") # 文件格式: 4 字节元数据长度 + JSON 元数据 + zlib 压缩的响应体
+
+
+class CacheMiss(TransportError):
+    """离线模式下请求了未缓存的 URL."""
+
+    def __init__(self, url: str) -> None:
+        super().__init__(url, 504)
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    headers: Dict[str, str]
+    body: bytes
+    fetched_at: float
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def to_response(self) -> Response:
+        return Response(self.url, 200, dict(self.headers), self.body, from_cache=True)
+
+
+class ResponseCache:
+    """磁盘响应缓存.
+
+    以 URL 的 sha256 为键，按前两位十六进制分目录存放；响应体用 zlib 压缩，
+    同时记录 ETag / Last-Modified 与抓取时间。写入先写临时文件再原子替换，
+    多线程 / 多进程并发读写不会读到半个文件.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, ttl: float = 6 * 3600) -> None:
+        self.root = root
+        self.ttl = ttl
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stores": 0}
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> str:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        entry = self._read(self._path(url))
+        if entry is None or entry.url != url: # 哈希碰撞 (理论上) 时按未命中处理
+            return None
+        return entry
+
+    @staticmethod
+    def _read(path: str) -> Optional[CacheEntry]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            (size,) = _HEADER.unpack_from(data)
+            meta = json.loads(data[_HEADER.size:_HEADER.size + size].decode("utf-8"))
+            body = zlib.decompress(data[_HEADER.size + size:])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            logger.warning(f"Ignoring corrupt cache entry {path}: {e}")
+            return None
+        return CacheEntry(meta.get("url", ""), meta.get("headers", {}), body, meta.get("fetched_at", 0.0))
+
+    def put(self, url: str, headers: Dict[str, str], body: bytes, fetched_at: Optional[float] = None) -> CacheEntry:
+        entry = CacheEntry(url, {k: headers[k] for k in KEPT_HEADERS if k in headers}, body,
+                           time.time() if fetched_at is None else fetched_at)
+        meta = json.dumps({"url": url, "headers": entry.headers, "fetched_at": entry.fetched_at}).encode("utf-8")
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(len(meta)) + meta + zlib.compress(body, 6))
+        os.replace(tmp, path)
+        self.count("stores")
+        return entry
+
+    def iter_entries(self) -> Iterator[CacheEntry]:
+        """遍历全部缓存条目 (用于离线基准测试等)."""
+        if not os.path.isdir(self.root):
+            return
+        for sub in sorted(os.listdir(self.root)):
+            folder = os.path.join(self.root, sub)
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if name.endswith(".tmp"):
+                    continue
+                entry = self._read(os.path.join(folder, name))
+                if entry is not None:
+                    yield entry
+
+    def touch(self, entry: CacheEntry) -> CacheEntry:
+        """服务器返回 304 后刷新抓取时间."""
+        return self.put(entry.url, entry.headers, entry.body)
+
+
+class CachingTransport(Transport):
+    """为任意 Transport 加上磁盘缓存.
+
+    - 未过期 (age < ttl) 的缓存直接返回，不发请求
+    - 过期的缓存带 If-None-Match / If-Modified-Since 重新验证，304 时使用磁盘内容
+    - offline=True 时只读缓存，未命中抛出 CacheMiss (可在解析逻辑修改后离线重跑)
+    """
+
+    def __init__(self, inner: Transport, cache: ResponseCache, offline: bool = False) -> None:
+        super().__init__(inner.connect_timeout, inner.read_timeout)
+        self.inner = inner
+        self.cache = cache
+        self.offline = offline
+        self.stats = inner.stats # 网络层统计沿用内部 transport 的
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        entry = self.cache.get(url)
+        if entry is not None and (self.offline or entry.age() < self.cache.ttl):
+            self.cache.count("hits")
+            return entry.to_response()
+        if self.offline:
+            self.cache.count("misses")
+            raise CacheMiss(url)
+
+        headers = dict(headers or {})
+        if entry is not None:
+            if "etag" in entry.headers:
+                headers["If-None-Match"] = entry.headers["etag"]
+            if "last-modified" in entry.headers:
+                headers["If-Modified-Since"] = entry.headers["last-modified"]
+
+        resp = self.inner.get(url, headers=headers)
+        if resp.status == 304 and entry is not None:
+            self.cache.count("revalidated")
+            return replace(self.cache.touch(entry).to_response(), from_cache=False) # 发生过网络往返
+        self.cache.count("misses")
+        if resp.status == 200:
+            self.cache.put(url, resp.headers, resp.body)
+        return resp
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+__all__ = ["ResponseCache", "CachingTransport", "CacheEntry", "CacheMiss", "DEFAULT_CACHE_DIR"]
@@ -0,0 +1,74 @@
+import itertools
+import threading
+from typing import Dict, Hashable, Iterable, Set, Tuple, Union
+
+from storage.repository import parse_subject_id
+
+
+class SeenSubjects:
+    """多个爬取任务共享的"已认领电影"集合 (跨标签去重).
+
+    同一部电影往往出现在多个标签/排序的列表里。第一个遇到它的任务认领 (claim) 后负责抓取详情并入库，
+    其他任务再遇到时直接跳过，不再重复请求详情页。按豆瓣 subject id 比较；
+    同一任务重复认领同一部电影仍返回 True (引擎内部会对同一链接多次判断).
+    认领者用 new_owner() 分配的标识区分 (不能用 id(对象): 任务结束、对象释放后 id 会被下一个任务复用).
+    认领在记录交给写入方后用 settle() 确认；任务失败时 release() 撤销其尚未确认的认领，
+    这些电影可以由之后遇到它们的任务重新抓取. 线程安全.
+    """
+
+    def __init__(self) -> None:
+        self._owners: Dict[Union[int, str], Hashable] = {}
+        self._pending: Dict[Hashable, Set[Union[int, str]]] = {} # 每个认领者尚未确认的认领
+        self._duplicates: Set[Tuple[Union[int, str], Hashable]] = set()
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    @property
+    def duplicates(self) -> int:
+        """被其他任务跳过的 (电影, 任务) 次数."""
+        return len(self._duplicates)
+
+    def new_owner(self) -> int:
+        """为一个任务分配认领标识 (在本集合内唯一，不会复用)."""
+        with self._lock:
+            return next(self._tokens)
+
+    def claim(self, info_link: str, owner: Hashable) -> bool:
+        """owner (new_owner() 分配的标识) 认领该电影；已被其他任务认领时返回 False."""
+        key = self._key(info_link)
+        with self._lock:
+            current = self._owners.get(key)
+            if current is None:
+                self._owners[key] = owner
+                self._pending.setdefault(owner, set()).add(key)
+                return True
+            if current == owner:
+                return True
+            self._duplicates.add((key, owner))
+            return False
+
+    def settle(self, info_links: Iterable[str], owner: Hashable) -> None:
+        """确认 owner 的认领: 这些电影的记录已交给写入方，任务之后失败也不再撤销."""
+        with self._lock:
+            pending = self._pending.get(owner)
+            if pending:
+                pending.difference_update(self._key(link) for link in info_links)
+
+    def release(self, owner: Hashable) -> int:
+        """撤销 owner 尚未确认的认领 (任务失败时调用)，返回撤销的数量."""
+        with self._lock:
+            pending = self._pending.pop(owner, set())
+            for key in pending:
+                if self._owners.get(key) == owner:
+                    del self._owners[key]
+            return len(pending)
+
+    @staticmethod
+    def _key(info_link: str) -> Union[int, str]:
+        return parse_subject_id(info_link) or info_link
+
+
+__all__ = ["SeenSubjects"]
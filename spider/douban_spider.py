@@ -1,16 +1,51 @@
-import re # 用于正则匹配
+import asyncio # 用于异步并发抓取
+import json # 用于解析 API 响应
 import time # 用于延迟
-import urllib.error # 用于处理URL请求异常
-import urllib.request # 用于处理URL请求
+from concurrent.futures import ProcessPoolExecutor # 共享的解析进程池 (类型提示)
 from urllib.parse import quote # URL编码
-from typing import Dict, List, Optional # 用于类型提示
-from bs4 import BeautifulSoup # 用于解析HTML
+from typing import Dict, Iterable, List, Optional, Set # 用于类型提示
+from spider.cache import CacheMiss, CachingTransport, ResponseCache # 磁盘响应缓存
+from spider.dedup import SeenSubjects # 多任务共享的跨标签去重集合
+from spider.pacing import AdaptivePacer, RequestPacing, THROTTLE_STATUSES # 自适应节奏 (AIMD) 与熔断
+from spider.pipeline import CrawlPipeline # 抓取 -> 解析 -> 写入 分阶段流水线
+from spider.parsers import empty_details, get_parser # 列表页/详情页解析器
+from spider.ratelimit import HostRateLimiter # 按域名限速
+from spider.transport import PooledTransport, Transport, TransportError # HTTP 传输层 (keep-alive 连接池)
+from storage.frontier import CrawlJob # 持久化爬取前沿 (断点续爬)
+from storage.repository import parse_subject_id # 从链接中提取豆瓣 subject id
 from utils.logger import logger # 导入日志模块
 
+ENGINES = ("sync", "async", "pipeline")
+
 
 class DoubanSpider:
-    """豆瓣电影列表爬虫 (支持 Top250 或指定标签)."""
-    def __init__(self, base_url: str = "https://movie.douban.com/top250", tag: str = "", sort: str = "recommend", pages: int = 10, limit: int = 200, delay: float = 1.0, start: int = 0):
+    """豆瓣电影列表爬虫 (支持 Top250 或指定标签).
+
+    engine="sync" 为原有的串行模式 (每个请求之间固定 sleep)；
+    engine="async" 为并发模式: 列表页依次抓取，同一页的详情页最多 concurrency 个并发，
+    所有请求由按域名的令牌桶限速 (rate 个/秒，允许 burst 个突发) 代替固定 sleep.
+    engine="pipeline" 为分阶段流水线 (见 spider/pipeline.py): concurrency 个抓取线程、parse_workers 个解析进程
+    与单个批量写入线程通过有界队列连接，save_callback 按 batch_size 条一批调用.
+    各模式产生的记录顺序完全相同.
+
+    adaptive=True 时由 AIMD 节奏控制器代替固定间隔、令牌桶与重试退避: 响应健康时逐步缩短间隔、
+    提高并发 (不超过 concurrency)，遇到 403/429/5xx 或延迟突增时成倍退避；连续失败触发熔断，
+    整个爬取暂停冷却后再用单个请求探测，而不是在每个 URL 上耗尽重试次数.
+
+    多个任务在同一进程中并发运行时 (见 batch_crawl.py)，可传入共享的 transport、limiter / pacing、seen 与 parse_pool:
+    所有任务共用一个连接池、一份全局速率预算和一个解析进程池，同一部电影只由第一个遇到它的任务抓取详情.
+    """
+    def __init__(self, base_url: str = "https://movie.douban.com/top250", tag: str = "", sort: str = "recommend", pages: int = 10, limit: int = 200, delay: float = 1.0, start: int = 0,
+                 engine: str = "sync", concurrency: int = 4, rate: float = 2.0, burst: float = 2.0,
+                 transport: Optional[Transport] = None, connect_timeout: float = 5.0, read_timeout: float = 15.0,
+                 cache: Optional[ResponseCache] = None, offline: bool = False,
+                 known_links: Optional[Iterable[str]] = None, refresh_known: bool = False, parser: str = "auto",
+                 frontier: Optional[CrawlJob] = None, adaptive: bool = False, min_delay: float = 0.2,
+                 parse_workers: int = 2, batch_size: int = 50, limiter: Optional[HostRateLimiter] = None,
+                 pacing: Optional[RequestPacing] = None, seen: Optional[SeenSubjects] = None,
+                 parse_pool: Optional[ProcessPoolExecutor] = None):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
         self.base_url = base_url.rstrip("/")
         self.tag = tag
         self.sort = sort
@@ -22,13 +57,43 @@ class DoubanSpider:
         self.limit = limit
         self.delay = delay
         self.start = start # 新增 start 参数
+        self.engine = engine
+        self.concurrency = max(1, int(concurrency))
+        self.limiter = limiter or HostRateLimiter(rate, burst) # async / pipeline 模式与 get_page 使用
+        # 默认使用 keep-alive 连接池，复用 TCP/TLS 连接并启用 gzip 压缩
+        self.transport = transport or PooledTransport(connect_timeout=connect_timeout, read_timeout=read_timeout)
+        # 启用缓存时: 未过期的页面直接读盘，过期的发条件请求；offline 模式只读缓存不联网
+        self.cache = cache or (ResponseCache() if offline else None)
+        # 增量模式: 已入库的电影不再抓取详情页 (按 subject id 匹配，兼容 http/https 等链接差异)
+        self.known_links: Set[str] = set(known_links or ())
+        self._known_ids: Set[int] = {i for i in map(parse_subject_id, self.known_links) if i}
+        self.refresh_known = refresh_known
+        self.skipped_details = 0
+        # 跨任务去重: 其他任务已认领的电影视同已知 (不抓详情、不重复入库)
+        self.seen = seen
+        self._seen_owner = seen.new_owner() if seen is not None else None
+        self.offline = offline
+        # 自适应节奏: 初始间隔取 delay，之后按服务器反馈调整 (离线模式不需要)
+        self.pacing: Optional[RequestPacing] = pacing if not offline else None
+        if adaptive and not offline and self.pacing is None:
+            self.pacing = RequestPacing(AdaptivePacer(interval=delay or 1.0, min_interval=min_delay,
+                                                      max_concurrency=self.concurrency))
+        if offline or self.pacing:
+            self.delay = 0 # 离线重放不需要请求间隔；自适应模式由 pacing 控制间隔
+        if self.cache is not None:
+            self.transport = CachingTransport(self.transport, self.cache, offline=offline)
         self.headers = { # 设置HTTP头，伪装为Chrome浏览器
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
         }
-        # 例如: "123456 人评价"
-        self.rating_count_pattern = re.compile(r"(\d+)\s*人评价") # 匹配评价人数
-        # 例如: "1994 / 美国 / 剧情 犯罪" (Top250 标准格式)
-        self.meta_pattern = re.compile(r"(\d{4})\s*/\s*([^/]+)\s*/\s*(.+)") # 匹配年份、国家、类型
+        # HTML 解析器: auto 时优先使用 lxml，否则使用 BeautifulSoup 快速路径
+        self.parser = get_parser(parser)
+        # 断点续爬: 记录/复用列表页与详情页的抓取结果 (None 表示不记录)
+        self.frontier = frontier
+        # 流水线引擎参数与最近一次运行的各阶段统计
+        self.parse_workers = parse_workers
+        self.parse_pool = parse_pool # 多个任务共享的解析进程池 (None 时流水线自建)
+        self.batch_size = batch_size
+        self.pipeline_metrics: Dict[str, Dict] = {}
 
     def fetch(self, progress_callback=None, save_callback=None) -> List[Dict[str, str]]:
         """抓取豆瓣电影列表，返回电影字典列表
@@ -36,63 +101,86 @@ class DoubanSpider:
             progress_callback: 进度回调函数
             save_callback: 数据保存回调函数 (batch_data -> None)
         """
+        if self.seen is None:
+            return self._fetch_records(progress_callback, save_callback)
+
+        # 共享去重: 记录交给 save_callback 后认领才算确认；任务中途失败时撤销其余认领，
+        # 否则其他任务会一直跳过这些电影的详情页，它们最终既没有详情也可能根本没有入库
+        def _save(batch: List[Dict[str, str]]) -> None:
+            save_callback(batch)
+            self.seen.settle([record.get("info_link", "") for record in batch], self._seen_owner)
+
+        try:
+            return self._fetch_records(progress_callback, _save if save_callback else None)
+        except BaseException:
+            released = self.seen.release(self._seen_owner)
+            if released:
+                logger.warning(f"Released {released} claimed movies that were not saved; other jobs may fetch them")
+            raise
+
+    def _fetch_records(self, progress_callback=None, save_callback=None) -> List[Dict[str, str]]:
+        if self.engine == "async":
+            records = asyncio.run(self._fetch_async(progress_callback, save_callback))
+            self._log_stats()
+            return records
+        if self.engine == "pipeline":
+            pipeline = CrawlPipeline(self, fetch_workers=self.concurrency, parse_workers=self.parse_workers,
+                                     batch_size=self.batch_size, pool=self.parse_pool)
+            try:
+                records = pipeline.run(progress_callback, save_callback)
+            finally:
+                self.pipeline_metrics = pipeline.metrics()
+            self._log_stats()
+            return records
+
         records: List[Dict[str, str]] = [] 
         
         # 模式一：标签搜索 (使用 j/new_search_subjects API)
         if self.tag:
             self.headers.update({"Referer": f"https://movie.douban.com/tag/{quote(self.tag)}"})
             start = self.start # 使用传入的 start 作为起点
-            batch_size = 20
-            
-            # 映射排序参数
-            # T: 热度 (Hot), S: 评分 (Score), R: 上映日期 (Release)
-            sort_map = {
-                "recommend": "T",
-                "rank": "S", 
-                "time": "R",
-                "recent": "U" 
-            }
-            api_sort = sort_map.get(self.sort, "T")
-
-            while len(records) < self.limit:
-                remaining = self.limit - len(records)
-                current_limit = min(batch_size, remaining)
-                
-                # 使用新版 API，支持更丰富的筛选
-                # tags: tags=2023, tags=喜剧
-                # range: 0,10 (默认全范围)
-                url = f"https://movie.douban.com/j/new_search_subjects?sort={api_sort}&range=0,10&tags={quote(self.tag)}&start={start}"
+            seen = 0 # 已处理的列表条目数 (增量模式下跳过的条目也计入)
+
+            while seen < self.limit:
+                url = self._tag_api_url(start)
                 
                 logger.info(f"Fetching API {url} ...")
                 if progress_callback:
-                    progress_callback(len(records), self.limit)
+                    progress_callback(seen, self.limit)
 
-                content = self._get(url)
-                if not content:
-                    logger.warning("Empty response from API")
-                    break
-                    
-                batch = self._parse_json(content)
-                if not batch:
+                subjects = self._cached_list(url)
+                if subjects is None:
+                    content = self._get(url)
+                    if not content:
+                        logger.warning("Empty response from API")
+                        break
+                    subjects = self._parse_json_items(content)
+                    self._remember_list(url, subjects, [sub.get("url", "") for sub in subjects])
+                if not subjects:
                     logger.info("No more data in response")
                     break
-                    
-                batch = self._parse_json(content)
-                if not batch:
-                    break
-                
-                if save_callback:
+
+                if self._page_saved(url):
+                    logger.info("  > Page already saved by the resumed job, skipping")
+                    seen += len(subjects)
+                    start += len(subjects)
+                    continue
+
+                batch = self._parse_subjects(subjects)
+                if save_callback and batch:
                     logger.info(f"  > Saving {len(batch)} records...")
                     save_callback(batch)
+                self._mark_saved(url)
                 
                 records.extend(batch)
-                start += len(batch)
+                seen += len(subjects)
+                start += len(subjects)
                 
-                if self.delay and len(records) < self.limit:
+                if self.delay and seen < self.limit:
                     time.sleep(self.delay)
             
             if progress_callback:
-                progress_callback(len(records), self.limit)
+                progress_callback(seen, self.limit)
                 
         # 模式二：Top 250 (网页分页抓取)
         else:
@@ -105,225 +193,398 @@ class DoubanSpider:
                 self.headers.update({"Referer": "https://movie.douban.com/top250"})
 
                 logger.info(f"Fetching {url} ...")
-                content = self._get(url)
-                if not content:
+                items = self._cached_list(url)
+                if items is None:
+                    content = self._get(url)
+                    if not content:
+                        continue
+                    items = self._parse_list(content)
+                    self._remember_list(url, items, [item["info_link"] for item in items])
+                if self._page_saved(url):
+                    logger.info("  > Page already saved by the resumed job, skipping")
                     continue
                 
-                batch = self._parse(content)
-                if save_callback:
+                batch = self._parse_items(items)
+                if save_callback and batch:
                      logger.info(f"  > Saving {len(batch)} records...")
                      save_callback(batch)
+                self._mark_saved(url)
                 records.extend(batch)
                     
                 if self.delay:
                     time.sleep(self.delay)
+        self._log_stats()
         return records
 
-    def _get(self, url: str) -> str:
-        request = urllib.request.Request(url, headers=self.headers)
-        
-        # 重试机制：最多尝试3次
-        for attempt in range(3):
+    def _log_stats(self) -> None:
+        logger.info(f"Transport stats: {self.transport.stats.as_dict()}")
+        if self.pacing:
+            logger.info(f"Pacing: {self.pacing.snapshot()}")
+        if self.cache is not None:
+            logger.info(f"Cache stats: {self.cache.stats}")
+        if self.known_links or self.seen is not None:
+            logger.info(f"Skipped {self.skipped_details} detail pages of known or already claimed movies")
+
+    def _get(self, url: str, paced: bool = False, limited: bool = False, attempts: int = 3) -> str:
+        """paced=True 表示调用方 (async 引擎) 已为第一次尝试等待过 pacing;
+        limited=True 时每次尝试 (包括重试) 前都从 self.limiter 取令牌 (离线回放除外)，不再固定等待 2s/4s."""
+        # 重试机制：最多尝试 attempts 次
+        for attempt in range(attempts):
+            if self.pacing and not (paced and attempt == 0):
+                self.pacing.before_request() # 熔断打开时在此暂停，直到冷却结束
+            elif limited and not self.pacing and not self.offline:
+                self.limiter.acquire(url)
+            started = time.perf_counter()
             try:
-                # 增加超时时间到 15 秒，应对网络波动
-                with urllib.request.urlopen(request, timeout=15) as resp:
-                    return resp.read().decode("utf-8")
+                # 连接超时与读取超时由 transport 控制
+                resp = self.transport.get(url, headers=self.headers)
+                if self.pacing and not resp.from_cache:
+                    self.pacing.on_result(resp.status, time.perf_counter() - started)
+                if resp.status >= 400:
+                    raise TransportError(url, resp.status)
+                return resp.text()
+            except CacheMiss:
+                logger.warning(f"Offline mode: {url} is not cached")
+                return ""
             except Exception as e:
-                logger.warning(f"Request Error for {url} (Attempt {attempt+1}/3): {e}")
-                if attempt < 2:
-                    time.sleep(2 * (attempt + 1)) # 失败后稍微等待 2s, 4s 再重试
+                status = e.status if isinstance(e, TransportError) else getattr(e, "code", None) # urllib HTTPError 带 code
+                if self.pacing and not isinstance(e, TransportError): # 状态码错误已在上面反馈
+                    self.pacing.on_result(status, time.perf_counter() - started) # None: 超时、连接错误
+                logger.warning(f"Request Error for {url} (Attempt {attempt+1}/{attempts}): {e}")
+                if self.pacing and status and status not in THROTTLE_STATUSES:
+                    return "" # 404 等确定性错误重试无意义
+                if attempt < attempts - 1:
+                    if not self.pacing and not limited: # 自适应/限速模式下由 pacing 或令牌桶决定等待时间
+                        time.sleep(2 * (attempt + 1)) # 失败后稍微等待 2s, 4s 再重试
                 else:
-                    logger.error(f"Failed to fetch {url} after 3 attempts.")
+                    logger.error(f"Failed to fetch {url} after {attempts} attempts.")
                     return ""
+        return ""
+
+    # ------------------------------------------------------------------
+    # 单步接口: 供外部调度 (spider/worker.py 任务队列、spider/refresh.py 定时刷新) 逐个请求、解析
+    # ------------------------------------------------------------------
+    def get_page(self, url: str, attempts: int = 1) -> str:
+        """请求单个页面，每次尝试前经限速器 (或自适应 pacing) 取得许可. 失败返回空字符串.
+
+        默认只尝试一次，由调用方决定是否、何时重试 (例如任务队列的 max_attempts).
+        """
+        return self._get(url, limited=True, attempts=max(1, attempts))
+
+    def tag_api_url(self, start: int) -> str:
+        """标签 API 第 start 条起的分页地址."""
+        return self._tag_api_url(start)
+
+    def parse_api_subjects(self, content: str) -> List[Dict]:
+        """解析标签 API 响应，返回条目列表 (不抓取详情)."""
+        return self._parse_json_items(content)
+
+    def parse_details(self, html: str, url: str = "") -> Dict[str, str]:
+        """解析详情页 HTML，失败时返回空字段."""
+        return self._parse_details(html, url)
+
+    def build_record(self, sub: Dict, html: str) -> Dict[str, str]:
+        """由 API 条目与其详情页 HTML 生成一条入库记录."""
+        return self._record_from_api(sub, self._parse_details(html, sub.get("url", "")))
+
+    def _tag_api_url(self, start: int) -> str:
+        # 映射排序参数
+        # T: 热度 (Hot), S: 评分 (Score), R: 上映日期 (Release)
+        sort_map = {
+            "recommend": "T",
+            "rank": "S", 
+            "time": "R",
+            "recent": "U" 
+        }
+        api_sort = sort_map.get(self.sort, "T")
+        # 使用新版 API，支持更丰富的筛选
+        # tags: tags=2023, tags=喜剧
+        # range: 0,10 (默认全范围)
+        return f"https://movie.douban.com/j/new_search_subjects?sort={api_sort}&range=0,10&tags={quote(self.tag)}&start={start}"
+
+    # ------------------------------------------------------------------
+    # 异步引擎
+    # ------------------------------------------------------------------
+    async def _fetch_async(self, progress_callback=None, save_callback=None) -> List[Dict[str, str]]:
+        """fetch 的异步实现: 列表页顺序抓取，详情页在限速和并发上限内同时抓取."""
+        records: List[Dict[str, str]] = []
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        if self.tag:
+            self.headers.update({"Referer": f"https://movie.douban.com/tag/{quote(self.tag)}"})
+            start = self.start
+            seen = 0
+            while seen < self.limit:
+                url = self._tag_api_url(start)
+                logger.info(f"Fetching API {url} ...")
+                if progress_callback:
+                    progress_callback(seen, self.limit)
+
+                subjects = self._cached_list(url)
+                if subjects is None:
+                    content = await self._get_async(url)
+                    if not content:
+                        logger.warning("Empty response from API")
+                        break
+                    subjects = self._parse_json_items(content)
+                    self._remember_list(url, subjects, [sub.get("url", "") for sub in subjects])
+                if not subjects:
+                    logger.info("No more data in response")
+                    break
+
+                if self._page_saved(url):
+                    logger.info("  > Page already saved by the resumed job, skipping")
+                    seen += len(subjects)
+                    start += len(subjects)
+                    continue
+
+                links = [sub.get("url", "") for sub in subjects]
+                details = await self._details_async(links, semaphore)
+                batch = [self._record_from_api(sub, d) if not self._is_known(link)
+                         else self._refresh_record(link, sub.get("rate", ""))
+                         for sub, link, d in zip(subjects, links, details)]
+                batch = [r for r in batch if r]
+                if save_callback and batch:
+                    logger.info(f"  > Saving {len(batch)} records...")
+                    save_callback(batch)
+                self._mark_saved(url)
+                records.extend(batch)
+                seen += len(subjects)
+                start += len(subjects)
+
+            if progress_callback:
+                progress_callback(seen, self.limit)
+        else:
+            self.headers.update({"Referer": "https://movie.douban.com/top250"})
+            for i in range(self.pages):
+                if progress_callback:
+                    progress_callback(i + 1, self.pages)
+
+                url = f"{self.base_url}?start={i * 25}"
+                logger.info(f"Fetching {url} ...")
+                items = self._cached_list(url)
+                if items is None:
+                    content = await self._get_async(url)
+                    if not content:
+                        continue
+                    items = self._parse_list(content)
+                    self._remember_list(url, items, [item["info_link"] for item in items])
+                if self._page_saved(url):
+                    logger.info("  > Page already saved by the resumed job, skipping")
+                    continue
+
+                details = await self._details_async([item["info_link"] for item in items], semaphore)
+                batch = [self._record_from_list(item, d) if not self._is_known(item["info_link"])
+                         else self._refresh_record(item["info_link"], item["score"], item["rated"])
+                         for item, d in zip(items, details)]
+                batch = [r for r in batch if r]
+                if save_callback and batch:
+                    logger.info(f"  > Saving {len(batch)} records...")
+                    save_callback(batch)
+                self._mark_saved(url)
+                records.extend(batch)
+        return records
+
+    async def _get_async(self, url: str) -> str:
+        """在线程池中执行阻塞的 _get. 自适应模式下先异步等待 pacing，否则每次尝试 (包括重试) 都在 _get 中取令牌."""
+        if self.pacing:
+            await self.pacing.before_request_async()
+            return await asyncio.to_thread(self._get, url, True)
+        return await asyncio.to_thread(self._get, url, False, True)
+
+    async def _details_async(self, urls: List[str], semaphore: asyncio.Semaphore) -> List[Dict[str, str]]:
+        """并发抓取一组详情页，结果顺序与 urls 一致."""
+        async def one(url: str) -> Dict[str, str]:
+            if not url:
+                return self._empty_details()
+            if self._is_known(url): # 增量模式下已入库的电影不抓详情
+                self.skipped_details += 1
+                return self._empty_details()
+            cached = self._cached_details(url)
+            if cached is not None:
+                return cached
+            async with semaphore:
+                if self.pacing: # 自适应并发上限 (<= concurrency)
+                    await self.pacing.pacer.acquire_slot()
+                try:
+                    logger.debug(f"  > Fetching details for {url} ...")
+                    html = await self._get_async(url)
+                finally:
+                    if self.pacing:
+                        await self.pacing.pacer.release_slot()
+            details = await asyncio.to_thread(self._parse_details, html, url) if html else self._empty_details()
+            self._remember_details(url, html, details)
+            return details
+
+        return list(await asyncio.gather(*(one(url) for url in urls)))
+
+    # ------------------------------------------------------------------
+    # 同步引擎 & 两种引擎共用的解析/合并逻辑
+    # ------------------------------------------------------------------
+    def _cached_list(self, url: str) -> Optional[List[Dict]]:
+        """断点续爬: 任务中已解析过的列表页条目 (不再请求)."""
+        return self.frontier.payload("list", url) if self.frontier else None
+
+    def _remember_list(self, url: str, items: List[Dict], links: List[str]) -> None:
+        if self.frontier and items:
+            self.frontier.record_list(url, items, links)
+
+    def _page_saved(self, url: str) -> bool:
+        """断点续爬: 该列表页的整批记录是否已经入库."""
+        return self.frontier is not None and self.frontier.state("list", url) == "saved"
+
+    def _mark_saved(self, url: str) -> None:
+        if self.frontier:
+            self.frontier.mark_saved(url)
+
+    def _cached_details(self, url: str) -> Optional[Dict[str, str]]:
+        """断点续爬: 任务中已抓取过的详情页解析结果."""
+        return self.frontier.payload("detail", url) if self.frontier and url else None
+
+    def _remember_details(self, url: str, html: str, details: Dict[str, str]) -> None:
+        if self.frontier:
+            if html:
+                self.frontier.record("detail", url, details)
+            else:
+                self.frontier.mark_failed("detail", url)
+
+    def _is_known(self, info_link: str) -> bool:
+        """增量模式: 链接 (按豆瓣 subject id 比较) 是否已在库中；共享去重时还包括已被其他任务认领的电影."""
+        if not info_link:
+            return False
+        if self.known_links:
+            subject_id = parse_subject_id(info_link)
+            if subject_id in self._known_ids if subject_id else info_link in self.known_links:
+                return True
+        return self.seen is not None and not self.seen.claim(info_link, self._seen_owner)
+
+    def _refresh_record(self, info_link: str, score: str, rated: str = "") -> Optional[Dict[str, str]]:
+        """已入库电影只刷新列表页/API 上就有的易变字段 (评分、评价人数)，其余字段留空.
+
+        save_all 的 UPSERT 不会用空值覆盖旧值，因此这类记录只会更新这两个字段.
+        """
+        if not self.refresh_known:
+            return None
+        return {"info_link": info_link, "score": score, "rated": rated}
 
     def _parse_json(self, json_str: str) -> List[Dict[str, str]]:
-        import json
+        return self._parse_subjects(self._parse_json_items(json_str))
+
+    def _parse_subjects(self, subjects: List[Dict]) -> List[Dict[str, str]]:
         records: List[Dict[str, str]] = []
-        try:
-            data = json.loads(json_str)
-            # 兼容新旧 API: new -> "data", old -> "subjects"
-            subjects = data.get("data") if "data" in data else data.get("subjects", [])
-            
-            for sub in subjects:
-                # API 返回有限字段: rate, title, url, cover, is_new, id, casts, directors
-                # 我们将其映射到我们的 schema
-                
-                info_link = sub.get("url", "")
-                
-                # 获取详情以补充缺失字段
-                # 注意: 即使新API有 casts/directors, 我们仍需 get_details 获取 introduction, country 等
+        for sub in subjects:
+            info_link = sub.get("url", "")
+            if self._is_known(info_link):
+                self.skipped_details += 1
+                record = self._refresh_record(info_link, sub.get("rate", ""))
+                if record:
+                    records.append(record)
+                continue
+
+            # 获取详情以补充缺失字段
+            # 注意: 即使新API有 casts/directors, 我们仍需 get_details 获取 introduction, country 等
+            details = self._cached_details(info_link)
+            if details is None:
                 logger.debug(f"  > Fetching details for {sub.get('title', '')} ...")
                 details = self._get_movie_details(info_link)
-
-                # 优先使用 API 提供的 metadata (如果有), 否则用详情页数据
-                # New API: directors, casts are lists of strings or objects. Old API: absent or diff.
-                # Safe strategy: trust get_movie_details for deep info, use API for basic ID/Score
-                
-                records.append({
-                    "info_link": info_link,
-                    "pic_link": sub.get("cover", ""),
-                    "cname": sub.get("title", ""),
-                    "score": sub.get("rate", "0"),
-                    "rated": details["rated"], 
-                    "introduction": details["introduction"],
-                    "year_release": sub.get("year") or details["year"], # Try API year first
-                    "country": details["country"], 
-                    "category": details["category"] if details["category"] else self.tag, 
-                    "directors": details["directors"],
-                    "actors": details["actors"],
-                })
-
                 # 关键修复：在每部电影详情抓取后等待，防止请求过快
                 if self.delay:
                     time.sleep(self.delay)
+            records.append(self._record_from_api(sub, details))
+        return records
+
+    def _parse_json_items(self, json_str: str) -> List[Dict]:
+        """解析 API 响应，返回原始条目列表 (不抓取详情)."""
+        try:
+            data = json.loads(json_str)
         except json.JSONDecodeError:
             logger.error("Failed to decode JSON response")
-        return records
+            return []
+        # 兼容新旧 API: new -> "data", old -> "subjects"
+        return data.get("data") if "data" in data else data.get("subjects", [])
+
+    def _record_from_api(self, sub: Dict, details: Dict[str, str]) -> Dict[str, str]:
+        # API 返回有限字段: rate, title, url, cover, is_new, id, casts, directors
+        # Safe strategy: trust get_movie_details for deep info, use API for basic ID/Score
+        return {
+            "info_link": sub.get("url", ""),
+            "pic_link": sub.get("cover", ""),
+            "cname": sub.get("title", ""),
+            "score": sub.get("rate", "0"),
+            "rated": details["rated"], 
+            "introduction": details["introduction"],
+            "year_release": sub.get("year") or details["year"], # Try API year first
+            "country": details["country"], 
+            "category": details["category"] if details["category"] else self.tag, 
+            "directors": details["directors"],
+            "actors": details["actors"],
+        }
+
+    @staticmethod
+    def _empty_details() -> Dict[str, str]:
+        return empty_details()
 
     def _get_movie_details(self, url: str) -> Dict[str, str]:
         """抓取电影详情页，获取完整信息"""
-        details = {
-            "introduction": "", "country": "", "year": "", "category": "",
-            "rated": "", "directors": "", "actors": ""
-        }
         if not url:
-            return details
-            
-        try:
+            return self._empty_details()
+        if not self.offline and not self.pacing:
             time.sleep(0.5) # 缩短延迟到 0.5s，并在下方 _get 增加了超时控制
-            html = self._get(url)
-            if not html:
-                return details
-                
-            soup = BeautifulSoup(html, "html.parser")
-            
-            # 1. 简介 (v:summary)
-            related_info = soup.find("div", class_="related-info")
-            if related_info:
-                span = related_info.find("span", property="v:summary")
-                if span:
-                    # 处理可能存在的 <br>
-                    details["introduction"] = span.get_text(strip=True)
-
-            # 2. Meta 信息 (#info)
-            info_div = soup.find("div", id="info")
-            if info_div:
-                text = info_div.get_text()
-                # 制片国家/地区
-                if "制片国家/地区:" in text:
-                    parts = text.split("制片国家/地区:")
-                    if len(parts) > 1:
-                        details["country"] = parts[1].split("\n")[0].strip()
-                
-                # 上映年份 (优先从 JSON 或 List 获取，这里作为补充)
-                if "上映日期:" in text or "首播:" in text:
-                    y_parts = re.findall(r"(\d{4})", text)
-                    if y_parts:
-                        details["year"] = y_parts[0]
-
-            # 3. 评价人数 (v:votes)
-            vote_tag = soup.find("span", property="v:votes")
-            if vote_tag:
-                 details["rated"] = vote_tag.get_text(strip=True)
-
-            # 4. 类型 (v:genre) -  获取完整类型列表
-            genre_tags = soup.find_all("span", property="v:genre")
-            if genre_tags:
-                details["category"] = " ".join([t.get_text(strip=True) for t in genre_tags])
-
-            # 5. 导演 (v:directedBy)
-            bus = soup.find_all("a", rel="v:directedBy")
-            if bus:
-                details["directors"] = " ".join([b.get_text(strip=True) for b in bus])
-            
-            # 6. 主演 (v:starring)
-            acts = soup.find_all("a", rel="v:starring")
-            if acts:
-                details["actors"] = " ".join([a.get_text(strip=True) for a in acts[:5]]) # 仅取前5
+        html = self._get(url)
+        details = self._parse_details(html, url) if html else self._empty_details()
+        self._remember_details(url, html, details)
+        return details
 
+    def _parse_details(self, html: str, url: str = "") -> Dict[str, str]:
+        """解析详情页 HTML (具体实现见 spider/parsers.py)"""
+        try:
+            return self.parser.parse_details(html)
         except Exception as e:
             logger.warning(f"Failed to fetch details for {url}: {e}")
-            
-        return details
+            return self._empty_details()
 
     def _parse(self, html: str) -> List[Dict[str, str]]: # 解析HTML（top250）
-        soup = BeautifulSoup(html, "html.parser") 
+        return self._parse_items(self._parse_list(html))
+
+    def _parse_items(self, items: List[Dict[str, str]]) -> List[Dict[str, str]]:
         records: List[Dict[str, str]] = []
-        
-        items = soup.find_all("div", class_="item")
         for item in items:
-            link_tag = item.find("a", href=True)
-            info_link = link_tag["href"] if link_tag else ""
-
-            img_tag = item.find("img")
-            pic_link = img_tag["src"] if img_tag else ""
-
-            title_tag = item.find("span", class_="title")
-            cname = title_tag.get_text(strip=True) if title_tag else ""
-
-            rating_tag = item.find("span", class_="rating_num")
-            score = rating_tag.get_text(strip=True) if rating_tag else ""
-
-            # 暂时获取列表页的基础信息作为兜底
-            list_rated = ""
-            star_div = item.find("div", class_="star")
-            if star_div:
-                m = self.rating_count_pattern.search(star_div.get_text())
-                if m:
-                    list_rated = m.group(1)
-
-            # 列表页的简介通常只是短评(quote)，不是真正的简介
-            quote_tag = item.find("span", class_="inq")
-            short_quote = quote_tag.get_text(strip=True) if quote_tag else ""
-
-            # 解析列表页的元数据 (年份/国家/类型)
-            list_year = list_country = list_category = ""
-            list_directors = list_actors = ""
-            
-            bd_div = item.find("div", class_="bd")
-            if bd_div:
-                p_tag = bd_div.find("p")
-                if p_tag:
-                    raw_text = str(p_tag)
-                    parts = re.split(r"<br\s*/?>", raw_text)
-                    if len(parts) >= 1:
-                        line1 = BeautifulSoup(parts[0], "html.parser").get_text(strip=True)
-                        if "导演:" in line1:
-                            d_parts = line1.split("主演:")
-                            list_directors = d_parts[0].replace("导演:", "").strip()
-                            if len(d_parts) > 1:
-                                list_actors = d_parts[1].strip()
-                    if len(parts) >= 2:
-                        line2 = BeautifulSoup(parts[1], "html.parser").get_text(strip=True)
-                        m = self.meta_pattern.search(line2)
-                        if m:
-                            list_year = m.group(1).strip()
-                            list_country = m.group(2).strip()
-                            list_category = m.group(3).strip()
+            if self._is_known(item["info_link"]):
+                self.skipped_details += 1
+                record = self._refresh_record(item["info_link"], item["score"], item["rated"])
+                if record:
+                    records.append(record)
+                continue
 
             # --- 关键修改：进入详情页抓取完整信息 ---
-            logger.debug(f"  > Fetching details for {cname} ...")
-            details = self._get_movie_details(info_link)
-            
-            # 合并逻辑：优先使用详情页信息，列表页信息兜底
-            final_record = {
-                "info_link": info_link,
-                "pic_link": pic_link,
-                "cname": cname,
-                "score": score,
-                "rated": details["rated"] if details["rated"] else list_rated,
-                # 简介：如果有详情页简介则用详情页，否则用 Quote，实在没有为空
-                "introduction": details["introduction"] if details["introduction"] else short_quote,
-                "year_release": details["year"] if details["year"] else list_year,
-                "country": details["country"] if details["country"] else list_country,
-                "category": details["category"] if details["category"] else list_category,
-                "directors": details["directors"] if details["directors"] else list_directors,
-                "actors": details["actors"] if details["actors"] else list_actors,
-            }
-
-            records.append(final_record)
-
+            details = self._cached_details(item["info_link"])
+            if details is None:
+                logger.debug(f"  > Fetching details for {item['cname']} ...")
+                details = self._get_movie_details(item["info_link"])
+            records.append(self._record_from_list(item, details))
         return records
 
+    def _parse_list(self, html: str) -> List[Dict[str, str]]:
+        """解析 Top250 列表页，返回列表页上的基础信息 (不抓取详情)."""
+        return self.parser.parse_list(html)
+
+    @staticmethod
+    def _record_from_list(item: Dict[str, str], details: Dict[str, str]) -> Dict[str, str]:
+        # 合并逻辑：优先使用详情页信息，列表页信息兜底
+        return {
+            "info_link": item["info_link"],
+            "pic_link": item["pic_link"],
+            "cname": item["cname"],
+            "score": item["score"],
+            "rated": details["rated"] if details["rated"] else item["rated"],
+            # 简介：如果有详情页简介则用详情页，否则用 Quote，实在没有为空
+            "introduction": details["introduction"] if details["introduction"] else item["quote"],
+            "year_release": details["year"] if details["year"] else item["year"],
+            "country": details["country"] if details["country"] else item["country"],
+            "category": details["category"] if details["category"] else item["category"],
+            "directors": details["directors"] if details["directors"] else item["directors"],
+            "actors": details["actors"] if details["actors"] else item["actors"],
+        }
+
 
 __all__ = ["DoubanSpider"]
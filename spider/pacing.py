@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from utils.logger import logger
+
+# 视为"服务器在限流/过载"的状态码
+THROTTLE_STATUSES = frozenset({403, 429, 500, 502, 503, 504})
+# 退避的起点 (秒): 间隔为 0 时乘性退避也要生效
+MIN_BACKOFF = 0.05
+
+
+class AdaptivePacer:
+    """AIMD 请求节奏控制.
+
+    - 加性增: 连续 increase_every 次健康响应后，请求间隔减少 decrease_step 秒、并发 +1
+    - 乘性减: 遇到限流状态码或延迟突增 (超过 EWMA 的 latency_factor 倍且超过 spike_floor 秒) 时，间隔乘以 backoff、并发减半
+    请求之间按 interval 排队 (预约式，与 TokenBucket 相同)，并发由 in_flight 上限控制 (async 引擎).
+    """
+
+    def __init__(self, interval: float = 1.0, min_interval: float = 0.2, max_interval: float = 30.0,
+                 concurrency: int = 1, max_concurrency: int = 8, increase_every: int = 5,
+                 decrease_step: float = 0.1, backoff: float = 2.0, latency_factor: float = 3.0,
+                 spike_floor: float = 1.0) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min(max(interval, min_interval), max_interval)
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = min(max(1, concurrency), self.max_concurrency)
+        self.increase_every = increase_every
+        self.decrease_step = decrease_step
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.spike_floor = spike_floor # 低于该值的延迟波动 (网络抖动) 不视为突增
+        self.latency_ewma: Optional[float] = None
+        self._samples = 0
+        self._streak = 0
+        self._next_slot = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._slots = threading.Condition() # 线程版并发上限 (pipeline 引擎)
+        self._cond: Optional[asyncio.Condition] = None
+        self._cond_loop = None
+
+    # --- 节奏 ---
+    def reserve(self) -> float:
+        """预约下一个请求时刻，返回需要等待的秒数."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+    def wait(self) -> None:
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    # --- 反馈 ---
+    def on_success(self, latency: float) -> None:
+        with self._lock:
+            spike = (self._samples >= 5 and self.latency_ewma is not None
+                     and latency > max(self.latency_factor * self.latency_ewma, self.spike_floor))
+            self._samples += 1
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            if spike:
+                self._decrease("latency spike")
+                return
+            self._streak += 1
+            if self._streak >= self.increase_every:
+                self._streak = 0
+                self.interval = max(self.min_interval, self.interval - self.decrease_step)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+    def on_throttle(self, reason: str = "throttled") -> None:
+        with self._lock:
+            self._decrease(reason)
+
+    def _decrease(self, reason: str) -> None:
+        self._streak = 0
+        self.interval = min(self.max_interval, max(self.interval, self.min_interval, MIN_BACKOFF) * self.backoff)
+        self.concurrency = max(1, self.concurrency // 2)
+        logger.warning(f"Pacing backoff ({reason}): interval={self.interval:.2f}s, concurrency={self.concurrency}")
+
+    # --- 并发上限 (async 引擎) ---
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._cond_loop is not loop: # 每次 asyncio.run 都是新的事件循环
+            self._cond = asyncio.Condition()
+            self._cond_loop = loop
+        return self._cond
+
+    async def acquire_slot(self) -> None:
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self._in_flight < self.concurrency)
+            self._in_flight += 1
+
+    async def release_slot(self) -> None:
+        cond = self._condition()
+        async with cond:
+            self._in_flight -= 1
+            cond.notify_all()
+
+    def acquire_slot_blocking(self) -> None:
+        with self._slots:
+            self._slots.wait_for(lambda: self._in_flight < self.concurrency)
+            self._in_flight += 1
+
+    def release_slot_blocking(self) -> None:
+        with self._slots:
+            self._in_flight -= 1
+            self._slots.notify_all()
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {"interval": round(self.interval, 3), "concurrency": self.concurrency,
+                    "latency_ewma": round(self.latency_ewma or 0.0, 3)}
+
+
+class CircuitBreaker:
+    """熔断器: 连续失败 failure_threshold 次后断开，暂停所有请求 cooldown 秒.
+
+    冷却结束后进入半开状态，只放行一个探测请求: 成功则恢复，失败则再次断开且冷却时间翻倍 (不超过 max_cooldown).
+    恢复后连续成功 failure_threshold * 2 次，冷却时间才回到初始值.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 600.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = "closed"
+        self.trips = 0
+        self._cooldown = cooldown
+        self._failures = 0
+        self._successes = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def pause_seconds(self) -> float:
+        """当前请求需要等待的秒数；0 表示可以发送."""
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            now = time.monotonic()
+            if self.state == "open":
+                if now < self._open_until:
+                    return self._open_until - now
+                self.state = "half_open"
+                self._probing = False
+            if self._probing: # 半开状态下已有探测请求在进行
+                return 0.5
+            self._probing = True
+            return 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._successes += 1
+            if self.state != "closed":
+                logger.info("Circuit closed: server healthy again, resuming crawl.")
+                self._successes = 0
+            self.state = "closed"
+            self._probing = False
+            if self._successes >= self.failure_threshold * 2:
+                self._cooldown = self.base_cooldown
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._successes = 0
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self.trips += 1
+                self._probing = False
+                self._failures = 0
+                self._open_until = time.monotonic() + self._cooldown
+                logger.warning(f"Circuit open: pausing crawl for {self._cooldown:.1f}s.")
+                self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+
+
+class RequestPacing:
+    """把 AdaptivePacer 与 CircuitBreaker 组合为请求前等待 / 请求后反馈两个钩子."""
+
+    def __init__(self, pacer: AdaptivePacer, breaker: Optional[CircuitBreaker] = None) -> None:
+        self.pacer = pacer
+        self.breaker = breaker or CircuitBreaker()
+
+    def before_request(self) -> None:
+        while True:
+            pause = self.breaker.pause_seconds()
+            if not pause:
+                break
+            time.sleep(pause)
+        self.pacer.wait()
+
+    async def before_request_async(self) -> None:
+        while True:
+            pause = self.breaker.pause_seconds()
+            if not pause:
+                break
+            await asyncio.sleep(pause)
+        await self.pacer.wait_async()
+
+    def on_result(self, status: Optional[int], latency: float) -> None:
+        """status 为 None 表示网络异常 (超时、连接重置等)."""
+        if status is None or status in THROTTLE_STATUSES:
+            self.pacer.on_throttle(f"HTTP {status}" if status else "network error")
+            self.breaker.record_failure()
+        else:
+            self.pacer.on_success(latency)
+            self.breaker.record_success()
+
+    def snapshot(self) -> Dict[str, float]:
+        return dict(self.pacer.snapshot(), circuit=self.breaker.state, trips=self.breaker.trips)
+
+
+__all__ = ["AdaptivePacer", "CircuitBreaker", "RequestPacing", "THROTTLE_STATUSES"]
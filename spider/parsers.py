@@ -0,0 +1,338 @@
+import re
+from typing import Dict, List
+
+from bs4 import BeautifulSoup, CData, NavigableString, SoupStrainer
+
+try: # lxml 为可选依赖，未安装时回退到 BeautifulSoup
+    import lxml.html
+except ImportError: # pragma: no cover
+    lxml = None
+
+# 例如: "123456 人评价"
+RATING_COUNT_PATTERN = re.compile(r"(\d+)\s*人评价") # 匹配评价人数
+# 例如: "1994 / 美国 / 剧情 犯罪" (Top250 标准格式)
+META_PATTERN = re.compile(r"(\d{4})\s*/\s*([^/]+)\s*/\s*(.+)") # 匹配年份、国家、类型
+BR_PATTERN = re.compile(r"<br\s*/?>")
+
+LIST_FIELDS = ("info_link", "pic_link", "cname", "score", "rated", "quote",
+               "year", "country", "category", "directors", "actors")
+DETAIL_FIELDS = ("introduction", "country", "year", "category", "score", "rated", "directors", "actors")
+
+
+def empty_details() -> Dict[str, str]:
+    return {f: "" for f in DETAIL_FIELDS}
+
+
+def _split_credits(line1: str, item: Dict[str, str]) -> None:
+    """解析 "导演: xxx 主演: yyy" 这一行."""
+    if "导演:" in line1:
+        d_parts = line1.split("主演:")
+        item["directors"] = d_parts[0].replace("导演:", "").strip()
+        if len(d_parts) > 1:
+            item["actors"] = d_parts[1].strip()
+
+
+def _split_meta(line2: str, item: Dict[str, str]) -> None:
+    """解析 "1994 / 美国 / 剧情 犯罪" 这一行."""
+    m = META_PATTERN.search(line2)
+    if m:
+        item["year"] = m.group(1).strip()
+        item["country"] = m.group(2).strip()
+        item["category"] = m.group(3).strip()
+
+
+def _info_country_year(text: str, details: Dict[str, str]) -> None:
+    """从 #info 的纯文本中提取制片国家/地区与年份."""
+    # 制片国家/地区
+    if "制片国家/地区:" in text:
+        parts = text.split("制片国家/地区:")
+        if len(parts) > 1:
+            details["country"] = parts[1].split("\n")[0].strip()
+    # 上映年份 (优先从 JSON 或 List 获取，这里作为补充)
+    if "上映日期:" in text or "首播:" in text:
+        y_parts = re.findall(r"(\d{4})", text)
+        if y_parts:
+            details["year"] = y_parts[0]
+
+
+class PageParser:
+    """页面解析器接口. 所有实现对同一页面必须输出完全相同的字典."""
+
+    name = ""
+
+    def parse_list(self, html: str) -> List[Dict[str, str]]:
+        """解析 Top250 列表页，返回 LIST_FIELDS 字段的条目列表."""
+        raise NotImplementedError
+
+    def parse_details(self, html: str) -> Dict[str, str]:
+        """解析电影详情页，返回 DETAIL_FIELDS 字段."""
+        raise NotImplementedError
+
+
+class SoupParser(PageParser):
+    """BeautifulSoup (html.parser) 实现.
+
+    fast=False 为原有逻辑: 整页建树，列表页每个条目的两行信息再各建一棵树；
+    fast=True 为快速路径: 列表页用 SoupStrainer 只为 div.item 建树，并直接在 <p> 的子节点上按 <br> 分行；
+    详情页只截取 #info 到剧情简介之间的片段来解析.
+    """
+
+    def __init__(self, fast: bool = True) -> None:
+        self.fast = fast
+        self.name = "soup-fast" if fast else "soup"
+
+    # --- 列表页 ---
+    def parse_list(self, html: str) -> List[Dict[str, str]]:
+        if self.fast:
+            soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("div", class_="item"))
+        else:
+            soup = BeautifulSoup(html, "html.parser")
+        return [self._parse_item(item) for item in soup.find_all("div", class_="item")]
+
+    def _parse_item(self, item) -> Dict[str, str]:
+        record = dict.fromkeys(LIST_FIELDS, "")
+
+        link_tag = item.find("a", href=True)
+        record["info_link"] = link_tag["href"] if link_tag else ""
+
+        img_tag = item.find("img")
+        record["pic_link"] = img_tag.get("src", "") if img_tag else ""
+
+        title_tag = item.find("span", class_="title")
+        record["cname"] = title_tag.get_text(strip=True) if title_tag else ""
+
+        rating_tag = item.find("span", class_="rating_num")
+        record["score"] = rating_tag.get_text(strip=True) if rating_tag else ""
+
+        # 暂时获取列表页的基础信息作为兜底
+        star_div = item.find("div", class_="star")
+        if star_div:
+            m = RATING_COUNT_PATTERN.search(star_div.get_text())
+            if m:
+                record["rated"] = m.group(1)
+
+        # 列表页的简介通常只是短评(quote)，不是真正的简介
+        quote_tag = item.find("span", class_="inq")
+        record["quote"] = quote_tag.get_text(strip=True) if quote_tag else ""
+
+        # 解析列表页的元数据 (导演/主演, 年份/国家/类型)
+        bd_div = item.find("div", class_="bd")
+        p_tag = bd_div.find("p") if bd_div else None
+        if p_tag:
+            lines = self._lines(p_tag)
+            if len(lines) >= 1:
+                _split_credits(lines[0], record)
+            if len(lines) >= 2:
+                _split_meta(lines[1], record)
+        return record
+
+    def _lines(self, p_tag) -> List[str]:
+        """按 <br> 将 <p> 切分为若干行，每行取 get_text(strip=True)."""
+        if not self.fast:
+            parts = BR_PATTERN.split(str(p_tag))
+            return [BeautifulSoup(part, "html.parser").get_text(strip=True) for part in parts[:2]]
+        lines = [""]
+        for node in p_tag.children:
+            if isinstance(node, NavigableString):
+                if type(node) in (NavigableString, CData): # 跳过注释等
+                    lines[-1] += node.strip()
+            elif node.name == "br":
+                lines.append("")
+            else:
+                lines[-1] += node.get_text(strip=True)
+        return lines
+
+    # --- 详情页 ---
+    def parse_details(self, html: str) -> Dict[str, str]:
+        details = empty_details()
+        soup = BeautifulSoup(self._detail_region(html) if self.fast else html, "html.parser")
+
+        # 1. 简介 (v:summary)
+        related_info = soup.find("div", class_="related-info")
+        if related_info:
+            span = related_info.find("span", property="v:summary")
+            if span:
+                # 处理可能存在的 <br>
+                details["introduction"] = span.get_text(strip=True)
+
+        # 2. Meta 信息 (#info)
+        info_div = soup.find("div", id="info")
+        if info_div:
+            _info_country_year(info_div.get_text(), details)
+
+        # 3. 评分 (v:average) 与评价人数 (v:votes)
+        score_tag = soup.find(property="v:average")
+        if score_tag:
+            details["score"] = score_tag.get_text(strip=True)
+        vote_tag = soup.find("span", property="v:votes")
+        if vote_tag:
+            details["rated"] = vote_tag.get_text(strip=True)
+
+        # 4. 类型 (v:genre) -  获取完整类型列表
+        genre_tags = soup.find_all("span", property="v:genre")
+        if genre_tags:
+            details["category"] = " ".join([t.get_text(strip=True) for t in genre_tags])
+
+        # 5. 导演 (v:directedBy)
+        bus = soup.find_all("a", rel="v:directedBy")
+        if bus:
+            details["directors"] = " ".join([b.get_text(strip=True) for b in bus])
+
+        # 6. 主演 (v:starring)
+        acts = soup.find_all("a", rel="v:starring")
+        if acts:
+            details["actors"] = " ".join([a.get_text(strip=True) for a in acts[:5]]) # 仅取前5
+        return details
+
+    @staticmethod
+    def _detail_region(html: str) -> str:
+        """截取详情页中需要的片段: 从 #info 开始 (其后依次为评分区与剧情简介)，到简介所在的 div 结束.
+
+        找不到 #info 时返回整页，保证结果与整页解析一致.
+        """
+        pos = html.find('id="info"')
+        if pos < 0:
+            return html
+        start = html.rfind("<", 0, pos)
+        summary = html.find('property="v:summary"', pos)
+        end = html.find("</div>", summary) if summary >= 0 else -1
+        return html[start:end + len("</div>")] if end >= 0 else html[start:]
+
+
+class LxmlParser(PageParser):
+    """lxml 实现 (C 语言解析 + XPath)，输出与 SoupParser 相同."""
+
+    name = "lxml"
+
+    def __init__(self) -> None:
+        if lxml is None:
+            raise ImportError("lxml is not installed")
+
+    @staticmethod
+    def _doc(html: str):
+        try:
+            return lxml.html.fromstring(html)
+        except ValueError: # 带 XML 编码声明的 str 需要以 bytes 解析
+            return lxml.html.fromstring(html.encode("utf-8"))
+
+    @staticmethod
+    def _text(el, strip: bool = True) -> str:
+        texts = el.xpath(".//text()")
+        return "".join(t.strip() for t in texts) if strip else "".join(texts)
+
+    @staticmethod
+    def _first(el, path: str):
+        found = el.xpath(path)
+        return found[0] if found else None
+
+    @staticmethod
+    def _has_class(name: str) -> str:
+        return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+    # --- 列表页 ---
+    def parse_list(self, html: str) -> List[Dict[str, str]]:
+        if not html.strip():
+            return []
+        doc = self._doc(html)
+        return [self._parse_item(item) for item in doc.xpath(f"//div[{self._has_class('item')}]")]
+
+    def _parse_item(self, item) -> Dict[str, str]:
+        record = dict.fromkeys(LIST_FIELDS, "")
+        link = self._first(item, ".//a[@href]")
+        record["info_link"] = link.get("href") if link is not None else ""
+        img = self._first(item, ".//img")
+        record["pic_link"] = img.get("src", "") if img is not None else ""
+        title = self._first(item, f".//span[{self._has_class('title')}]")
+        record["cname"] = self._text(title) if title is not None else ""
+        rating = self._first(item, f".//span[{self._has_class('rating_num')}]")
+        record["score"] = self._text(rating) if rating is not None else ""
+
+        star = self._first(item, f".//div[{self._has_class('star')}]")
+        if star is not None:
+            m = RATING_COUNT_PATTERN.search(self._text(star, strip=False))
+            if m:
+                record["rated"] = m.group(1)
+
+        quote = self._first(item, f".//span[{self._has_class('inq')}]")
+        record["quote"] = self._text(quote) if quote is not None else ""
+
+        bd = self._first(item, f".//div[{self._has_class('bd')}]")
+        p = self._first(bd, ".//p") if bd is not None else None
+        if p is not None:
+            lines = self._lines(p)
+            if len(lines) >= 1:
+                _split_credits(lines[0], record)
+            if len(lines) >= 2:
+                _split_meta(lines[1], record)
+        return record
+
+    def _lines(self, p) -> List[str]:
+        lines = [(p.text or "").strip()]
+        for child in p:
+            if not isinstance(child.tag, str): # 注释 / 处理指令
+                pass
+            elif child.tag == "br":
+                lines.append("")
+            else:
+                lines[-1] += self._text(child)
+            lines[-1] += (child.tail or "").strip()
+        return lines
+
+    # --- 详情页 ---
+    def parse_details(self, html: str) -> Dict[str, str]:
+        details = empty_details()
+        if not html.strip():
+            return details
+        doc = self._doc(html)
+
+        related = self._first(doc, f"//div[{self._has_class('related-info')}]")
+        if related is not None:
+            span = self._first(related, ".//span[@property='v:summary']")
+            if span is not None:
+                details["introduction"] = self._text(span)
+
+        info = self._first(doc, "//div[@id='info']")
+        if info is not None:
+            _info_country_year(self._text(info, strip=False), details)
+
+        score = self._first(doc, "//*[@property='v:average']")
+        if score is not None:
+            details["score"] = self._text(score)
+
+        votes = self._first(doc, "//span[@property='v:votes']")
+        if votes is not None:
+            details["rated"] = self._text(votes)
+
+        genres = doc.xpath("//span[@property='v:genre']")
+        if genres:
+            details["category"] = " ".join(self._text(g) for g in genres)
+
+        rel = "contains(concat(' ', normalize-space(@rel), ' '), ' {} ')"
+        directors = doc.xpath(f"//a[{rel.format('v:directedBy')}]")
+        if directors:
+            details["directors"] = " ".join(self._text(d) for d in directors)
+
+        actors = doc.xpath(f"//a[{rel.format('v:starring')}]")
+        if actors:
+            details["actors"] = " ".join(self._text(a) for a in actors[:5]) # 仅取前5
+        return details
+
+
+PARSERS = ("auto", "lxml", "soup-fast", "soup")
+
+
+def get_parser(name: str = "auto") -> PageParser:
+    """按名称创建解析器. auto: 安装了 lxml 时用 lxml，否则用 BeautifulSoup 快速路径."""
+    if name == "auto":
+        name = "lxml" if lxml is not None else "soup-fast"
+    if name == "lxml":
+        return LxmlParser()
+    if name == "soup-fast":
+        return SoupParser(fast=True)
+    if name == "soup":
+        return SoupParser(fast=False)
+    raise ValueError(f"Unknown parser: {name}")
+
+
+__all__ = ["PageParser", "SoupParser", "LxmlParser", "get_parser", "empty_details",
+           "PARSERS", "LIST_FIELDS", "DETAIL_FIELDS"]
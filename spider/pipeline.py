@@ -0,0 +1,399 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from spider.parsers import PageParser, empty_details, get_parser
+from utils.logger import logger
+
+if TYPE_CHECKING: # 仅用于类型提示，避免循环导入
+    from spider.douban_spider import DoubanSpider
+
+_STOP = object() # 队列结束标记
+
+# ---------------------------------------------------------------------------
+# 解析进程中执行的函数 (必须是模块级函数才能被 pickle)
+# ---------------------------------------------------------------------------
+_parsers: Dict[str, PageParser] = {}
+
+
+def _parser(name: str) -> PageParser:
+    if name not in _parsers: # 每个进程只创建一次解析器
+        _parsers[name] = get_parser(name)
+    return _parsers[name]
+
+
+def parse_list_html(parser_name: str, html: str) -> Tuple[List[Dict[str, str]], float]:
+    """解析列表页，返回 (条目, 耗时秒)."""
+    started = time.perf_counter()
+    return _parser(parser_name).parse_list(html), time.perf_counter() - started
+
+
+def parse_detail_html(parser_name: str, html: str) -> Tuple[Dict[str, str], float]:
+    """解析详情页，返回 (详情字段, 耗时秒)；解析失败时返回空字段."""
+    started = time.perf_counter()
+    try:
+        details = _parser(parser_name).parse_details(html)
+    except Exception as e:
+        logger.warning(f"Failed to parse details: {e}")
+        details = empty_details()
+    return details, time.perf_counter() - started
+
+
+@dataclass
+class StageMetrics:
+    """单个阶段的统计: 处理条数、忙碌时间与输入队列深度 (当前/峰值)."""
+    name: str
+    items: int = 0
+    busy_seconds: float = 0.0
+    max_queue: int = 0
+    source: Optional[queue.Queue] = field(default=None, repr=False) # 该阶段的输入队列
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, seconds: float, items: int = 1) -> None:
+        with self._lock:
+            self.items += items
+            self.busy_seconds += seconds
+            if self.source is not None:
+                self.max_queue = max(self.max_queue, self.source.qsize())
+
+    def as_dict(self, elapsed: float) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "items": self.items,
+                "per_sec": round(self.items / elapsed, 2) if elapsed > 0 else 0.0,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "queue": self.source.qsize() if self.source is not None else 0,
+                "max_queue": self.max_queue,
+            }
+
+
+class _Page:
+    """一个列表页及其详情页的组装状态."""
+
+    def __init__(self, index: int, url: str, items: List[Dict], links: List[str], saved: bool = False) -> None:
+        self.index = index
+        self.url = url
+        self.items = items
+        self.links = links
+        self.saved = saved # 续爬时已入库的页面: 只占位保持顺序，不再写入
+        self.details: List[Optional[Dict[str, str]]] = [None] * len(items)
+        self.pending = 0
+        self.lock = threading.Lock()
+
+
+def start_parse_pool(parse_workers: int, parser_name: str) -> Optional[ProcessPoolExecutor]:
+    """创建解析进程池并预先启动解析进程 (应在启动其他线程之前调用: fork 时进程内只有当前线程)."""
+    if parse_workers <= 0:
+        return None
+    pool = ProcessPoolExecutor(max_workers=parse_workers)
+    list(pool.map(_parser, [parser_name] * parse_workers))
+    return pool
+
+
+class CrawlPipeline:
+    """分阶段的抓取流水线: 抓取 -> 解析 -> 写入，阶段之间用有界队列连接.
+
+    - 抓取: fetch_workers 个 I/O 线程请求详情页 (限速/自适应节奏与其他引擎相同)
+    - 解析: parse_workers 个进程解析 HTML (0 表示在调度线程内解析)，CPU 密集的解析不再阻塞网络 I/O
+    - 写入: 单个写线程按列表页顺序组装记录，攒够 batch_size 条后调用一次 save_callback
+    列表页由调用线程依次抓取 (Tag 模式的下一页起点依赖上一页条目数)，与上一页的详情页抓取重叠进行.
+    队列满时上游阻塞 (背压)，内存占用与 queue_size 成正比.
+    传入 pool 时使用该共享解析进程池 (由调用方创建和关闭)，否则每次运行自建一个.
+    """
+
+    def __init__(self, spider: "DoubanSpider", fetch_workers: int = 4, parse_workers: int = 2,
+                 queue_size: int = 64, batch_size: int = 50, log_interval: float = 10.0,
+                 pool: Optional[ProcessPoolExecutor] = None) -> None:
+        self.spider = spider
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(0, parse_workers)
+        self.batch_size = max(1, batch_size)
+        self.log_interval = log_interval
+        self.fetch_q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.parse_q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.write_q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stages = {
+            "fetch": StageMetrics("fetch", source=self.fetch_q),
+            "parse": StageMetrics("parse", source=self.parse_q),
+            "write": StageMetrics("write", source=self.write_q),
+        }
+        self._max_inflight = max(1, self.parse_workers) * 2 # 提交给进程池但未完成的解析任务上限
+        self._inflight = threading.BoundedSemaphore(self._max_inflight)
+        self._consumers: Dict[int, List[threading.Thread]] = {} # 队列 -> 消费它的阶段线程
+        self._shared_pool = pool
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._error: Optional[BaseException] = None
+        self._started = 0.0
+
+    # ------------------------------------------------------------------
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {name: stage.as_dict(elapsed) for name, stage in self.stages.items()}
+
+    def run(self, progress_callback=None, save_callback: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict[str, str]]:
+        self._started = time.perf_counter()
+        records: List[Dict[str, str]] = []
+        if self._shared_pool is not None:
+            self._pool = self._shared_pool
+        else: # 在启动阶段线程之前创建好解析进程
+            self._pool = start_parse_pool(self.parse_workers, self.spider.parser.name)
+        threads = [threading.Thread(target=self._guard, args=(self._fetch_worker,), name=f"pipeline-fetch-{i}", daemon=True)
+                   for i in range(self.fetch_workers)]
+        threads.append(threading.Thread(target=self._guard, args=(self._parse_dispatcher,), name="pipeline-parse", daemon=True))
+        writer = threading.Thread(target=self._guard, args=(self._writer, save_callback, records), name="pipeline-write", daemon=True)
+        self._consumers = {id(self.fetch_q): threads[:-1], id(self.parse_q): threads[-1:], id(self.write_q): [writer]}
+        for t in threads + [writer]:
+            t.start()
+        try:
+            if self.spider.tag:
+                self._produce_tag(progress_callback)
+            else:
+                self._produce_top250(progress_callback)
+        except BaseException as e:
+            self._error = self._error or e
+        finally:
+            for _ in range(self.fetch_workers):
+                self._put(self.fetch_q, _STOP)
+            for t in threads + [writer]:
+                t.join()
+            if self._pool is not None and self._pool is not self._shared_pool:
+                self._pool.shutdown()
+        logger.info(f"Pipeline stats: {self.metrics()}")
+        if self._error is not None:
+            raise self._error
+        return records
+
+    def _guard(self, target, *args) -> None:
+        """阶段线程出错时记录异常并让生产者停止."""
+        try:
+            target(*args)
+        except BaseException as e:
+            logger.error(f"Pipeline stage {threading.current_thread().name} failed: {e}")
+            self._error = self._error or e
+
+    def _put(self, q: queue.Queue, item: Any) -> None:
+        """阻塞放入 (背压)；流水线出错且下游阶段已经退出时丢弃."""
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._error is not None and not any(t.is_alive() for t in self._consumers.get(id(q), ())):
+                    return
+
+    def _take(self, q: queue.Queue) -> Any:
+        """阻塞取出；流水线出错且队列已空时返回结束标记."""
+        while True:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                if self._error is not None:
+                    return _STOP
+
+    # ------------------------------------------------------------------
+    # 生产者: 列表页
+    # ------------------------------------------------------------------
+    def _produce_top250(self, progress_callback) -> None:
+        spider = self.spider
+        spider.headers.update({"Referer": "https://movie.douban.com/top250"})
+        for i in range(spider.pages):
+            if self._error is not None:
+                break
+            if progress_callback:
+                progress_callback(i + 1, spider.pages)
+            url = f"{spider.base_url}?start={i * 25}"
+            logger.info(f"Fetching {url} ...")
+            items = spider._cached_list(url)
+            if items is None:
+                html = self._fetch(url)
+                items = self._parse_list(html) if html else []
+                spider._remember_list(url, items, [item["info_link"] for item in items])
+            self._submit_page(_Page(i, url, items, [item["info_link"] for item in items], spider._page_saved(url)))
+
+    def _produce_tag(self, progress_callback) -> None:
+        spider = self.spider
+        spider.headers.update({"Referer": spider.base_url})
+        start, seen, index = spider.start, 0, 0
+        while seen < spider.limit and self._error is None:
+            url = spider._tag_api_url(start)
+            logger.info(f"Fetching API {url} ...")
+            if progress_callback:
+                progress_callback(seen, spider.limit)
+            subjects = spider._cached_list(url)
+            if subjects is None:
+                content = self._fetch(url)
+                if not content:
+                    logger.warning("Empty response from API")
+                    break
+                subjects = spider._parse_json_items(content)
+                spider._remember_list(url, subjects, [sub.get("url", "") for sub in subjects])
+            if not subjects:
+                logger.info("No more data in response")
+                break
+            self._submit_page(_Page(index, url, subjects, [sub.get("url", "") for sub in subjects], spider._page_saved(url)))
+            index += 1
+            seen += len(subjects)
+            start += len(subjects)
+        if progress_callback:
+            progress_callback(seen, spider.limit)
+
+    def _submit_page(self, page: _Page) -> None:
+        """已知/已缓存的详情直接填入，其余详情页交给抓取线程；无需抓取的页面直接进入写入队列."""
+        spider = self.spider
+        jobs = []
+        if not page.saved:
+            for pos, link in enumerate(page.links):
+                if not link:
+                    page.details[pos] = empty_details()
+                elif spider._is_known(link):
+                    spider.skipped_details += 1
+                    page.details[pos] = empty_details()
+                else:
+                    cached = spider._cached_details(link)
+                    if cached is not None:
+                        page.details[pos] = cached
+                    else:
+                        jobs.append((page, pos, link))
+        page.pending = len(jobs)
+        if not jobs:
+            self._put(self.write_q, page)
+        for job in jobs:
+            self._put(self.fetch_q, job)
+
+    def _fetch(self, url: str) -> str:
+        """抓取单个 URL: 自适应节奏或按域名令牌桶限速都由 _get 在每次尝试 (包括重试) 前处理."""
+        spider = self.spider
+        started = time.perf_counter()
+        html = spider._get(url, limited=True)
+        self.stages["fetch"].record(time.perf_counter() - started)
+        return html
+
+    def _parse_list(self, html: str) -> List[Dict[str, str]]:
+        if self._pool is None:
+            items, seconds = parse_list_html(self.spider.parser.name, html)
+        else:
+            items, seconds = self._pool.submit(parse_list_html, self.spider.parser.name, html).result()
+        self.stages["parse"].record(seconds)
+        return items
+
+    # ------------------------------------------------------------------
+    # 阶段线程
+    # ------------------------------------------------------------------
+    def _fetch_worker(self) -> None:
+        while True:
+            job = self._take(self.fetch_q)
+            if job is _STOP:
+                self._put(self.parse_q, _STOP)
+                return
+            page, pos, url = job
+            logger.debug(f"  > Fetching details for {url} ...")
+            html = ""
+            if self._error is None:
+                pacer = self.spider.pacing.pacer if self.spider.pacing else None
+                if pacer: # 自适应并发上限 (<= fetch_workers)
+                    pacer.acquire_slot_blocking()
+                try:
+                    html = self._fetch(url)
+                finally:
+                    if pacer:
+                        pacer.release_slot_blocking()
+            self._put(self.parse_q, (page, pos, url, html))
+
+    def _parse_dispatcher(self) -> None:
+        stopped = 0
+        while stopped < self.fetch_workers:
+            job = self._take(self.parse_q)
+            if job is _STOP:
+                stopped += 1
+                continue
+            page, pos, url, html = job
+            if not html:
+                self._complete(page, pos, url, html, empty_details())
+            elif self._pool is None:
+                details, seconds = parse_detail_html(self.spider.parser.name, html)
+                self.stages["parse"].record(seconds)
+                self._complete(page, pos, url, html, details)
+            else:
+                self._inflight.acquire()
+                future = self._pool.submit(parse_detail_html, self.spider.parser.name, html)
+                future.add_done_callback(lambda f, job=job: self._parsed(f, job))
+        for _ in range(self._max_inflight): # 等待进程池中剩余的解析任务 (含回调) 全部完成，再通知写线程结束
+            self._inflight.acquire()
+        self._put(self.write_q, _STOP)
+
+    def _parsed(self, future: Future, job) -> None:
+        page, pos, url, html = job
+        try:
+            try:
+                details, seconds = future.result()
+                self.stages["parse"].record(seconds)
+            except BaseException as e: # 进程池异常 (例如子进程崩溃)
+                logger.warning(f"Failed to parse details for {url}: {e}")
+                details = empty_details()
+            self._complete(page, pos, url, html, details)
+        finally:
+            self._inflight.release()
+
+    def _complete(self, page: _Page, pos: int, url: str, html: str, details: Dict[str, str]) -> None:
+        self.spider._remember_details(url, html, details)
+        with page.lock:
+            page.details[pos] = details
+            page.pending -= 1
+            done = page.pending == 0
+        if done:
+            self._put(self.write_q, page)
+
+    def _writer(self, save_callback, records: List[Dict[str, str]]) -> None:
+        """按页序组装记录并批量写入；批次写入成功后才把其中的列表页标记为已入库."""
+        waiting: Dict[int, _Page] = {}
+        next_index = 0
+        buffer: List[Dict[str, str]] = []
+        buffered_pages: List[str] = []
+        last_log = time.perf_counter()
+
+        def flush() -> None:
+            if save_callback and buffer:
+                started = time.perf_counter()
+                logger.info(f"  > Saving {len(buffer)} records...")
+                save_callback(list(buffer))
+                self.stages["write"].record(time.perf_counter() - started, len(buffer))
+            for url in buffered_pages:
+                self.spider._mark_saved(url)
+            records.extend(buffer)
+            buffer.clear()
+            buffered_pages.clear()
+
+        while True:
+            page = self._take(self.write_q)
+            if page is _STOP:
+                break
+            waiting[page.index] = page
+            while next_index in waiting: # 保持列表页顺序
+                ready = waiting.pop(next_index)
+                next_index += 1
+                if ready.saved:
+                    continue
+                buffer.extend(r for r in self._records(ready) if r)
+                buffered_pages.append(ready.url)
+                if len(buffer) >= self.batch_size:
+                    flush()
+            if time.perf_counter() - last_log >= self.log_interval:
+                last_log = time.perf_counter()
+                logger.info(f"Pipeline progress: {self.metrics()}")
+        flush()
+
+    def _records(self, page: _Page) -> List[Optional[Dict[str, str]]]:
+        spider = self.spider
+        if spider.tag:
+            return [spider._record_from_api(sub, d) if not spider._is_known(link)
+                    else spider._refresh_record(link, sub.get("rate", ""))
+                    for sub, link, d in zip(page.items, page.links, page.details)]
+        return [spider._record_from_list(item, d) if not spider._is_known(item["info_link"])
+                else spider._refresh_record(item["info_link"], item["score"], item["rated"])
+                for item, d in zip(page.items, page.details)]
+
+
+__all__ = ["CrawlPipeline", "StageMetrics", "parse_list_html", "parse_detail_html", "start_parse_pool"]
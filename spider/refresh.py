@@ -0,0 +1,77 @@
+import time
+from typing import Dict, List, Optional
+
+from spider.douban_spider import DoubanSpider
+from spider.ratelimit import TokenBucket
+from storage.repository import MovieRepository
+from utils.logger import logger
+
+
+class RefreshScheduler:
+    """按优先级重新抓取已入库电影，保持评分与评价人数新鲜.
+
+    每部电影的上次抓取时间、抓取次数与评分/人数变化次数记录在 <表>__refresh 中 (由 save_all 维护)，
+    下次到期时间由 refresh_interval 决定: 变化越频繁、越热门的电影越早到期。调度器每轮取出最早到期的
+    batch_size 部电影，按 budget_per_hour 均匀发出详情页请求，只把评分与评价人数交给 sink.save_all
+    (UPSERT，没有变化的电影不会改写主表)。抓取失败的电影推迟 retry_delay 秒再试.
+    所有写入 (save_all 与 defer_refresh) 都经由 sink，repo 只用于读取调度信息.
+    """
+
+    def __init__(self, repo: MovieRepository, spider: Optional[DoubanSpider] = None, budget_per_hour: float = 600.0,
+                 batch_size: int = 20, retry_delay: float = 3600.0, sink=None) -> None:
+        self.repo = repo
+        self.spider = spider or DoubanSpider()
+        self.sink = sink or repo # 写入目标: 仓库本身，或与其接口兼容的 IngestClient
+        self.budget_per_hour = budget_per_hour
+        self.batch_size = max(1, batch_size)
+        self.retry_delay = retry_delay
+        self._bucket = TokenBucket(budget_per_hour / 3600.0) # 请求在一小时内均匀分布
+        self.stats: Dict[str, int] = {"requests": 0, "changed": 0, "unchanged": 0, "failed": 0}
+
+    def _refresh(self, movie: Dict) -> Optional[Dict[str, str]]:
+        """抓取一部电影的详情页，返回只含评分与评价人数的更新记录 (失败时返回 None)."""
+        self._bucket.acquire()
+        self.stats["requests"] += 1
+        html = self.spider.get_page(movie["info_link"]) # 只尝试一次: 失败的电影推迟 retry_delay 后再刷新
+        if not html:
+            return None
+        details = self.spider.parse_details(html, movie["info_link"])
+        return {"info_link": movie["info_link"], "score": details.get("score", ""), "rated": details.get("rated", "")}
+
+    def run_once(self, limit: Optional[int] = None) -> int:
+        """处理一批到期的电影，返回本批请求数 (0 表示没有到期的电影)."""
+        due = self.repo.get_refresh_due(min(self.batch_size, limit or self.batch_size))
+        records: List[Dict[str, str]] = []
+        failed: List[int] = []
+        for movie in due:
+            record = self._refresh(movie)
+            if record is None:
+                failed.append(movie["id"])
+            else:
+                records.append(record)
+        if records:
+            result = self.sink.save_all(records)
+            self.stats["changed"] += result["updated"]
+            self.stats["unchanged"] += len(records) - result["updated"]
+        if failed:
+            self.stats["failed"] += len(failed)
+            self.sink.defer_refresh(failed, self.retry_delay)
+        return len(due)
+
+    def run(self, max_requests: Optional[int] = None, forever: bool = False, idle_wait: float = 60.0) -> Dict[str, int]:
+        """持续处理到期电影，直到没有到期的电影 (forever=True 时等待新的到期) 或达到 max_requests."""
+        logger.info(f"Refresh scheduler: budget {self.budget_per_hour:.0f} requests/hour, "
+                    f"{self.repo.get_refresh_summary()['due']} movies due in {self.repo.table_name}")
+        while max_requests is None or self.stats["requests"] < max_requests:
+            remaining = None if max_requests is None else max_requests - self.stats["requests"]
+            if self.run_once(remaining):
+                logger.info(f"Refresh progress: {self.stats}")
+                continue
+            if not forever:
+                break
+            time.sleep(idle_wait)
+        logger.info(f"Refresh finished: {self.stats}")
+        return dict(self.stats)
+
+
+__all__ = ["RefreshScheduler"]
@@ -0,0 +1,295 @@
+import gzip
+import http.client
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from utils.logger import logger
+
+try: # brotli 为可选依赖，未安装时不声明 br 编码
+    import brotli
+except ImportError: # pragma: no cover
+    brotli = None
+
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+MAX_REDIRECTS = 5
+LATENCY_SAMPLES = 4096 # 保留最近多少次请求的耗时用于计算分位数
+
+
+class TransportError(Exception):
+    """HTTP 状态码异常 (>= 400)."""
+
+    def __init__(self, url: str, status: int) -> None:
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+
+
+@dataclass
+class Response:
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    from_cache: bool = False # 由 CachingTransport 直接从磁盘返回 (未联网)
+
+    def text(self) -> str:
+        charset = "utf-8"
+        content_type = self.headers.get("content-type", "")
+        if "charset=" in content_type:
+            charset = content_type.split("charset=", 1)[1].split(";")[0].strip() or charset
+        return self.body.decode(charset, errors="replace")
+
+
+@dataclass
+class TransportStats:
+    """请求统计: 次数、新建/复用连接数、传输字节 (压缩后/解压后) 与耗时."""
+    requests: int = 0
+    errors: int = 0
+    connections_opened: int = 0
+    connections_reused: int = 0
+    bytes_wire: int = 0
+    bytes_body: int = 0
+    connect_seconds: float = 0.0
+    total_seconds: float = 0.0
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES), repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, wire: int, body: int, elapsed: float, connect: float = 0.0, reused: Optional[bool] = None) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes_wire += wire
+            self.bytes_body += body
+            self.total_seconds += elapsed
+            self.connect_seconds += connect
+            self.latencies.append(elapsed)
+            if reused is True:
+                self.connections_reused += 1
+            elif reused is False:
+                self.connections_opened += 1
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def percentile(self, q: float) -> float:
+        """最近 LATENCY_SAMPLES 次请求耗时的 q 分位数 (秒, 最近秩法)，没有样本时为 0."""
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def as_dict(self) -> Dict[str, float]:
+        p50, p99 = self.percentile(0.5), self.percentile(0.99)
+        with self._lock:
+            avg = self.total_seconds / self.requests if self.requests else 0.0
+            return {
+                "requests": self.requests, "errors": self.errors,
+                "connections_opened": self.connections_opened, "connections_reused": self.connections_reused,
+                "bytes_wire": self.bytes_wire, "bytes_body": self.bytes_body,
+                "connect_seconds": round(self.connect_seconds, 3), "total_seconds": round(self.total_seconds, 3),
+                "avg_seconds": round(avg, 3), "p50_seconds": round(p50, 3), "p99_seconds": round(p99, 3),
+            }
+
+
+def decode_body(data: bytes, encoding: str) -> bytes:
+    """按 Content-Encoding 解压响应体."""
+    encoding = (encoding or "").strip().lower()
+    if encoding in ("", "identity"):
+        return data
+    if encoding in ("gzip", "x-gzip"):
+        return gzip.decompress(data)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(data)
+        except zlib.error: # 部分服务器发送不带 zlib 头的原始 deflate 流
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+    if encoding == "br" and brotli:
+        return brotli.decompress(data)
+    raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+
+class Transport:
+    """传输层接口: 发起 GET 请求并返回解压后的 Response."""
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 15.0) -> None:
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.stats = TransportStats()
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class UrllibTransport(Transport):
+    """原有实现: 每个请求一次 urlopen (新建 TCP/TLS 连接)，支持压缩."""
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", ACCEPT_ENCODING)
+        started = time.perf_counter()
+        try:
+            # urllib 只有一个超时参数，取两者中较大的一个
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers),
+                                        timeout=max(self.connect_timeout, self.read_timeout)) as resp:
+                raw = resp.read()
+                resp_headers = {k.lower(): v for k, v in resp.headers.items()}
+                body = decode_body(raw, resp_headers.get("content-encoding", ""))
+                self.stats.record(len(raw), len(body), time.perf_counter() - started, reused=False)
+                return Response(resp.geturl(), resp.status, resp_headers, body)
+        except urllib.error.HTTPError as e:
+            if e.code == 304: # urllib 把 304 当作异常，这里还原为普通响应 (供条件请求使用)
+                self.stats.record(0, 0, time.perf_counter() - started, reused=False)
+                return Response(url, 304, {k.lower(): v for k, v in e.headers.items()}, b"")
+            self.stats.record_error()
+            raise
+        except Exception:
+            self.stats.record_error()
+            raise
+
+
+class PooledTransport(Transport):
+    """基于 http.client 的 keep-alive 连接池.
+
+    按 (scheme, host, port) 缓存空闲连接，复用 TCP/TLS 握手；
+    连接超时与读取超时分开设置；自动处理重定向与 gzip/deflate/br 解压。
+    线程安全: 每个请求独占一个连接，用完后放回池中.
+    """
+
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 15.0, max_idle_per_host: int = 8) -> None:
+        super().__init__(connect_timeout, read_timeout)
+        self.max_idle_per_host = max_idle_per_host
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url: str) -> Tuple[str, str, int]:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {url}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        return scheme, parts.hostname or "", port
+
+    def _checkout(self, key: Tuple[str, str, int]) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=self.connect_timeout), False
+
+    def _checkin(self, key: Tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _request(self, url: str, headers: Dict[str, str]) -> Response:
+        """发送一次请求 (不处理重定向)."""
+        key = self._key(url)
+        parts = urlsplit(url)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        # 复用的连接可能已被服务器关闭，此时换新连接重试一次
+        for attempt in range(2):
+            conn, reused = self._checkout(key)
+            started = time.perf_counter()
+            connect = 0.0
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                    connect = time.perf_counter() - started
+                conn.sock.settimeout(self.read_timeout)
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                    http.client.CannotSendRequest, http.client.BadStatusLine):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            body = decode_body(raw, resp_headers.get("content-encoding", ""))
+            elapsed = time.perf_counter() - started
+            self.stats.record(len(raw), len(body), elapsed, connect, reused)
+            logger.debug(f"GET {url} -> {resp.status} {len(raw)}B wire/{len(body)}B body "
+                         f"in {elapsed * 1000:.0f}ms ({'reused' if reused else f'connect {connect * 1000:.0f}ms'})")
+            return Response(url, resp.status, resp_headers, body)
+        raise ConnectionError(f"Failed to send request to {url}") # pragma: no cover
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", ACCEPT_ENCODING)
+        headers.setdefault("Connection", "keep-alive")
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                resp = self._request(url, headers)
+                if resp.status in (301, 302, 303, 307, 308) and resp.headers.get("location"):
+                    url = urljoin(url, resp.headers["location"])
+                    continue
+                return resp
+            raise TransportError(url, resp.status)
+        except Exception:
+            self.stats.record_error()
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class OriginRewriteTransport(Transport):
+    """把发往 upstream 的请求改写到 origin (例如本地回放服务器)，其余 URL 原样转发.
+
+    记录中的链接与缓存键仍是原始地址，因此回放抓取得到的数据与真实抓取一致.
+    """
+
+    def __init__(self, inner: Transport, origin: str, upstream: str = "https://movie.douban.com") -> None:
+        super().__init__(inner.connect_timeout, inner.read_timeout)
+        self.inner = inner
+        self.origin = origin.rstrip("/")
+        self.upstream = upstream.rstrip("/")
+        self.stats = inner.stats
+
+    def rewrite(self, url: str) -> str:
+        for prefix in (self.upstream, self.upstream.replace("https://", "http://", 1)):
+            if url.startswith(prefix + "/") or url == prefix:
+                return self.origin + url[len(prefix):]
+        return url
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        resp = self.inner.get(self.rewrite(url), headers=headers)
+        resp.url = url
+        return resp
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+__all__ = ["Transport", "PooledTransport", "UrllibTransport", "OriginRewriteTransport", "Response", "TransportStats", "TransportError", "decode_body"]
@@ -0,0 +1,137 @@
+import concurrent.futures
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from spider.douban_spider import DoubanSpider
+from spider.ratelimit import HostRateLimiter
+from spider.transport import OriginRewriteTransport, PooledTransport, Transport
+from storage.repository import parse_subject_id
+from storage.workqueue import RemoteWorkQueue, Task, WorkQueue
+from utils.logger import logger
+
+PAGE_SIZE = 20 # 标签 API 每页条目数
+
+
+def list_task(tag: str, sort: str, start: int) -> Tuple[str, str, Dict]:
+    """标签分页任务 (kind, key, payload)."""
+    return "list", f"list:{tag}:{sort}:{start}", {"tag": tag, "sort": sort, "start": start}
+
+
+def detail_task(tag: str, sort: str, sub: Dict) -> Tuple[str, str, Dict]:
+    """详情页任务: 按 subject id 去重，同一部电影只抓一次."""
+    link = sub.get("url", "")
+    return "detail", f"detail:{parse_subject_id(link) or link}", {"tag": tag, "sort": sort, "sub": sub}
+
+
+class QueueWorker:
+    """从 WorkQueue (或经 RemoteWorkQueue 从队列服务) 领取任务执行的工作进程.
+
+    concurrency 个线程共享一个连接池与一个令牌桶 (rate 为本进程的速率上限)；后台线程每 lease_seconds/3 秒
+    为执行中的任务续租。列表任务把其中的电影作为详情任务入队，详情任务抓取并解析详情页，
+    生成的记录随 complete() 提交，由中央写入进程入库.
+
+    每个任务只请求一次 (经限速器)，失败时交回队列: 重试次数由 WorkQueue.max_attempts 决定，
+    重新领取后的请求同样受限速约束.
+    """
+
+    def __init__(self, queue: Union[WorkQueue, RemoteWorkQueue], owner: str = "", concurrency: int = 4, rate: float = 2.0,
+                 lease_seconds: float = 60.0, origin: str = "", transport: Optional[Transport] = None,
+                 parser: str = "auto") -> None:
+        self.queue = queue
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.parser = parser
+        if transport is None:
+            transport = OriginRewriteTransport(PooledTransport(), origin) if origin else PooledTransport()
+        self.transport = transport
+        self.limiter = HostRateLimiter(rate, burst=2.0)
+        self.stats: Dict[str, int] = {"list": 0, "detail": 0, "failed": 0, "lost": 0, "records": 0}
+        self._spiders: Dict[Tuple[str, str], DoubanSpider] = {}
+        self._active: Dict[int, Task] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _spider(self, tag: str, sort: str) -> DoubanSpider:
+        """每个 (标签, 排序) 一个爬虫实例 (决定 API 地址与 Referer)，共享 transport 与限速器."""
+        with self._lock:
+            spider = self._spiders.get((tag, sort))
+            if spider is None:
+                spider = DoubanSpider(base_url="JSON_API", tag=tag, sort=sort, transport=self.transport,
+                                      parser=self.parser, limiter=self.limiter)
+                spider.headers.update({"Referer": spider.base_url})
+                self._spiders[(tag, sort)] = spider
+            return spider
+
+    def execute(self, task: Task) -> None:
+        payload = task.payload
+        spider = self._spider(payload["tag"], payload["sort"])
+        try:
+            if task.kind == "list":
+                content = spider.get_page(spider.tag_api_url(payload["start"]))
+                if not content:
+                    raise RuntimeError("empty API response")
+                subjects = spider.parse_api_subjects(content)
+                ok = self.queue.complete(task, self.owner, [], [detail_task(payload["tag"], payload["sort"], sub)
+                                                                for sub in subjects if sub.get("url")])
+            else:
+                sub = payload["sub"]
+                html = spider.get_page(sub["url"])
+                if not html:
+                    raise RuntimeError("empty detail page")
+                record = spider.build_record(sub, html)
+                ok = self.queue.complete(task, self.owner, [record])
+        except Exception as e:
+            logger.warning(f"{task!r} failed: {e}")
+            self.queue.fail(task, self.owner, str(e))
+            outcome = "failed"
+        else:
+            outcome = task.kind if ok else "lost"
+        with self._lock:
+            self._active.pop(task.id, None)
+            self.stats[outcome] += 1
+            if outcome == "detail":
+                self.stats["records"] += 1
+
+    def _heartbeat(self) -> None:
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            with self._lock:
+                ids = list(self._active)
+            kept = set(self.queue.heartbeat(ids, self.owner, self.lease_seconds))
+            with self._lock: # 期间已完成的任务不算丢失
+                lost = [i for i in ids if i not in kept and i in self._active]
+            if lost:
+                logger.warning(f"Lost leases on tasks {lost}; their results will be discarded.")
+
+    def run(self, forever: bool = False, idle_wait: float = 5.0) -> Dict[str, int]:
+        """领取并执行任务，直到队列中没有待执行/执行中的任务 (forever=True 时一直等待新任务)."""
+        logger.info(f"Worker {self.owner} started: concurrency={self.concurrency}, lease={self.lease_seconds:.0f}s")
+        heartbeat = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        futures = set()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                while True:
+                    free = self.concurrency - len(futures)
+                    for task in self.queue.claim(self.owner, self.lease_seconds, free) if free else []:
+                        with self._lock:
+                            self._active[task.id] = task
+                        futures.add(pool.submit(self.execute, task))
+                    if not futures:
+                        if not forever and self.queue.drained():
+                            break
+                        time.sleep(idle_wait) # 其他工作进程持有的任务可能因租约过期重新排队
+                        continue
+                    _, futures = concurrent.futures.wait(futures, timeout=idle_wait,
+                                                         return_when=concurrent.futures.FIRST_COMPLETED)
+        finally:
+            self._stop.set()
+        logger.info(f"Worker {self.owner} finished: {self.stats}")
+        return dict(self.stats)
+
+
+__all__ = ["QueueWorker", "PAGE_SIZE", "list_task", "detail_task"]
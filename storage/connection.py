@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from utils.logger import logger
+
+
+class ConnectionManager:
+    """SQLite 连接管理器.
+
+    - 读连接: 每个线程一个长连接 (thread-local)，只读 (query_only)
+    - 写连接: 全局唯一，由锁串行化，保证同一时刻只有一个写者
+    - 默认开启 WAL 日志模式，读者不会被爬虫写入阻塞. WAL 依赖同一台机器上的共享内存索引 (-shm 文件)，
+      可能被多台机器 / 网络文件系统访问的数据库应使用 journal_mode="DELETE" (此时 synchronous=FULL)
+    """
+
+    def __init__(self, db_path: str, timeout: float = 30.0,
+                 mmap_size: int = 256 * 1024 * 1024, cache_size_kb: int = 64 * 1024,
+                 journal_mode: str = "WAL") -> None:
+        self.db_path = db_path
+        self.timeout = timeout
+        self.journal_mode = journal_mode.upper()
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._write_depth = 0
+        self._wal_ready = False
+
+    def _open(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=check_same_thread)
+        # journal_mode 是持久化在数据库文件里的，只需设置一次
+        if not self._wal_ready:
+            mode = conn.execute(f"PRAGMA journal_mode={self.journal_mode}").fetchone()[0]
+            if mode.upper() != self.journal_mode:
+                logger.warning(f"SQLite {self.journal_mode} mode unavailable for {self.db_path} (got {mode}).")
+            self._wal_ready = True
+        # WAL 下 NORMAL 不会损坏数据库；回滚日志模式下掉电可能损坏，需要 FULL
+        conn.execute(f"PRAGMA synchronous={'NORMAL' if self.journal_mode == 'WAL' else 'FULL'}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}") # 负数表示 KB
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """获取当前线程的只读连接 (复用)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            conn.execute("PRAGMA query_only=1")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """获取唯一的写连接. 最外层退出时提交事务，异常时回滚 (支持嵌套)."""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open(check_same_thread=False)
+            conn = self._writer
+            self._write_depth += 1
+            try:
+                yield conn
+                if self._write_depth == 1:
+                    conn.commit()
+            except Exception:
+                if self._write_depth == 1:
+                    conn.rollback()
+                raise
+            finally:
+                self._write_depth -= 1
+
+    def close(self) -> None:
+        """关闭写连接和当前线程的读连接."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_path: str) -> ConnectionManager:
+    """同一个数据库文件在进程内共享一个连接管理器 (也就共享同一个写者)."""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ConnectionManager(db_path)
+            _managers[key] = manager
+        return manager
+
+
+__all__ = ["ConnectionManager", "get_manager"]
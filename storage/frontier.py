@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from storage.connection import get_manager
+from utils.logger import logger
+
+FRONTIER_DB = os.path.join("data", "frontier.db")
+FRONTIER_RETENTION = 7 * 24 * 3600.0 # 已结束 (done/abandoned) 的任务保留多久后清理 (秒)
+
+# 条目状态: pending (已发现未抓取) -> fetched (已抓取并解析) -> saved (列表页: 整页已入库)；失败为 failed
+ITEM_STATES = ("pending", "fetched", "saved", "failed")
+ITEM_KINDS = ("list", "detail")
+
+
+class CrawlFrontier:
+    """持久化的爬取前沿 (SQLite).
+
+    crawl_job 记录每次爬取任务及其参数；crawl_item 记录任务中的每个列表页与详情页:
+    状态、尝试次数、时间戳以及解析结果 (payload, JSON)。进程崩溃或重启后，
+    用相同参数 resume 即可跳过已完成的工作: 已入库的列表页整页跳过，已抓取的页面直接使用 payload.
+    任务结束后清空其 payload；已结束超过 retention 秒的任务在打开前沿库时删除 (retention=None 不清理).
+    """
+
+    def __init__(self, db_path: str = FRONTIER_DB, retention: Optional[float] = FRONTIER_RETENTION) -> None:
+        parent = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(parent, exist_ok=True)
+        self.db_path = db_path
+        self._db = get_manager(db_path)
+        with self._db.writer() as conn:
+            conn.execute("""
+                create table if not exists crawl_job (
+                    id integer primary key autoincrement,
+                    job_key text not null,
+                    params text not null,
+                    status text not null default 'running',
+                    created_at real not null,
+                    updated_at real not null
+                )
+            """)
+            conn.execute("create index if not exists idx_crawl_job_key on crawl_job(job_key, status)")
+            conn.execute("""
+                create table if not exists crawl_item (
+                    job_id integer not null,
+                    kind text not null,
+                    url text not null,
+                    state text not null default 'pending',
+                    attempts integer not null default 0,
+                    payload text,
+                    created_at real not null,
+                    updated_at real not null,
+                    primary key (job_id, kind, url)
+                ) without rowid
+            """)
+        if retention is not None: # 打开时清理过期的已结束任务，避免前沿库无限增长
+            self.prune(retention)
+
+    def open_job(self, params: Dict[str, Any], resume: bool = False) -> "CrawlJob":
+        """创建爬取任务. resume=True 时优先接上参数相同且未完成的最近一次任务."""
+        key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        now = time.time()
+        with self._db.writer() as conn:
+            row = conn.execute(
+                "select id from crawl_job where job_key = ? and status = 'running' order by id desc limit 1", (key,)
+            ).fetchone()
+            if row and resume:
+                conn.execute("update crawl_job set updated_at = ? where id = ?", (now, row[0]))
+                job = CrawlJob(self, row[0], resumed=True)
+                logger.info(f"Resuming crawl job #{job.id}: {job.progress()}")
+                return job
+            # 不续爬时，之前未完成的同参数任务作废
+            conn.execute("update crawl_job set status = 'abandoned', updated_at = ? where job_key = ? and status = 'running'",
+                         (now, key))
+            cur = conn.execute("insert into crawl_job (job_key, params, created_at, updated_at) values (?, ?, ?, ?)",
+                               (key, key, now, now))
+            return CrawlJob(self, cur.lastrowid, resumed=False)
+
+    def prune(self, older_than: float = FRONTIER_RETENTION) -> int:
+        """删除 older_than 秒前已结束 (非 running) 的任务及其全部条目，返回删除的任务数."""
+        cutoff = time.time() - older_than
+        with self._db.writer() as conn:
+            ids = [row[0] for row in conn.execute(
+                "select id from crawl_job where status != 'running' and updated_at < ?", (cutoff,))]
+            conn.executemany("delete from crawl_item where job_id = ?", [(i,) for i in ids])
+            conn.executemany("delete from crawl_job where id = ?", [(i,) for i in ids])
+        if ids:
+            logger.info(f"Pruned {len(ids)} finished crawl jobs from {self.db_path}")
+        return len(ids)
+
+    def get_jobs(self, limit: int = 20):
+        """最近的爬取任务: [(id, params, status, created_at, updated_at)]"""
+        conn = self._db.reader()
+        return conn.execute(
+            "select id, params, status, created_at, updated_at from crawl_job order by id desc limit ?", (limit,)
+        ).fetchall()
+
+
+class CrawlJob:
+    """单个爬取任务的前沿视图 (线程安全: 写入经由连接管理器的唯一写连接)."""
+
+    def __init__(self, frontier: CrawlFrontier, job_id: int, resumed: bool = False) -> None:
+        self.frontier = frontier
+        self.id = job_id
+        self.resumed = resumed
+        self._db = frontier._db
+        # 缓冲写入时: 列表页先记入待标记列表，等记录真正写入数据库后再由 flush_saved 标记
+        self.defer_saved = False
+        self._pending_saved: List[str] = []
+        self._pending_lock = threading.Lock()
+
+    def _get(self, kind: str, url: str):
+        return self._db.reader().execute(
+            "select state, payload from crawl_item where job_id = ? and kind = ? and url = ?", (self.id, kind, url)
+        ).fetchone()
+
+    def state(self, kind: str, url: str) -> Optional[str]:
+        row = self._get(kind, url)
+        return row[0] if row else None
+
+    def payload(self, kind: str, url: str) -> Optional[Any]:
+        """已抓取 (fetched/saved) 条目的解析结果；未完成时返回 None."""
+        row = self._get(kind, url)
+        if row and row[0] in ("fetched", "saved") and row[1] is not None:
+            return json.loads(row[1])
+        return None
+
+    def record(self, kind: str, url: str, payload: Any, state: str = "fetched") -> None:
+        now = time.time()
+        with self._db.writer() as conn:
+            conn.execute(
+                "insert into crawl_item (job_id, kind, url, state, attempts, payload, created_at, updated_at) "
+                "values (?, ?, ?, ?, 1, ?, ?, ?) "
+                "on conflict(job_id, kind, url) do update set state = excluded.state, "
+                "attempts = attempts + 1, payload = excluded.payload, updated_at = excluded.updated_at",
+                (self.id, kind, url, state, json.dumps(payload, ensure_ascii=False), now, now),
+            )
+            conn.execute("update crawl_job set updated_at = ? where id = ?", (now, self.id))
+
+    def record_list(self, url: str, items: Any, detail_urls: Iterable[str]) -> None:
+        """记录已解析的列表页，并把其中的详情页加入前沿 (pending)."""
+        now = time.time()
+        with self._db.writer() as conn:
+            self.record("list", url, items)
+            conn.executemany(
+                "insert or ignore into crawl_item (job_id, kind, url, created_at, updated_at) values (?, 'detail', ?, ?, ?)",
+                [(self.id, u, now, now) for u in detail_urls if u],
+            )
+
+    def mark_failed(self, kind: str, url: str) -> None:
+        now = time.time()
+        with self._db.writer() as conn:
+            conn.execute(
+                "insert into crawl_item (job_id, kind, url, state, attempts, created_at, updated_at) "
+                "values (?, ?, ?, 'failed', 1, ?, ?) "
+                "on conflict(job_id, kind, url) do update set state = 'failed', "
+                "attempts = attempts + 1, updated_at = excluded.updated_at",
+                (self.id, kind, url, now, now),
+            )
+
+    def mark_saved(self, url: str) -> None:
+        """列表页的整批记录已写入数据库 (defer_saved 时只是已交给缓冲区，推迟到 flush_saved)."""
+        if self.defer_saved:
+            with self._pending_lock:
+                self._pending_saved.append(url)
+            return
+        self._mark_saved([url])
+
+    def flush_saved(self) -> None:
+        """缓冲区写入数据库后调用: 把此前推迟的列表页一次性标记为已入库."""
+        with self._pending_lock:
+            urls, self._pending_saved = self._pending_saved, []
+        if urls:
+            self._mark_saved(urls)
+
+    def _mark_saved(self, urls: List[str]) -> None:
+        now = time.time()
+        with self._db.writer() as conn:
+            conn.executemany("update crawl_item set state = 'saved', updated_at = ? where job_id = ? and kind = 'list' and url = ?",
+                             [(now, self.id, url) for url in urls])
+
+    def finish(self, status: str = "done") -> None:
+        """结束任务. 解析结果只用于续爬，结束后即清空 payload，只保留状态计数 (整个任务由 prune 清理)."""
+        with self._db.writer() as conn:
+            conn.execute("update crawl_job set status = ?, updated_at = ? where id = ?", (status, time.time(), self.id))
+            conn.execute("update crawl_item set payload = null where job_id = ? and payload is not null", (self.id,))
+
+    def progress(self) -> Dict[str, Dict[str, int]]:
+        """各类条目的状态计数, 例如 {"list": {"saved": 3}, "detail": {"fetched": 60, "pending": 15}}"""
+        result: Dict[str, Dict[str, int]] = {}
+        for kind, state, n in self._db.reader().execute(
+            "select kind, state, count(*) from crawl_item where job_id = ? group by kind, state", (self.id,)
+        ):
+            result.setdefault(kind, {})[state] = n
+        return result
+
+
+__all__ = ["CrawlFrontier", "CrawlJob", "FRONTIER_DB", "FRONTIER_RETENTION", "ITEM_STATES", "ITEM_KINDS"]
@@ -0,0 +1,348 @@
+"""单写者入库服务.
+
+多个爬虫进程各自打开数据库写入时，会在 SQLite 写锁上串行等待，高并发下出现长时间阻塞或 "database is locked"。
+IngestServer 把写入集中到一个进程内的唯一写线程: 各爬虫进程通过 IngestClient (multiprocessing.connection)
+发送记录，写线程把同时到达的多批记录合并进一个事务提交 (group commit)，提交后逐一回复确认 (ack)，
+其中带有已持久化的记录偏移量 (offset，累计已提交的记录数)。
+
+消息以 JSON 编码 (send_bytes / recv_bytes)，不使用 pickle，收到的数据不会被当作对象反序列化执行。
+连接用共享密钥做 HMAC 握手: 密钥取自 --authkey 或环境变量 DOUBAN_INGEST_KEY；未设置时使用内置的默认密钥，
+此时只允许监听本机回环地址.
+
+用法:
+    python -m storage.ingest --db data/movie.db --port 8765
+    python main.py --type tag --tag 喜剧 --append --ingest 127.0.0.1:8765
+    DOUBAN_INGEST_KEY=<密钥> python -m storage.ingest --host 0.0.0.0   # 跨机器入库必须设置密钥
+"""
+import argparse
+import ipaddress
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage.connection import get_manager
+from storage.repository import MovieRepository
+from utils.logger import logger
+
+INGEST_AUTHKEY = b"douban-flask-ingest" # 公开的默认密钥: 仅用于本机回环地址
+INGEST_KEY_ENV = "DOUBAN_INGEST_KEY"
+DEFAULT_PORT = 8765
+CALLS = ("create_table_if_not_exists", "clear_table", "defer_refresh") # 允许远程调用的仓库方法
+_STOP = object()
+
+
+class IngestError(RuntimeError):
+    """入库服务报告的写入失败."""
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """"host:port" 或 "port" -> (host, port)."""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def resolve_authkey(authkey: Optional[bytes] = None) -> bytes:
+    """显式传入的密钥 > 环境变量 DOUBAN_INGEST_KEY > 内置默认密钥."""
+    if authkey:
+        return authkey
+    return os.environ.get(INGEST_KEY_ENV, "").encode() or INGEST_AUTHKEY
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _send(conn: Connection, message: Any) -> None:
+    conn.send_bytes(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+
+def _recv(conn: Connection) -> Any:
+    return json.loads(conn.recv_bytes().decode("utf-8"))
+
+
+class IngestServer:
+    """单写者入库服务.
+
+    每个客户端连接一个接收线程，请求进入有界队列；唯一的写线程取出第一个请求后，
+    在 max_wait 秒内继续收集，最多合并 max_batch 条记录，在一个事务中依次执行后统一提交，
+    再向各客户端回复 ("ack", seq, offset, result)。合并事务失败时退回逐个请求单独提交，
+    只有出错的请求收到 ("error", seq, offset, message)。
+    使用默认密钥时拒绝监听非回环地址 (ValueError).
+    """
+
+    def __init__(self, db_path: str, address: Tuple[str, int] = ("127.0.0.1", DEFAULT_PORT),
+                 authkey: Optional[bytes] = None, max_batch: int = 2000, max_wait: float = 0.05,
+                 queue_size: int = 256) -> None:
+        authkey = resolve_authkey(authkey)
+        if authkey == INGEST_AUTHKEY and not is_loopback(address[0]):
+            raise ValueError(f"Refusing to listen on {address[0]} with the default ingest key; "
+                             f"set --authkey or {INGEST_KEY_ENV}")
+        self.db_path = db_path
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.offset = 0 # 已提交 (持久化) 的记录总数
+        self.stats: Dict[str, float] = {"requests": 0, "records": 0, "commits": 0, "errors": 0, "seconds": 0.0}
+        self._db = get_manager(db_path)
+        self._repos: Dict[str, MovieRepository] = {}
+        self._requests: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size) # 有界: 写入跟不上时反压客户端
+        self._listener = Listener(address, authkey=authkey, backlog=64)
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name="ingest-writer", daemon=True)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._listener.address
+
+    def __enter__(self) -> "IngestServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start(self) -> "IngestServer":
+        self._writer.start()
+        threading.Thread(target=self._accept_loop, name="ingest-accept", daemon=True).start()
+        logger.info(f"Ingest server listening on {self.address[0]}:{self.address[1]} -> {self.db_path}")
+        return self
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            while not self._closed.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """停止接收新连接，写完队列中已收到的请求后退出."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._listener.close()
+        self._requests.put(_STOP)
+        self._writer.join()
+        s = self.stats
+        logger.info(f"Ingest server: {s['records']} records from {s['requests']} requests in {s['commits']} commits "
+                    f"({s['seconds']:.2f}s), {s['errors']} errors")
+
+    def _repo(self, table: str) -> MovieRepository:
+        if not isinstance(table, str) or not table.isidentifier(): # 表名会拼入 SQL
+            raise ValueError(f"invalid table name: {table!r}")
+        repo = self._repos.get(table)
+        if repo is None:
+            repo = self._repos[table] = MovieRepository(self.db_path, table)
+        return repo
+
+    # --- 连接 ---
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._closed.is_set():
+                    return
+                logger.warning("Ingest server: rejected a connection (bad authkey?)")
+                continue
+            thread = threading.Thread(target=self._receive_loop, args=(conn,), name="ingest-conn", daemon=True)
+            thread.start()
+
+    def _receive_loop(self, conn: Connection) -> None:
+        """["save" | "call", seq, table, payload] -> 写入队列；连接断开时退出."""
+        while True:
+            try:
+                op, seq, table, payload = _recv(conn)
+            except (EOFError, OSError):
+                return
+            except Exception as e: # 格式不对的消息
+                logger.warning(f"Ingest server: malformed request ({e}); closing connection")
+                conn.close()
+                return
+            self._requests.put((conn, op, seq, table, payload))
+
+    # --- 写线程 ---
+    def _write_loop(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._requests.get()
+            if first is _STOP:
+                break
+            group, records = [first], self._size(first)
+            deadline = time.monotonic() + self.max_wait
+            while records < self.max_batch: # 合并在 max_wait 内到达的请求
+                try:
+                    item = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+                records += self._size(item)
+            self._commit(group)
+
+    @staticmethod
+    def _size(item: Tuple) -> int:
+        _, op, _, _, payload = item
+        return len(payload) if op == "save" else 1
+
+    def _apply(self, item: Tuple) -> Any:
+        _, op, _, table, payload = item
+        repo = self._repo(table)
+        if op == "save":
+            return repo.save_all(payload)
+        if op == "call":
+            # payload: 方法名，或 [方法名, 参数列表]
+            name, args = (payload, []) if isinstance(payload, str) else (payload[0], payload[1])
+            if name in CALLS:
+                return getattr(repo, name)(*args)
+        raise ValueError(f"unsupported operation: {op} {payload}")
+
+    def _commit(self, group: List[Tuple]) -> None:
+        started = time.perf_counter()
+        try:
+            with self._db.writer(): # 整组在同一个事务中，只提交一次
+                results = [self._apply(item) for item in group]
+            outcomes = [(item, result, None) for item, result in zip(group, results)]
+        except Exception:
+            outcomes = [] # 合并事务失败: 逐个单独提交，找出出错的请求
+            for item in group:
+                try:
+                    with self._db.writer():
+                        outcomes.append((item, self._apply(item), None))
+                except Exception as e:
+                    outcomes.append((item, None, f"{type(e).__name__}: {e}"))
+        self.stats["seconds"] += time.perf_counter() - started
+        self.stats["commits"] += 1
+        for item, result, error in outcomes:
+            conn, op, seq, _, payload = item
+            self.stats["requests"] += 1
+            if error is None:
+                if op == "save":
+                    self.offset += len(payload)
+                    self.stats["records"] += len(payload)
+                reply = ("ack", seq, self.offset, result)
+            else:
+                self.stats["errors"] += 1
+                logger.error(f"Ingest request #{seq} failed: {error}")
+                reply = ("error", seq, self.offset, error)
+            try:
+                _send(conn, reply)
+            except (OSError, EOFError):
+                pass # 客户端已断开，数据已写入
+
+
+class IngestClient:
+    """IngestServer 的客户端，save_all / create_table_if_not_exists / clear_table / defer_refresh 与 MovieRepository 兼容.
+
+    save_all 同步等待确认；submit 只发送不等待 (可连续提交多批)，flush 等待此前所有批次的确认。
+    durable_offset 为最近一次确认时服务端已提交的记录总数.
+    """
+
+    def __init__(self, address: Tuple[str, int], table_name: str = "movies", authkey: Optional[bytes] = None) -> None:
+        self.table_name = table_name
+        self.durable_offset = 0
+        self._conn = Client(address, authkey=resolve_authkey(authkey))
+        self._seq = 0
+        self._results: Dict[int, Any] = {}
+        self._pending: set = set()
+        self._lock = threading.RLock()
+
+    def __enter__(self) -> "IngestClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _send(self, op: str, payload: Any) -> int:
+        with self._lock:
+            self._seq += 1
+            _send(self._conn, (op, self._seq, self.table_name, payload))
+            self._pending.add(self._seq)
+            return self._seq
+
+    def _wait(self, seq: int) -> Any:
+        with self._lock:
+            while seq in self._pending:
+                kind, acked, offset, result = _recv(self._conn)
+                self._pending.discard(acked)
+                self.durable_offset = max(self.durable_offset, offset)
+                self._results[acked] = IngestError(result) if kind == "error" else result
+            result = self._results.pop(seq, None)
+        if isinstance(result, IngestError):
+            raise result
+        return result
+
+    def submit(self, records: Iterable[Dict[str, str]]) -> int:
+        """发送一批记录，不等待确认，返回批次序号."""
+        return self._send("save", list(records))
+
+    def flush(self) -> None:
+        """等待所有已提交批次的确认；任一批次失败时抛出 IngestError."""
+        with self._lock:
+            pending = sorted(self._pending | set(self._results))
+        errors = []
+        for seq in pending:
+            try:
+                self._wait(seq)
+            except IngestError as e:
+                errors.append(str(e))
+        if errors:
+            raise IngestError("; ".join(errors))
+
+    def save_all(self, records: Iterable[Dict[str, str]]) -> Dict[str, int]:
+        return self._wait(self.submit(records))
+
+    def create_table_if_not_exists(self) -> None:
+        self._wait(self._send("call", "create_table_if_not_exists"))
+
+    def clear_table(self) -> None:
+        self._wait(self._send("call", "clear_table"))
+
+    def defer_refresh(self, movie_ids: Iterable[int], delay: float) -> None:
+        self._wait(self._send("call", ["defer_refresh", [list(movie_ids), delay]]))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pending:
+                self.flush()
+            self._conn.close()
+
+
+__all__ = ["IngestServer", "IngestClient", "IngestError", "INGEST_AUTHKEY", "INGEST_KEY_ENV", "DEFAULT_PORT",
+           "parse_address", "resolve_authkey", "is_loopback"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="单写者入库服务 (group commit)")
+    parser.add_argument("--db", default="data/movie.db", help="数据库路径")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址 (默认: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口 (默认: {DEFAULT_PORT})")
+    parser.add_argument("--max-batch", type=int, default=2000, help="每个事务最多合并的记录数 (默认: 2000)")
+    parser.add_argument("--max-wait", type=float, default=0.05, help="合并等待时间 (秒, 默认: 0.05)")
+    parser.add_argument("--authkey", default="", help=f"连接密钥 (默认取环境变量 {INGEST_KEY_ENV}；监听非回环地址时必须设置)")
+    args = parser.parse_args()
+    try:
+        server = IngestServer(args.db, (args.host, args.port), authkey=args.authkey.encode() or None,
+                              max_batch=args.max_batch, max_wait=args.max_wait)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
@@ -1,7 +1,176 @@
+import base64
+import html
+import json
+import math
 import sqlite3
 import re
-from typing import Dict, Iterable, List, Sequence, Any, Tuple, Optional
+import time
+from typing import Dict, Iterable, Iterator, List, Sequence, Set, Any, Tuple, Optional
 from utils.logger import logger
+from storage.connection import get_manager
+
+# 页面与导出使用的 12 个原始列 (下标 0~11 与模板中的 movie[i] 对应)
+BASE_COLUMNS: Tuple[str, ...] = (
+    "id", "info_link", "pic_link", "cname", "score", "rated", "introduction",
+    "year_release", "country", "category", "directors", "actors",
+)
+
+# save_all 写入的原始文本字段
+SAVE_FIELDS: Tuple[str, ...] = BASE_COLUMNS[1:]
+
+# 入库时归一化出的数值列: 列名 -> SQL 类型
+NUMERIC_COLUMNS: Dict[str, str] = {
+    "score_num": "real",
+    "votes": "integer",
+    "year_num": "integer",
+    "subject_id": "integer",
+}
+
+# 主表的附属表后缀 (表名为 <主表>__<后缀>)，清空/重命名时随主表一起处理
+AUX_TABLES: Tuple[str, ...] = ("genre", "country", "person", "fts", "meta", "hist", "refresh", "history")
+# 清空主表时保留的附属表: 版本号等元数据，以及按 subject id 记录的评分/评价人数历史
+KEEP_ON_CLEAR: Tuple[str, ...] = ("meta", "history")
+
+# 物化统计: 看板汇总指标保存在 meta 表中，分布直方图保存在 hist 表中 (kind, bucket) -> n
+STATS_KEYS: Tuple[str, ...] = ("row_count", "score_count", "score_sum_x10", "high_score")
+HIST_KINDS: Tuple[str, ...] = ("score", "year", "genre", "country")
+
+# 重新抓取调度 (refresh 表): 基准间隔与上下限 (秒)
+REFRESH_INTERVAL = 7 * 86400
+REFRESH_MIN_INTERVAL = 6 * 3600
+REFRESH_MAX_INTERVAL = 30 * 86400
+
+# 列表页支持的排序方式: 名称 -> (排序键表达式, 是否降序)，均有对应索引，可做 keyset 分页
+LIST_ORDERS: Dict[str, Tuple[Tuple[str, ...], bool]] = {
+    "id": (("id",), False),
+    "score": (("coalesce(score_num, 0)", "id"), True),
+    "year": (("coalesce(year_num, 0)", "id"), True),
+}
+
+# 全文检索列及 BM25 权重: 片名 > 人物 > 类型 > 其他(年份/国家/评分) > 简介
+FTS_COLUMNS: Tuple[str, ...] = ("cname", "people", "genres", "intro", "extra")
+FTS_WEIGHTS: Tuple[float, ...] = (10.0, 5.0, 3.0, 1.0, 2.0)
+
+_number_pattern = re.compile(r"\d+")
+_year_pattern = re.compile(r"(\d{4})")
+_subject_pattern = re.compile(r"/subject/(\d+)")
+
+
+def parse_score(value: Any) -> Optional[float]:
+    """'9.7' -> 9.7, 空值或 0 (暂无评分) -> None."""
+    try:
+        score = float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return score if score > 0 else None
+
+
+def parse_votes(value: Any) -> Optional[int]:
+    """'123456 人评价' -> 123456."""
+    match = _number_pattern.search(str(value or "").replace(",", ""))
+    return int(match.group()) if match else None
+
+
+def parse_year(value: Any) -> Optional[int]:
+    """'2024(中国大陆)' -> 2024."""
+    match = _year_pattern.search(str(value or ""))
+    return int(match.group(1)) if match else None
+
+
+def parse_subject_id(info_link: Any) -> Optional[int]:
+    """'https://movie.douban.com/subject/1292052/' -> 1292052."""
+    match = _subject_pattern.search(str(info_link or ""))
+    return int(match.group(1)) if match else None
+
+
+def split_genres(text: Any) -> List[str]:
+    """'剧情 犯罪' -> ['剧情', '犯罪'] (爬虫以空格分隔类型)."""
+    return str(text or "").split()
+
+
+def split_countries(text: Any) -> List[str]:
+    """'美国 / 英国' -> ['美国', '英国'] (同时支持空格和斜杠)."""
+    return [c for c in re.split(r"[ /]+", str(text or "")) if c.strip()]
+
+
+def split_people(text: Any) -> List[str]:
+    """拆分导演/主演字符串，去掉括号内的外文名并过滤单字名."""
+    if not text:
+        return []
+    # 移除括号内的外文名 (e.g. "张国荣 (Leslie Cheung)")
+    text = re.sub(r"\(.*?\)|（.*?）", "", str(text))
+    names = re.split(r"[ /:：,，]", text)
+    return [n.strip() for n in names if n.strip() and len(n.strip()) > 1]
+
+
+def segment_text(text: Any, for_search: bool = True) -> str:
+    """使用 jieba 分词，以空格连接后交给 FTS5 的 unicode61 分词器.
+
+    for_search=True 使用搜索引擎模式 (额外输出长词中的短词，召回更高)；
+    简介需要生成摘要，使用精确模式，避免摘要中出现重复的字.
+    """
+    if not text:
+        return ""
+    import jieba
+    words = jieba.cut_for_search(str(text)) if for_search else jieba.cut(str(text))
+    return " ".join(w for w in words if w.strip())
+
+
+def build_match_query(keyword: str) -> str:
+    """将用户输入转换为 FTS5 MATCH 表达式: 每个词做前缀匹配，词之间为 AND."""
+    import jieba
+    tokens = [w.strip() for w in jieba.cut(keyword)]
+    tokens = [w for w in tokens if w and re.search(r"\w", w)]
+    return " ".join('"' + w.replace('"', '""') + '"*' for w in tokens)
+
+
+def normalize_record(record: Dict[str, Any]) -> Tuple[Optional[float], Optional[int], Optional[int], Optional[int]]:
+    """按 NUMERIC_COLUMNS 的顺序返回一条记录的数值字段."""
+    return (
+        parse_score(record.get("score")),
+        parse_votes(record.get("rated")),
+        parse_year(record.get("year_release")),
+        parse_subject_id(record.get("info_link")),
+    )
+
+
+def refresh_interval(votes: Optional[int], fetches: int, changes: int, base: float = REFRESH_INTERVAL) -> float:
+    """距下次重新抓取的间隔 (秒): 评分/评价人数变化越频繁 (changes / fetches)、评价人数越多，间隔越短."""
+    volatility = changes / fetches if fetches else 0.0
+    popularity = math.log10(1 + max(votes or 0, 0))
+    interval = base / ((1 + 3 * volatility) * (1 + popularity / 2))
+    return min(max(interval, REFRESH_MIN_INTERVAL), REFRESH_MAX_INTERVAL)
+
+
+def score_x10(score_num: Optional[float]) -> Optional[int]:
+    """评分编码为整数 (8.7 -> 87)，历史表中以整数存储."""
+    return None if score_num is None else int(round(score_num * 10))
+
+
+def encode_cursor(sort: str, key: Sequence[Any]) -> str:
+    """将排序方式和排序键编码为 URL 安全的游标."""
+    raw = json.dumps([sort] + list(key), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> List[Any]:
+    """解析游标，排序方式不一致或格式错误时抛出 ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        data = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    if not isinstance(data, list) or not data or data[0] != sort or len(data) != len(LIST_ORDERS[sort][0]) + 1:
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return data[1:]
+
+
+def _highlight(snippet: Optional[str]) -> str:
+    """把 FTS5 snippet 的标记转换为 <mark>，并去掉分词时在中文之间插入的空格."""
+    text = html.escape(snippet or "")
+    text = re.sub(r"(?<=[\u4e00-\u9fff\x02\x03，。、；：！？]) (?=[\u4e00-\u9fff\x02\x03，。、；：！？])", "", text)
+    return text.replace("\x02", "<mark>").replace("\x03", "</mark>")
+
 
 class MovieRepository:
     """SQLite 电影数据管理辅助类."""
@@ -9,11 +178,29 @@ class MovieRepository:
     def __init__(self, db_path: str = "data/movie.db", table_name: str = "movies") -> None:
         self.db_path = db_path
         self.table_name = table_name
+        # 同一数据库文件的所有仓库实例共享连接池和唯一写者
+        self._db = get_manager(db_path)
+        self._migrated = set() # 已确认结构为最新的表
 
     def set_table(self, table_name: str) -> None:
         self.table_name = table_name
 
+    @property
+    def _columns(self) -> str:
+        return ", ".join(BASE_COLUMNS)
+
+    def _aux(self, suffix: str, table: Optional[str] = None) -> str:
+        """附属表名: 主表名 + 双下划线 + 后缀 (例如 movies__genre)."""
+        return f"{table or self.table_name}__{suffix}"
+
     def create_table_if_not_exists(self) -> None:
+        with self._db.writer() as conn:
+            self._ensure_table(conn)
+
+    def _ensure_table(self, conn: sqlite3.Connection) -> None:
+        """建表并迁移. 每张表只完整执行一次，之后只查 sqlite_master 确认表仍然存在 (不再执行 PRAGMA 与 DDL)."""
+        if self.table_name in self._migrated and self._has_table(conn, self.table_name):
+            return
         sql = f"""
         create table if not exists {self.table_name}
         (
@@ -28,240 +215,898 @@ class MovieRepository:
             country text,
             category text,
             directors text,
-            actors text
+            actors text,
+            score_num real,
+            votes integer,
+            year_num integer,
+            subject_id integer
         );
         """
-        with self._connect() as conn:
-            conn.execute(sql)
-            conn.commit()
+        conn.execute(sql)
+        self._migrate(conn)
+
+    def _migrate(self, conn: sqlite3.Connection, table: Optional[str] = None) -> None:
+        """为旧表补齐数值列并批量回填，同时建立索引."""
+        table = table or self.table_name
+        columns = [info[1] for info in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        # 早期版本的表可能缺少导演/主演/国家等文本列
+        for col in BASE_COLUMNS:
+            if col not in columns:
+                conn.execute(f"alter table {table} add column {col} text")
+        missing = [c for c in NUMERIC_COLUMNS if c not in columns]
+        for col in missing:
+            conn.execute(f"alter table {table} add column {col} {NUMERIC_COLUMNS[col]}")
+
+        if missing:
+            rows = conn.execute(
+                f"select id, info_link, score, rated, year_release from {table}"
+            ).fetchall()
+            values = [
+                normalize_record({"info_link": r[1], "score": r[2], "rated": r[3], "year_release": r[4]}) + (r[0],)
+                for r in rows
+            ]
+            conn.executemany(
+                f"update {table} set {', '.join(c + ' = ?' for c in NUMERIC_COLUMNS)} where id = ?",
+                values,
+            )
+            logger.info(f"Migrated table {table}: added {missing}, backfilled {len(values)} rows.")
+
+        # 链接唯一约束: 去重交给 SQL 的冲突处理 (旧数据中若有重复链接，保留最早的一条)
+        stats_dirty = False
+        unique_index = f"uq_{table}_info_link"
+        if not conn.execute(
+            "select 1 from sqlite_master where type = 'index' and name = ?", (unique_index,)
+        ).fetchone():
+            duplicates = [r[0] for r in conn.execute(f"""
+                select id from {table}
+                where info_link <> ''
+                  and id not in (select min(id) from {table} where info_link <> '' group by info_link)
+            """).fetchall()]
+            if duplicates:
+                self._delete_derived(conn, table, duplicates)
+                self._delete_ids(conn, table, duplicates)
+                stats_dirty = True
+                logger.info(f"Removed {len(duplicates)} duplicate links from {table}.")
+            conn.execute(f"create unique index {unique_index} on {table}(info_link) where info_link <> ''")
+
+        conn.execute(f"create index if not exists idx_{table}_score_num on {table}(score_num)")
+        conn.execute(f"create index if not exists idx_{table}_year_num on {table}(year_num)")
+        conn.execute(f"create index if not exists idx_{table}_subject_id on {table}(subject_id)")
+        # 列表页 keyset 分页使用的排序键索引
+        conn.execute(f"create index if not exists idx_{table}_score_key on {table}(coalesce(score_num, 0), id)")
+        conn.execute(f"create index if not exists idx_{table}_year_key on {table}(coalesce(year_num, 0), id)")
+
+        # 计数器等元数据，首次创建时初始化
+        meta = self._aux("meta", table)
+        if not self._has_table(conn, meta):
+            conn.execute(f"create table {meta} (key text primary key, value integer not null)")
+            total = conn.execute(f"select count(*) from {table}").fetchone()[0]
+            conn.execute(f"insert into {meta} (key, value) values ('row_count', ?)", (total,))
+            self._bump_version(conn, table)
+
+        # 多对多副表 (类型 / 国家地区 / 人物)，首次创建时从主表回填
+        if self._create_side_tables(conn, table):
+            rows = conn.execute(
+                f"select id, category, country, directors, actors from {table}"
+            ).fetchall()
+            self._fill_side_tables(conn, table, rows)
+            logger.info(f"Built side tables for {table} from {len(rows)} rows.")
+
+        # 全文索引 (FTS5)，首次创建时回填
+        if self._create_fts_table(conn, table):
+            rows = conn.execute(
+                f"select id, cname, directors, actors, category, country, introduction, year_release, score from {table}"
+            ).fetchall()
+            self._fill_fts(conn, table, rows)
+            logger.info(f"Built full-text index for {table} from {len(rows)} rows.")
+
+        # 物化统计表，首次创建时全量计算
+        hist = self._aux("hist", table)
+        if not self._has_table(conn, hist):
+            conn.execute(
+                f"create table {hist} (kind text not null, bucket text not null, n integer not null, "
+                f"primary key (kind, bucket)) without rowid"
+            )
+            self._rebuild_stats(conn, table)
+        elif stats_dirty:
+            self._rebuild_stats(conn, table)
+
+        # 重新抓取调度表，首次创建时已有电影全部视为到期 (从未调度过)
+        refresh = self._aux("refresh", table)
+        if not self._has_table(conn, refresh):
+            conn.execute(
+                f"create table {refresh} (movie_id integer primary key, last_fetched real, "
+                f"fetches integer not null default 0, changes integer not null default 0, next_due real not null default 0)"
+            )
+            conn.execute(f"insert into {refresh} (movie_id) select id from {table}")
+        conn.execute(f"create index if not exists idx_{refresh}_due on {refresh}(next_due)")
+
+        # 评分/评价人数历史 (只追加): 每行只记录相对上一次发生变化的字段，未变化的字段为 NULL；
+        # 首次创建时以当前数据作为起点
+        history = self._aux("history", table)
+        if not self._has_table(conn, history):
+            conn.execute(
+                f"create table {history} (subject_id integer not null, ts integer not null, "
+                f"score_x10 integer, votes integer, primary key (subject_id, ts)) without rowid"
+            )
+            conn.execute(
+                f"insert or ignore into {history} (subject_id, ts, score_x10, votes) "
+                f"select subject_id, ?, cast(round(score_num * 10) as integer), votes from {table} "
+                f"where subject_id is not null and (score_num is not null or votes is not null)",
+                (int(time.time()),),
+            )
+        conn.execute(f"create index if not exists idx_{history}_ts on {history}(ts)")
+        self._migrated.add(table)
+
+    def _create_side_tables(self, conn: sqlite3.Connection, table: str) -> bool:
+        """创建副表及索引，返回副表是否是本次新建的."""
+        genre, country, person = self._aux("genre", table), self._aux("country", table), self._aux("person", table)
+        existed = conn.execute(
+            "select 1 from sqlite_master where type = 'table' and name = ?", (person,)
+        ).fetchone()
+        conn.execute(f"create table if not exists {genre} (movie_id integer not null, name text not null)")
+        conn.execute(f"create table if not exists {country} (movie_id integer not null, name text not null)")
+        conn.execute(
+            f"create table if not exists {person} "
+            f"(movie_id integer not null, name text not null, role text not null, position integer not null)"
+        )
+        for aux in (genre, country, person):
+            conn.execute(f"create index if not exists idx_{aux}_name on {aux}(name)")
+            conn.execute(f"create index if not exists idx_{aux}_movie on {aux}(movie_id)")
+        return not existed
+
+    def _fill_side_tables(self, conn: sqlite3.Connection, table: str, rows: Iterable[Sequence[Any]]) -> None:
+        """rows: (id, category, country, directors, actors)."""
+        genre_rows, country_rows, person_rows = [], [], []
+        for movie_id, category, country, directors, actors in rows:
+            genre_rows.extend((movie_id, g) for g in split_genres(category))
+            country_rows.extend((movie_id, c) for c in split_countries(country))
+            person_rows.extend((movie_id, d, "director", i) for i, d in enumerate(split_people(directors)))
+            person_rows.extend((movie_id, a, "actor", i) for i, a in enumerate(split_people(actors)))
+        conn.executemany(f"insert into {self._aux('genre', table)} (movie_id, name) values (?, ?)", genre_rows)
+        conn.executemany(f"insert into {self._aux('country', table)} (movie_id, name) values (?, ?)", country_rows)
+        conn.executemany(
+            f"insert into {self._aux('person', table)} (movie_id, name, role, position) values (?, ?, ?, ?)",
+            person_rows,
+        )
+
+    def _create_fts_table(self, conn: sqlite3.Connection, table: str) -> bool:
+        """创建全文索引表，返回是否是本次新建的 (SQLite 不支持 FTS5 时返回 False)."""
+        fts = self._aux("fts", table)
+        existed = conn.execute(
+            "select 1 from sqlite_master where type = 'table' and name = ?", (fts,)
+        ).fetchone()
+        if existed:
+            return False
+        try:
+            conn.execute(f"create virtual table {fts} using fts5({', '.join(FTS_COLUMNS)}, tokenize = 'unicode61')")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 unavailable, search falls back to LIKE: {e}")
+            return False
+        return True
+
+    def _fill_fts(self, conn: sqlite3.Connection, table: str, rows: Iterable[Sequence[Any]]) -> None:
+        """rows: (id, cname, directors, actors, category, country, introduction, year_release, score)."""
+        fts = self._aux("fts", table)
+        if not self._has_table(conn, fts):
+            return
+        values = [
+            (
+                movie_id,
+                segment_text(cname),
+                segment_text(f"{directors or ''} {actors or ''}"),
+                category or "",
+                segment_text(intro, for_search=False),
+                f"{year or ''} {segment_text(country)} {score or ''}",
+            )
+            for movie_id, cname, directors, actors, category, country, intro, year, score in rows
+        ]
+        conn.executemany(
+            f"insert into {fts} (rowid, {', '.join(FTS_COLUMNS)}) values (?, ?, ?, ?, ?, ?)", values
+        )
+
+    def _delete_ids(self, conn: sqlite3.Connection, table: str, ids: Sequence[int], column: str = "id") -> None:
+        """按 id 批量删除 (分块，避免超出 SQLite 的参数数量上限)."""
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            conn.execute(f"delete from {table} where {column} in ({','.join('?' * len(chunk))})", chunk)
+
+    def _delete_derived(self, conn: sqlite3.Connection, table: str, ids: Sequence[int]) -> None:
+        """删除若干电影在副表和全文索引中的数据 (物化统计由调用方负责)."""
+        for suffix in ("genre", "country", "person"):
+            if self._has_table(conn, self._aux(suffix, table)):
+                self._delete_ids(conn, self._aux(suffix, table), ids, column="movie_id")
+        if self._has_table(conn, self._aux("fts", table)):
+            self._delete_ids(conn, self._aux("fts", table), ids, column="rowid")
+
+    def _has_table(self, conn: sqlite3.Connection, name: str) -> bool:
+        return conn.execute(
+            "select 1 from sqlite_master where type = 'table' and name = ?", (name,)
+        ).fetchone() is not None
+
+    def _aux_tables(self, conn: sqlite3.Connection, table: str) -> List[str]:
+        """列出某张主表已存在的附属表 (FTS5 的影子表由 SQLite 自行维护，不在其中)."""
+        names = [self._aux(suffix, table) for suffix in AUX_TABLES]
+        return [name for name in names if self._has_table(conn, name)]
+
+    def get_all_tables(self) -> List[str]:
+        """获取所有电影数据表 (不含副表和 SQLite 内部表)."""
+        with self._db.reader() as conn:
+            rows = conn.execute(
+                "select name from sqlite_master where type = 'table' and name not like 'sqlite%' order by name"
+            ).fetchall()
+        return [r[0] for r in rows if "__" not in r[0]]
+
+    def _prepare(self) -> None:
+        """读取前确保当前表已迁移 (每张表只检查一次，表不存在时不做任何事)."""
+        if self.table_name in self._migrated:
+            return
+        with self._db.writer() as conn:
+            exists = conn.execute(
+                "select 1 from sqlite_master where type = 'table' and name = ?", (self.table_name,)
+            ).fetchone()
+            if exists:
+                self._migrate(conn)
 
     def clear_table(self) -> None:
         self.create_table_if_not_exists()
-        with self._connect() as conn:
+        with self._db.writer() as conn:
             conn.execute(f"delete from {self.table_name}")
-            conn.commit()
+            keep = {self._aux(suffix) for suffix in KEEP_ON_CLEAR}
+            for aux in self._aux_tables(conn, self.table_name):
+                if aux not in keep:
+                    conn.execute(f"delete from {aux}")
+            for key in STATS_KEYS:
+                self._set_meta(conn, key, 0)
+            self._bump_version(conn)
+
+    def _bump_version(self, conn: sqlite3.Connection, table: Optional[str] = None) -> None:
+        """数据版本号 +1. 取 max(旧版本 + 1, 当前毫秒时间戳)，即使表被删除重建也不会回退."""
+        conn.execute(
+            f"insert into {self._aux('meta', table)} (key, value) values ('data_version', ?) "
+            f"on conflict(key) do update set value = max(value + 1, excluded.value)",
+            (time.time_ns() // 1_000_000,),
+        )
+
+    def get_data_version(self) -> int:
+        """当前表的数据版本号. 每次写入/重命名/清空都会递增，下游缓存可据此判断是否过期."""
+        return self._get_meta("data_version")
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: int, table: Optional[str] = None) -> None:
+        conn.execute(
+            f"insert into {self._aux('meta', table)} (key, value) values (?, ?) "
+            f"on conflict(key) do update set value = excluded.value",
+            (key, value),
+        )
+
+    def _add_meta(self, conn: sqlite3.Connection, key: str, delta: int, table: Optional[str] = None) -> None:
+        conn.execute(
+            f"insert into {self._aux('meta', table)} (key, value) values (?, ?) "
+            f"on conflict(key) do update set value = value + excluded.value",
+            (key, delta),
+        )
+
+    def _get_meta(self, key: str, default: int = 0) -> int:
+        with self._connect() as conn:
+            meta = self._aux("meta")
+            if not self._has_table(conn, meta):
+                return default
+            row = conn.execute(f"select value from {meta} where key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _apply_stats(self, conn: sqlite3.Connection, records: Iterable[Dict[str, Any]],
+                     sign: int = 1, table: Optional[str] = None) -> None:
+        """把一批记录增量计入 (sign=1) 或移出 (sign=-1) 物化统计."""
+        meta_delta: Dict[str, int] = {key: 0 for key in STATS_KEYS}
+        hist_delta: Dict[Tuple[str, str], int] = {}
+
+        def bump(kind: str, bucket: Any) -> None:
+            hist_delta[(kind, str(bucket))] = hist_delta.get((kind, str(bucket)), 0) + sign
+
+        for r in records:
+            meta_delta["row_count"] += sign
+            score = parse_score(r.get("score"))
+            if score is not None:
+                meta_delta["score_count"] += sign
+                meta_delta["score_sum_x10"] += sign * int(round(score * 10))
+                if score >= 9.0:
+                    meta_delta["high_score"] += sign
+                bump("score", score)
+            year = parse_year(r.get("year_release"))
+            if year is not None:
+                bump("year", year)
+            for g in split_genres(r.get("category")):
+                bump("genre", g)
+            for c in split_countries(r.get("country")):
+                bump("country", c)
+
+        for key, delta in meta_delta.items():
+            if delta:
+                self._add_meta(conn, key, delta, table)
+        hist = self._aux("hist", table)
+        conn.executemany(
+            f"insert into {hist} (kind, bucket, n) values (?, ?, ?) "
+            f"on conflict(kind, bucket) do update set n = n + excluded.n",
+            [(kind, bucket, n) for (kind, bucket), n in hist_delta.items() if n],
+        )
+        if sign < 0:
+            conn.execute(f"delete from {hist} where n <= 0")
+
+    def _rebuild_stats(self, conn: sqlite3.Connection, table: Optional[str] = None) -> None:
+        """从主表和副表全量重算物化统计."""
+        table = table or self.table_name
+        hist = self._aux("hist", table)
+        summary = conn.execute(f"""
+            select count(*),
+                   count(score_num),
+                   coalesce(sum(cast(round(score_num * 10) as integer)), 0),
+                   sum(case when score_num >= 9.0 then 1 else 0 end)
+            from {table}
+        """).fetchone()
+        for key, value in zip(STATS_KEYS, summary):
+            self._set_meta(conn, key, value or 0, table)
+
+        conn.execute(f"delete from {hist}")
+        conn.execute(f"""
+            insert into {hist} (kind, bucket, n)
+            select 'score', cast(score_num as text), count(*) from {table} where score_num is not null group by score_num
+            union all
+            select 'year', cast(year_num as text), count(*) from {table} where year_num is not null group by year_num
+            union all
+            select 'genre', name, count(*) from {self._aux('genre', table)} group by name
+            union all
+            select 'country', name, count(*) from {self._aux('country', table)} group by name
+        """)
+
+    def rebuild_stats(self) -> None:
+        """按需全量重建当前表的物化统计 (例如手工修改过数据库之后)."""
+        self.create_table_if_not_exists()
+        with self._db.writer() as conn:
+            self._rebuild_stats(conn)
+        logger.info(f"Rebuilt statistics for {self.table_name}.")
+
+    def _get_hist(self, kind: str, order_by: str = "n desc", limit: int = -1) -> List[Tuple[str, int]]:
+        with self._connect() as conn:
+            hist = self._aux("hist")
+            if not self._has_table(conn, hist):
+                return []
+            return conn.execute(
+                f"select bucket, n from {hist} where kind = ? order by {order_by} limit ?", (kind, limit)
+            ).fetchall()
+
+    def count_movies(self) -> int:
+        """当前表的电影数量 (读取入库时维护的计数器，无需全表 count)."""
+        return self._get_meta("row_count")
+
+    def get_known_links(self) -> Set[str]:
+        """表中已有的全部详情页链接 (只扫描 info_link 唯一索引)，供增量爬取跳过已入库的电影."""
+        self.create_table_if_not_exists()
+        conn = self._connect()
+        return {row[0] for row in conn.execute(
+            f"select info_link from {self.table_name} where info_link <> ''"
+        )}
 
     def rename_table(self, old_name: str, new_name: str) -> None:
         """重命名数据表"""
         # 简单验证：只允许字母数字下划线
         if not new_name.isidentifier():
              raise ValueError("非法表名，仅支持字母、数字、下划线")
-             
-        with self._connect() as conn:
-            conn.execute(f"ALTER TABLE {old_name} RENAME TO {new_name}")
-            conn.commit()
+        # 双下划线保留给副表使用
+        if "__" in new_name:
+             raise ValueError("表名不能包含连续的下划线 '__'")
+
+        with self._db.writer() as conn:
+            renamed = [(old_name, new_name)]
+            for aux in self._aux_tables(conn, old_name):
+                renamed.append((aux, new_name + aux[len(old_name):]))
+            for old, new in renamed:
+                conn.execute(f"ALTER TABLE {old} RENAME TO {new}")
+                # 索引名带有表名前缀，随表一起重建
+                indexes = conn.execute(
+                    "select name from sqlite_master where type = 'index' and tbl_name = ? and sql is not null",
+                    (new,),
+                ).fetchall()
+                for (index_name,) in indexes:
+                    conn.execute(f"drop index {index_name}")
+            self._migrate(conn, new_name)
+            self._bump_version(conn, new_name)
+        self._migrated.discard(old_name)
             
         # 如果重命名的是当前操作的表，更新实例变量
         if self.table_name == old_name:
             self.table_name = new_name
 
-    def save_all(self, records: Iterable[Dict[str, str]]) -> int:
+    def save_all(self, records: Iterable[Dict[str, str]]) -> Dict[str, int]:
+        """批量保存电影 (按 info_link 去重).
+
+        库中不存在的链接直接插入；已存在的链接执行 UPSERT，只用非空的新值覆盖发生变化的字段，
+        没有变化的记录跳过。只按本批次的链接走唯一索引查询，代价为 O(batch).
+
+        Returns:
+            {"new": 新增数, "updated": 更新数, "skipped": 跳过数}
+        """
         records_list: List[Dict[str, str]] = list(records)
+        result = {"new": 0, "updated": 0, "skipped": 0}
         if not records_list:
-            return 0
+            return result
 
-        self.create_table_if_not_exists()
-        
-        # --- 去重逻辑 ---
-        with self._connect() as conn:
-            # 1. 获取库中已存在的链接
-            try:
-                existing_rows = conn.execute(f"select info_link from {self.table_name}").fetchall()
-                existing_links = set(r[0] for r in existing_rows)
-            except Exception:
-                # 假如表刚创建或出错，默认无重复
-                existing_links = set()
-        
-        # 2. 过滤掉库里已有的 + 过滤掉本次批次内重复的
-        unique_records = []
-        seen_links = set()
-        
+        columns = SAVE_FIELDS + tuple(NUMERIC_COLUMNS)
+        placeholders = ",".join(["?"] * len(columns))
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "info_link")
+        sql = (
+            f"insert into {self.table_name} ({','.join(columns)}) values ({placeholders}) "
+            f"on conflict(info_link) where info_link <> '' do update set {updates}"
+        )
+
+        # 1. 过滤掉无链接的记录和本批次内的重复
+        batch: Dict[str, Dict[str, str]] = {}
         for r in records_list:
             link = r.get("info_link", "")
-            # 如果库里没有 且 本次未添加过
-            if link and link not in existing_links and link not in seen_links:
-                unique_records.append(r)
-                seen_links.add(link)
-        
-        if not unique_records:
-            return 0
-            
-        # 3. 执行插入
-        fields: Sequence[str] = (
-            "info_link",
-            "pic_link",
-            "cname",
-            "score",
-            "rated",
-            "introduction",
-            "year_release",
-            "country",
-            "category",
-            "directors",
-            "actors",
+            if link and link not in batch:
+                batch[link] = r
+
+        with self._db.writer() as conn:
+            self._ensure_table(conn)
+            # 2. 只查询本批次链接对应的已有记录 (走唯一索引)
+            links = list(batch)
+            existing: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+            for i in range(0, len(links), 500):
+                chunk = links[i:i + 500]
+                rows = conn.execute(
+                    f"select id, {', '.join(SAVE_FIELDS)} from {self.table_name} "
+                    f"where info_link in ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    existing[row[1]] = (row[0], dict(zip(SAVE_FIELDS, row[1:])))
+
+            # 3. 分类: 新增 / 有变化 / 无变化
+            new_rows, updated = [], []
+            unchanged: Set[str] = set()
+            for link, record in batch.items():
+                if link not in existing:
+                    new_rows.append({f: record.get(f, "") for f in SAVE_FIELDS})
+                    continue
+                movie_id, old = existing[link]
+                # 空值不覆盖旧值 (例如详情页抓取失败时)
+                merged = {f: (record.get(f) or old[f] or "") for f in SAVE_FIELDS}
+                if all(merged[f] == (old[f] or "") for f in SAVE_FIELDS):
+                    unchanged.add(link)
+                    continue
+                updated.append((movie_id, old, merged))
+
+            # 同一条预编译语句批量执行 (executemany)，新增行的 id 再按链接一次查回
+            if new_rows or updated:
+                conn.executemany(sql, [tuple(r[f] for f in SAVE_FIELDS) + normalize_record(r)
+                                       for r in new_rows + [merged for _, _, merged in updated]])
+            new_ids: Dict[str, int] = {}
+            for i in range(0, len(new_rows), 500):
+                chunk = [r["info_link"] for r in new_rows[i:i + 500]]
+                new_ids.update((link, movie_id) for movie_id, link in conn.execute(
+                    f"select id, info_link from {self.table_name} where info_link in ({','.join('?' * len(chunk))})", chunk))
+            inserted = [(new_ids[r["info_link"]], r) for r in new_rows]
+
+            # 4. 副表、全文索引、物化统计、数据版本与主表在同一事务中维护
+            if inserted or updated:
+                self._bump_version(conn)
+            if updated:
+                self._delete_derived(conn, self.table_name, [movie_id for movie_id, _, _ in updated])
+                self._apply_stats(conn, [old for _, old, _ in updated], sign=-1)
+            self._touch_refresh(conn, [(movie_id, r, False) for movie_id, r in inserted] + [
+                (movie_id, merged, any((merged[f] or "") != (old[f] or "") for f in ("score", "rated")))
+                for movie_id, old, merged in updated
+            ] + [(movie_id, old, False) for link, (movie_id, old) in existing.items() if link in unchanged])
+            changed = inserted + [(movie_id, merged) for movie_id, _, merged in updated]
+            self._append_history(conn, [r for _, r in changed])
+            self._apply_stats(conn, [r for _, r in changed])
+            self._fill_side_tables(conn, self.table_name, [
+                (movie_id, r.get("category"), r.get("country"), r.get("directors"), r.get("actors"))
+                for movie_id, r in changed
+            ])
+            self._fill_fts(conn, self.table_name, [
+                (movie_id, r.get("cname"), r.get("directors"), r.get("actors"), r.get("category"),
+                 r.get("country"), r.get("introduction"), r.get("year_release"), r.get("score"))
+                for movie_id, r in changed
+            ])
+
+        result["new"] = len(inserted)
+        result["updated"] = len(updated)
+        result["skipped"] = len(records_list) - len(inserted) - len(updated)
+        logger.info(f"  > Batch saved: {result['new']} new, {result['updated']} updated, {result['skipped']} skipped.")
+        return result
+
+    def _touch_refresh(self, conn: sqlite3.Connection, rows: Sequence[Tuple[int, Dict[str, Any], bool]]) -> None:
+        """刚抓取过的电影: 记录抓取时间与评分/评价人数是否变化，并按 refresh_interval 排定下次抓取.
+
+        rows: (movie_id, record, changed).
+        """
+        if not rows:
+            return
+        refresh = self._aux("refresh")
+        ids = [movie_id for movie_id, _, _ in rows]
+        counts: Dict[int, Tuple[int, int]] = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            counts.update((m, (f, c)) for m, f, c in conn.execute(
+                f"select movie_id, fetches, changes from {refresh} where movie_id in ({','.join('?' * len(chunk))})", chunk))
+        now = time.time()
+        values = []
+        for movie_id, record, changed in rows:
+            fetches, changes = counts.get(movie_id, (0, 0))
+            fetches, changes = fetches + 1, changes + int(changed)
+            due = now + refresh_interval(parse_votes(record.get("rated")), fetches, changes)
+            values.append((movie_id, now, fetches, changes, due))
+        conn.executemany(
+            f"insert or replace into {refresh} (movie_id, last_fetched, fetches, changes, next_due) values (?, ?, ?, ?, ?)",
+            values,
         )
-        placeholders = ",".join(["?"] * len(fields))
-        sql = f"insert into {self.table_name} ({','.join(fields)}) values ({placeholders})"
-        values = [tuple(record.get(f, "") for f in fields) for record in unique_records]
 
-        with self._connect() as conn:
-            conn.executemany(sql, values)
-            conn.commit()
-            
-        logger.info(f"  > Batch saved: {len(unique_records)} new, {len(records_list) - len(unique_records)} skipped.")
-        return len(unique_records)
+    def _append_history(self, conn: sqlite3.Connection, records: Sequence[Dict[str, Any]]) -> None:
+        """把评分/评价人数与该电影最近一次历史值比较，只追加变化的字段 (两者都没变时不写)."""
+        current: Dict[int, Tuple[Optional[int], Optional[int]]] = {}
+        for record in records:
+            score_num, votes, _, subject_id = normalize_record(record)
+            if subject_id and (score_num is not None or votes is not None):
+                current[subject_id] = (score_x10(score_num), votes)
+        if not current:
+            return
+        history = self._aux("history")
+        ids = list(current)
+        last: Dict[int, Tuple[Optional[int], Optional[int]]] = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            last.update((sid, (score, votes)) for sid, score, votes in conn.execute(
+                f"with batch(subject_id) as (values {','.join(['(?)'] * len(chunk))}) "
+                f"select b.subject_id, "
+                f"(select score_x10 from {history} h where h.subject_id = b.subject_id and score_x10 is not null "
+                f"order by ts desc limit 1), "
+                f"(select votes from {history} h where h.subject_id = b.subject_id and votes is not null "
+                f"order by ts desc limit 1) from batch b", chunk))
+        now = int(time.time())
+        rows = []
+        for sid, (score, votes) in current.items():
+            old_score, old_votes = last.get(sid, (None, None))
+            score = score if score is not None and score != old_score else None
+            votes = votes if votes is not None and votes != old_votes else None
+            if score is not None or votes is not None:
+                rows.append((sid, now, score, votes))
+        # 同一秒内多次写入同一部电影时合并为一行
+        conn.executemany(
+            f"insert into {history} (subject_id, ts, score_x10, votes) values (?, ?, ?, ?) "
+            f"on conflict(subject_id, ts) do update set score_x10 = coalesce(excluded.score_x10, score_x10), "
+            f"votes = coalesce(excluded.votes, votes)",
+            rows,
+        )
+
+    def get_trend(self, subject: Any, since: Optional[float] = None, until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """一部电影 (subject id 或详情页链接) 的评分/评价人数变化轨迹，按时间升序.
+
+        历史表只存变化的字段，这里按主键范围扫描并向前填充，每个点都给出完整的 score 与 votes；
+        since 之前的最后取值作为 since 时刻的起点.
+        """
+        subject_id = subject if isinstance(subject, int) else parse_subject_id(subject)
+        conn = self._connect()
+        history = self._aux("history")
+        if not subject_id or not self._has_table(conn, history):
+            return []
+        rows = conn.execute(
+            f"select ts, score_x10, votes from {history} where subject_id = ? and ts <= ? order by ts",
+            (subject_id, int(until) if until is not None else 2 ** 62),
+        ).fetchall()
+        points: List[Dict[str, Any]] = []
+        score, votes = None, None
+        for ts, s10, v in rows:
+            score = s10 / 10 if s10 is not None else score
+            votes = v if v is not None else votes
+            point = {"ts": ts, "score": score, "votes": votes}
+            if since is not None and ts < since:
+                points = [dict(point, ts=int(since))] # 只保留 since 之前的最后一个点作为起点
+            else:
+                points.append(point)
+        return points
+
+    def get_biggest_movers(self, since: float, field: str = "score", limit: int = 10) -> List[Dict[str, Any]]:
+        """since 以来评分 (field="score") 或评价人数 (field="votes") 变化最大的电影，按变化幅度降序.
+
+        只检查 since 之后有历史记录的电影 (ts 索引)，起点取各自在 since 之前的最后取值 (主键倒序查找)，
+        终点为主表当前值；since 之后才首次出现的电影没有起点，不参与排序.
+
+        Returns:
+            [{"id", "cname", "info_link", "before", "after", "delta"}]
+        """
+        if field not in ("score", "votes"):
+            raise ValueError(f"Unknown field: {field}")
+        conn = self._connect()
+        history = self._aux("history")
+        if not self._has_table(conn, history):
+            return []
+        column, current = ("score_x10", "cast(round(m.score_num * 10) as integer)") if field == "score" else ("votes", "m.votes")
+        rows = conn.execute(f"""
+            select id, cname, info_link, before, after from (
+                select m.id as id, m.cname as cname, m.info_link as info_link, {current} as after,
+                       (select {column} from {history} h where h.subject_id = m.subject_id and h.ts <= ?
+                        and {column} is not null order by ts desc limit 1) as before
+                from {self.table_name} m
+                where m.subject_id in (select subject_id from {history} where ts > ?)
+            )
+            where before is not null and after is not null and after <> before
+            order by abs(after - before) desc limit ?
+        """, (int(since), int(since), limit)).fetchall()
+        if field == "votes":
+            return [{"id": i, "cname": cname, "info_link": link, "before": before, "after": after, "delta": after - before}
+                    for i, cname, link, before, after in rows]
+        return [{"id": i, "cname": cname, "info_link": link, "before": before / 10, "after": after / 10,
+                 "delta": round((after - before) / 10, 1)} for i, cname, link, before, after in rows]
+
+    def get_refresh_due(self, limit: int = 100, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """到期需要重新抓取的电影，最久未调度的在前 (同时到期时评价人数多的在前).
+
+        Returns:
+            [{"id", "info_link", "score", "rated", "votes", "last_fetched", "fetches", "changes"}]
+        """
+        conn = self._connect()
+        refresh = self._aux("refresh")
+        if not self._has_table(conn, refresh):
+            return []
+        rows = conn.execute(
+            f"select m.id, m.info_link, m.score, m.rated, m.votes, r.last_fetched, r.fetches, r.changes "
+            f"from {refresh} r join {self.table_name} m on m.id = r.movie_id "
+            f"where r.next_due <= ? and m.info_link <> '' order by r.next_due, coalesce(m.votes, 0) desc limit ?",
+            (time.time() if now is None else now, limit),
+        ).fetchall()
+        keys = ("id", "info_link", "score", "rated", "votes", "last_fetched", "fetches", "changes")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def defer_refresh(self, movie_ids: Sequence[int], delay: float) -> None:
+        """重新抓取失败的电影推迟 delay 秒再试 (不计入抓取次数)."""
+        refresh = self._aux("refresh")
+        with self._db.writer() as conn:
+            conn.executemany(f"update {refresh} set next_due = ? where movie_id = ?",
+                             [(time.time() + delay, movie_id) for movie_id in movie_ids])
+
+    def get_refresh_summary(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """调度概况: 跟踪的电影数、当前到期数、最早的上次抓取时间、累计抓取/变化次数."""
+        conn = self._connect()
+        refresh = self._aux("refresh")
+        if not self._has_table(conn, refresh):
+            return {"tracked": 0, "due": 0, "oldest_fetch": None, "fetches": 0, "changes": 0}
+        tracked, oldest, fetches, changes = conn.execute(
+            f"select count(*), min(last_fetched), coalesce(sum(fetches), 0), coalesce(sum(changes), 0) from {refresh}"
+        ).fetchone()
+        due = conn.execute(f"select count(*) from {refresh} where next_due <= ?",
+                           (time.time() if now is None else now,)).fetchone()[0]
+        return {"tracked": tracked, "due": due, "oldest_fetch": oldest, "fetches": fetches, "changes": changes}
 
     # --- 读取方法 (从 app.py 重构而来) ---
 
     def _connect(self):
-        return sqlite3.connect(self.db_path, timeout=30)
+        """当前线程复用的只读连接 (写操作请使用 self._db.writer())."""
+        self._prepare()
+        return self._db.reader()
 
     def get_stats(self) -> Dict[str, Any]:
-        """获取看板的汇总统计信息."""
+        """获取看板的汇总统计信息 (读取物化统计，O(1))."""
         with self._connect() as conn:
-            cur = conn.cursor()
-            total = cur.execute(f"select count(*) from {self.table_name}").fetchone()[0] or 0
-            avg_score_row = cur.execute(f"select round(avg(score),2) from {self.table_name}").fetchone()
-            avg_score = avg_score_row[0] if avg_score_row and avg_score_row[0] else 0
-            high_score = cur.execute(f"select count(*) from {self.table_name} where score >= 9.0").fetchone()[0] or 0
-            years = cur.execute(f"select count(distinct year_release) from {self.table_name}").fetchone()[0] or 0
-            return {
-                "total": total,
-                "avg_score": avg_score,
-                "high_score": high_score,
-                "years": years
-            }
-
-    def get_paginated_movies(self, page: int, limit: int = 50) -> Tuple[List[Any], int]:
-        """获取指定页码的电影及总页数."""
+            meta = self._aux("meta")
+            if not self._has_table(conn, meta):
+                return {"total": 0, "avg_score": 0, "high_score": 0, "years": 0}
+            values = dict(conn.execute(f"select key, value from {meta}").fetchall())
+            years = conn.execute(
+                f"select count(*) from {self._aux('hist')} where kind = 'year'"
+            ).fetchone()[0]
+        score_count = values.get("score_count", 0)
+        avg_score = round(values.get("score_sum_x10", 0) / score_count / 10, 2) if score_count else 0
+        return {
+            "total": values.get("row_count", 0),
+            "avg_score": avg_score,
+            "high_score": values.get("high_score", 0),
+            "years": years
+        }
+
+    def get_paginated_movies(self, page: int, limit: int = 50, sort: str = "id") -> Tuple[List[Any], int]:
+        """获取指定页码的电影及总页数 (随机跳页使用 OFFSET，顺序翻页请使用 get_movies_page)."""
         offset = (page - 1) * limit
+        total = self.count_movies()
+        total_pages = max(math.ceil(total / limit), 1) if limit > 0 else 1
+
+        exprs, desc = LIST_ORDERS.get(sort, LIST_ORDERS["id"])
+        order_by = ", ".join(f"{e} {'desc' if desc else 'asc'}" for e in exprs)
         with self._connect() as conn:
-            cur = conn.cursor()
-            total = cur.execute(f"select count(*) from {self.table_name}").fetchone()[0] or 0
-            
-            import math
-            total_pages = math.ceil(total / limit) if limit > 0 else 1
-            if total == 0: total_pages = 1
+            rows = conn.execute(
+                f"select {self._columns} from {self.table_name} order by {order_by} limit ? offset ?",
+                (limit, offset),
+            ).fetchall()
+        return rows, total_pages
+
+    def get_movies_page(self, cursor: Optional[str] = None, limit: int = 50, sort: str = "id",
+                        backward: bool = False) -> Tuple[List[Any], Optional[str], Optional[str]]:
+        """Keyset (seek) 分页: 从游标位置继续读取，代价与页码深度无关.
+
+        Args:
+            cursor: 上一次返回的游标，None 表示从头开始
+            sort: 排序方式，见 LIST_ORDERS
+            backward: True 表示向前翻页 (读取游标之前的一页)
+        Returns:
+            (rows, next_cursor, prev_cursor)，没有下一页/上一页时对应游标为 None
+        """
+        if sort not in LIST_ORDERS:
+            raise ValueError(f"不支持的排序方式: {sort}")
+        exprs, desc = LIST_ORDERS[sort]
+        key = ", ".join(exprs)
+        ascending = desc == backward
+        where, args = "", []
+        if cursor:
+            args = decode_cursor(cursor, sort)
+            op = ">" if ascending else "<"
+            where = f"where ({key}) {op} ({', '.join('?' * len(exprs))})"
+            if len(exprs) > 1:
+                # 行值比较无法直接命中表达式索引，额外给出首列的范围条件以便走索引 SEARCH
+                where += f" and {exprs[0]} {op}= ?"
+                args = args + [args[0]]
+        order_by = ", ".join(f"{e} {'asc' if ascending else 'desc'}" for e in exprs)
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"select {self._columns}, {key} from {self.table_name} {where} order by {order_by} limit ?",
+                args + [limit + 1],
+            ).fetchall()
+
+        has_more = len(rows) > limit # 多取一行判断是否还有数据
+        rows = rows[:limit]
+        if backward:
+            rows.reverse()
+        keys = [list(r[len(BASE_COLUMNS):]) for r in rows]
+        rows = [r[:len(BASE_COLUMNS)] for r in rows]
+        if not rows:
+            return rows, None, None
+
+        more_after = has_more if not backward else bool(cursor)
+        more_before = bool(cursor) if not backward else has_more
+        next_cursor = encode_cursor(sort, keys[-1]) if more_after else None
+        prev_cursor = encode_cursor(sort, keys[0]) if more_before else None
+        return rows, next_cursor, prev_cursor
 
-            rows = cur.execute(f"select * from {self.table_name} limit ? offset ?", (limit, offset)).fetchall()
-            return rows, total_pages
+    def search_movies(self, keyword: str, limit: int = 100, offset: int = 0,
+                      with_snippet: bool = False) -> List[Any]:
+        """按标题、人物、类型、简介等全文搜索电影，按 BM25 相关度排序.
 
-    def search_movies(self, keyword: str) -> List[Any]:
-        """按标题、演员、导演或类型搜索电影."""
-        if not keyword:
+        with_snippet=True 时每行末尾追加一列高亮后的简介摘要 (HTML, 命中词用 <mark> 包裹).
+        """
+        if not keyword or not keyword.strip():
             return []
-        
-        # 1. 动态检查表列名
+
+        fts = self._aux("fts")
         with self._connect() as conn:
-            columns_info = conn.execute(f"PRAGMA table_info({self.table_name})").fetchall()
-            columns = [info[1] for info in columns_info]
-
-        # 2. 构建查询
-        search_fields = ["cname", "category", "introduction", "year_release", "score", "rated"]
-        if "actors" in columns:
-            search_fields.append("actors")
-        if "directors" in columns:
-            search_fields.append("directors")
-        if "country" in columns:
-            search_fields.append("country")
-            
+            if not self._has_table(conn, fts):
+                return self._search_like(keyword, limit, offset, with_snippet)
+            query = build_match_query(keyword)
+            if not query:
+                return []
+            columns = ", ".join(f"m.{c}" for c in BASE_COLUMNS)
+            snippet = f", snippet({fts}, 3, char(2), char(3), '…', 24)" if with_snippet else ""
+            weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+            rows = conn.execute(f"""
+                select {columns}{snippet}
+                from {fts} join {self.table_name} m on m.id = {fts}.rowid
+                where {fts} match ?
+                order by bm25({fts}, {weights})
+                limit ? offset ?
+            """, (query, limit, offset)).fetchall()
+        if with_snippet:
+            rows = [tuple(r[:-1]) + (_highlight(r[-1]),) for r in rows]
+        return rows
+
+    def count_search_results(self, keyword: str) -> int:
+        """统计全文搜索的命中数量."""
+        if not keyword or not keyword.strip():
+            return 0
+        fts = self._aux("fts")
+        with self._connect() as conn:
+            if not self._has_table(conn, fts):
+                return len(self._search_like(keyword, -1, 0, False))
+            query = build_match_query(keyword)
+            if not query:
+                return 0
+            return conn.execute(f"select count(*) from {fts} where {fts} match ?", (query,)).fetchone()[0]
+
+    def _search_like(self, keyword: str, limit: int, offset: int, with_snippet: bool) -> List[Any]:
+        """不支持 FTS5 时的兜底方案: 多字段 LIKE 全表扫描."""
+        search_fields = ["cname", "category", "introduction", "year_release", "score", "rated",
+                         "actors", "directors", "country"]
         where_clause = " OR ".join([f"{field} LIKE ?" for field in search_fields])
-        sql = f"select * from {self.table_name} where {where_clause}"
-        
-        # 3. 执行
+        sql = f"select {self._columns} from {self.table_name} where {where_clause} limit ? offset ?"
         pattern = f"%{keyword}%"
-        args = [pattern] * len(search_fields)
-        
+        args = [pattern] * len(search_fields) + [limit, offset]
         with self._connect() as conn:
-             return conn.execute(sql, args).fetchall()
+            rows = conn.execute(sql, args).fetchall()
+        if with_snippet:
+            rows = [tuple(r) + (html.escape((r[6] or "")[:60]),) for r in rows]
+        return rows
 
     def get_all_movies(self) -> List[Any]:
-        """获取所有电影记录 (例如用于导出)."""
-        with self._connect() as conn:
-            return conn.execute(f"select * from {self.table_name}").fetchall()
+        """获取所有电影记录 (一次性读入内存，大表请使用 iter_movies)."""
+        return list(self.iter_movies())
+
+    def iter_movies(self, batch_size: int = 500, columns: Optional[Sequence[str]] = None) -> Iterator[Tuple[Any, ...]]:
+        """按 id 顺序分批流式读取电影，内存占用与表大小无关.
+
+        Args:
+            batch_size: 每次从 SQLite 取出的行数
+            columns: 需要的列 (默认为 BASE_COLUMNS 的 12 列)，返回的元组按此顺序排列
+        """
+        columns = tuple(columns or BASE_COLUMNS)
+        allowed = set(BASE_COLUMNS) | set(NUMERIC_COLUMNS)
+        unknown = [c for c in columns if c not in allowed]
+        if unknown:
+            raise ValueError(f"未知的列: {unknown}")
+        conn = self._connect()
+        if not self._has_table(conn, self.table_name):
+            return
+        cur = conn.execute(f"select {', '.join(columns)} from {self.table_name} order by id")
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
 
     def get_score_distribution(self) -> Tuple[List[str], List[int]]:
         """获取电影评分分布(排除 0 分或无评分数据)."""
-        with self._connect() as conn:
-            sql = f"""
-                select score, count(score) 
-                from {self.table_name} 
-                where score is not null 
-                  and score != '' 
-                  and score != '0' 
-                  and score != '0.0'
-                group by score 
-                order by score
-            """
-            data = conn.execute(sql).fetchall()
-        labels = [str(r[0]) for r in data]
+        data = self._get_hist("score", order_by="cast(bucket as real)")
+        labels = [r[0] for r in data]
         counts = [r[1] for r in data]
         return labels, counts
 
     def get_year_distribution(self) -> Tuple[List[str], List[int]]:
-        """获取电影上映年份分布(清洗并排序)."""
-        import re
-        with self._connect() as conn:
-            # 获取所有原始年份字段
-            raw_data = conn.execute(f"select year_release from {self.table_name}").fetchall()
-        
-        from collections import Counter
-        year_counts = Counter()
-        
-        for row in raw_data:
-            val = str(row[0]) if row[0] else ""
-            # 提取4位数字年份 (例如: "2024(中国大陆)" -> "2024")
-            match = re.search(r'(\d{4})', val)
-            if match:
-                year = match.group(1)
-                # 简单过滤异常年份
-                if 1900 <= int(year) <= 2030:
-                    year_counts[year] += 1
-        
-        # 按年份排序
-        sorted_years = sorted(year_counts.keys())
-        labels = sorted_years
-        counts = [year_counts[y] for y in sorted_years]
-        
+        """获取电影上映年份分布(过滤异常年份并排序)."""
+        data = [r for r in self._get_hist("year", order_by="cast(bucket as integer)") if 1900 <= int(r[0]) <= 2030]
+        labels = [r[0] for r in data]
+        counts = [r[1] for r in data]
         return labels, counts
 
     def get_genre_statistics(self) -> List[Dict[str, Any]]:
         """获取 ECharts 使用的类型统计."""
-        with self._connect() as conn:
-            rows = conn.execute(f"select category from {self.table_name}").fetchall()
-        
-        genre_data: Dict[str, int] = {}
-        for row in rows:
-            if not row[0]: continue
-            # Split by space as crawler saves them space-separated
-            cats = row[0].split() 
-            for c in cats:
-                genre_data[c] = genre_data.get(c, 0) + 1
-        
-        return [{"name": k, "value": v} for k, v in genre_data.items()]
+        return [{"name": name, "value": n} for name, n in self._get_hist("genre")]
 
     def get_country_statistics(self) -> Tuple[List[str], List[int]]:
-        """获取国家/地区统计."""
-        with self._connect() as conn:
-            rows = conn.execute(f"select country from {self.table_name}").fetchall()
-        
-        country_data: Dict[str, int] = {}
-        for row in rows:
-            if not row[0]: continue
-            # 使用正则分割：同时支持空格和斜杠，排除空字符串
-            # [ /]+ 匹配一个或多个空格或斜杠
-            cts = re.split(r'[ /]+', row[0])
-            for c in cts:
-                if c.strip():
-                    country_data[c] = country_data.get(c, 0) + 1
-        
-        # 按数量倒序排列
-        sorted_data = sorted(country_data.items(), key=lambda x: x[1], reverse=False)
-        
-        labels = [item[0] for item in sorted_data]
-        counts = [item[1] for item in sorted_data]
+        """获取国家/地区统计 (按数量升序)."""
+        data = self._get_hist("country", order_by="n, bucket")
+        labels = [r[0] for r in data]
+        counts = [r[1] for r in data]
         return labels, counts
 
+    def get_person_graph(self, limit_nodes: int = 80) -> Tuple[List[Tuple[str, int, bool]], List[Tuple[str, str, int]]]:
+        """获取出现次数最多的 N 位人物及其合作关系.
+
+        Returns:
+            nodes: [(姓名, 出现次数, 是否担任过导演)]
+            edges: [(人物A, 人物B, 合作次数)]，仅包含 Top N 人物之间的边
+        """
+        person = self._aux("person")
+        with self._connect() as conn:
+            nodes = conn.execute(f"""
+                select name, count(*) as n, max(role = 'director')
+                from {person}
+                group by name
+                order by n desc, min(movie_id)
+                limit ?
+            """, (limit_nodes,)).fetchall()
+            # 导演-主演 关系，以及每部戏前 3 位主演之间的关系
+            edges = conn.execute(f"""
+                with top as (
+                    select name from {person} group by name order by count(*) desc, min(movie_id) limit ?
+                ),
+                p as (select * from {person} where name in (select name from top))
+                select min(a.name, b.name), max(a.name, b.name), count(*)
+                from p a join p b on a.movie_id = b.movie_id
+                where (a.role = 'director' and b.role = 'actor' and a.name != b.name)
+                   or (a.role = 'actor' and b.role = 'actor' and a.position < b.position and b.position < 3)
+                group by 1, 2
+            """, (limit_nodes,)).fetchall()
+        return [(r[0], r[1], bool(r[2])) for r in nodes], [(r[0], r[1], r[2]) for r in edges]
+
     def get_all_category_text(self) -> str:
         """获取所有合并的分类文本 (用于词云)."""
         with self._connect() as conn:
@@ -277,7 +1122,7 @@ class MovieRepository:
     def get_movie_by_id(self, movie_id: int) -> Optional[Any]:
         """根据 ID 获取单个电影详情"""
         with self._connect() as conn:
-            row = conn.execute(f"select * from {self.table_name} where id = ?", (movie_id,)).fetchone()
+            row = conn.execute(f"select {self._columns} from {self.table_name} where id = ?", (movie_id,)).fetchone()
             if row:
                 return row
             return None
@@ -287,15 +1132,11 @@ class MovieRepository:
         if not ids: return []
         placeholders = ",".join(["?"] * len(ids))
         with self._connect() as conn:
-            return conn.execute(f"select * from {self.table_name} where id in ({placeholders})", ids).fetchall()
+            return conn.execute(f"select {self._columns} from {self.table_name} where id in ({placeholders})", ids).fetchall()
 
     def get_top_genres(self, limit: int = 9) -> List[str]:
         """获取数量最多的前 N 个电影类型."""
-        all_stats = self.get_genre_statistics()
-        # 按数量倒序排列
-        sorted_stats = sorted(all_stats, key=lambda x: x['value'], reverse=True)
-        # 提取名称
-        return [item['name'] for item in sorted_stats[:limit]]
+        return [name for name, _ in self._get_hist("genre", limit=limit)]
 
 
 __all__ = ["MovieRepository"]
@@ -0,0 +1,358 @@
+import json
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage.connection import ConnectionManager
+from storage.ingest import INGEST_AUTHKEY, INGEST_KEY_ENV, is_loopback, resolve_authkey
+from utils.logger import logger
+
+WORK_QUEUE_DB = os.path.join("data", "workqueue.db")
+QUEUE_PORT = 8766
+REMOTE_CALLS = ("enqueue", "claim", "heartbeat", "complete", "fail", "reap",
+                "pending_results", "mark_ingested", "counts", "drained") # 允许远程调用的队列方法
+
+
+class Task:
+    """一个已被领取的任务 (claim 的返回值)."""
+
+    __slots__ = ("id", "kind", "key", "payload", "attempts")
+
+    def __init__(self, task_id: int, kind: str, key: str, payload: Any, attempts: int) -> None:
+        self.id = task_id
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+
+    def __repr__(self) -> str:
+        return f"Task(#{self.id} {self.key}, attempt {self.attempts})"
+
+
+class WorkQueue:
+    """基于租约 (lease) 的 SQLite 任务队列.
+
+    crawl_task 保存待执行的任务 (标签分页 / 详情页)，key 唯一，重复入队会被忽略 (跨标签去重)。
+    工作进程用 claim() 领取任务: 一条 UPDATE ... RETURNING 把 queued 任务改为 leased 并写入租约到期时间，
+    多个进程同时领取也不会拿到同一个任务；执行期间用 heartbeat() 续租，完成后 complete() 提交结果。
+    租约过期 (工作进程崩溃、断网) 的任务由 reap() 重新放回队列，超过 max_attempts 次的标记为 failed。
+    complete() 的结果写入 crawl_result，由中央写入进程 (work_queue.py writer) 统一入库，再 mark_ingested().
+
+    队列库使用回滚日志 (journal_mode=DELETE)，不开启 mmap，只适合同一台机器上的多个进程直接打开。
+    多台机器时不要把队列库放在网络文件系统上 (文件锁不可靠)，而是由一台机器运行 WorkQueueServer
+    (work_queue.py serve) 持有队列库，其他机器通过 RemoteWorkQueue 访问.
+    """
+
+    def __init__(self, db_path: str = WORK_QUEUE_DB, max_attempts: int = 3) -> None:
+        parent = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(parent, exist_ok=True)
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        # 独立的连接管理器 (不与 get_manager 共享)，不使用依赖本机共享内存的 WAL
+        self._db = ConnectionManager(db_path, mmap_size=0, journal_mode="DELETE")
+        with self._db.writer() as conn:
+            conn.execute("""
+                create table if not exists crawl_task (
+                    id integer primary key autoincrement,
+                    kind text not null,
+                    key text not null unique,
+                    payload text not null,
+                    state text not null default 'queued',
+                    attempts integer not null default 0,
+                    lease_owner text,
+                    lease_expires real,
+                    error text,
+                    created_at real not null,
+                    updated_at real not null
+                )
+            """)
+            conn.execute("create index if not exists idx_crawl_task_state on crawl_task(state, id)")
+            conn.execute("""
+                create table if not exists crawl_result (
+                    id integer primary key autoincrement,
+                    task_id integer not null,
+                    records text not null,
+                    ingested integer not null default 0,
+                    created_at real not null
+                )
+            """)
+            conn.execute("create index if not exists idx_crawl_result_pending on crawl_result(ingested, id)")
+
+    # --- 生产者 ---
+    def enqueue(self, tasks: Iterable[Tuple[str, str, Any]]) -> int:
+        """批量入队 [(kind, key, payload)]，已存在的 key 被忽略. 返回新入队的数量."""
+        now = time.time()
+        rows = [(kind, key, json.dumps(payload, ensure_ascii=False), now, now) for kind, key, payload in tasks]
+        if not rows:
+            return 0
+        with self._db.writer() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "insert or ignore into crawl_task (kind, key, payload, created_at, updated_at) values (?, ?, ?, ?, ?)", rows
+            )
+            return conn.total_changes - before
+
+    # --- 工作进程 ---
+    def claim(self, owner: str, lease_seconds: float = 60.0, limit: int = 1) -> List[Task]:
+        """领取最多 limit 个任务，租约 lease_seconds 秒."""
+        self.reap()
+        now = time.time()
+        with self._db.writer() as conn:
+            rows = conn.execute(
+                "update crawl_task set state = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? "
+                "where id in (select id from crawl_task where state = 'queued' order by id limit ?) "
+                "returning id, kind, key, payload, attempts",
+                (owner, now + lease_seconds, now, limit),
+            ).fetchall()
+        return [Task(i, kind, key, json.loads(payload), attempts) for i, kind, key, payload, attempts in sorted(rows)]
+
+    def heartbeat(self, task_ids: Iterable[int], owner: str, lease_seconds: float = 60.0) -> List[int]:
+        """为 owner 仍持有的任务续租，返回续租成功的任务 id (租约已丢失的不在其中)."""
+        ids = list(task_ids)
+        if not ids:
+            return []
+        now = time.time()
+        with self._db.writer() as conn:
+            rows = conn.execute(
+                f"update crawl_task set lease_expires = ?, updated_at = ? "
+                f"where state = 'leased' and lease_owner = ? and id in ({','.join('?' * len(ids))}) returning id",
+                (now + lease_seconds, now, owner, *ids),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def complete(self, task: Task, owner: str, records: List[Dict[str, str]],
+                 follow_up: Iterable[Tuple[str, str, Any]] = ()) -> bool:
+        """提交结果并把任务标记为 done；follow_up 为由此产生的新任务 (例如列表页中的详情页).
+
+        租约已过期并被他人领取时返回 False，结果被丢弃 (避免同一任务的结果重复入库).
+        """
+        now = time.time()
+        with self._db.writer() as conn:
+            row = conn.execute(
+                "update crawl_task set state = 'done', lease_owner = null, lease_expires = null, error = null, "
+                "updated_at = ? where id = ? and state = 'leased' and lease_owner = ? returning id",
+                (now, task.id, owner),
+            ).fetchone()
+            if row is None:
+                logger.warning(f"Lease lost for {task!r}; discarding its result.")
+                return False
+            if records:
+                conn.execute("insert into crawl_result (task_id, records, created_at) values (?, ?, ?)",
+                             (task.id, json.dumps(records, ensure_ascii=False), now))
+            self.enqueue(follow_up) # 同一个事务 (写连接支持嵌套)
+        return True
+
+    def fail(self, task: Task, owner: str, error: str) -> None:
+        """任务执行失败: 未超过 max_attempts 时重新排队，否则标记为 failed."""
+        with self._db.writer() as conn:
+            conn.execute(
+                "update crawl_task set state = case when attempts >= ? then 'failed' else 'queued' end, "
+                "lease_owner = null, lease_expires = null, error = ?, updated_at = ? "
+                "where id = ? and state = 'leased' and lease_owner = ?",
+                (self.max_attempts, error[:500], time.time(), task.id, owner),
+            )
+
+    def reap(self) -> int:
+        """把租约已过期的任务放回队列 (或在重试次数用尽时标记为 failed)，返回处理的数量."""
+        now = time.time()
+        with self._db.writer() as conn:
+            cur = conn.execute(
+                "update crawl_task set state = case when attempts >= ? then 'failed' else 'queued' end, "
+                "lease_owner = null, lease_expires = null, error = 'lease expired', updated_at = ? "
+                "where state = 'leased' and lease_expires < ?",
+                (self.max_attempts, now, now),
+            )
+        if cur.rowcount:
+            logger.warning(f"Re-queued {cur.rowcount} tasks with expired leases.")
+        return cur.rowcount
+
+    # --- 中央写入进程 ---
+    def pending_results(self, limit: int = 100) -> List[Tuple[int, List[Dict[str, str]]]]:
+        """尚未入库的结果 [(result_id, records)]，按提交顺序."""
+        rows = self._db.reader().execute(
+            "select id, records from crawl_result where ingested = 0 order by id limit ?", (limit,)
+        ).fetchall()
+        return [(i, json.loads(records)) for i, records in rows]
+
+    def mark_ingested(self, result_ids: Iterable[int]) -> None:
+        with self._db.writer() as conn:
+            conn.executemany("update crawl_result set ingested = 1 where id = ?", [(i,) for i in result_ids])
+
+    # --- 状态 ---
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数，以及未入库的结果数 (pending_results)."""
+        conn = self._db.reader()
+        result = {state: n for state, n in conn.execute("select state, count(*) from crawl_task group by state")}
+        result["pending_results"] = conn.execute("select count(*) from crawl_result where ingested = 0").fetchone()[0]
+        return result
+
+    def drained(self) -> bool:
+        """没有待执行/执行中的任务."""
+        counts = self.counts()
+        return not counts.get("queued") and not counts.get("leased")
+
+
+def _send(conn: Connection, message: Any) -> None:
+    conn.send_bytes(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+
+def _recv(conn: Connection) -> Any:
+    return json.loads(conn.recv_bytes().decode("utf-8"))
+
+
+def _task_fields(task: Task) -> List[Any]:
+    return [task.id, task.kind, task.key, task.payload, task.attempts]
+
+
+class WorkQueueServer:
+    """持有队列库的队列服务: 其他机器上的工作进程 / 写入进程经 RemoteWorkQueue 调用 WorkQueue 的方法.
+
+    每个客户端连接一个线程，请求 [方法名, 参数列表] 以 JSON 编码，回复 ["ok", 结果] 或 ["error", 消息]。
+    所有写操作经同一个 WorkQueue 串行化，队列库只被本进程打开。密钥规则与入库服务相同
+    (--authkey 或环境变量 DOUBAN_INGEST_KEY)，使用默认密钥时拒绝监听非回环地址 (ValueError).
+    """
+
+    def __init__(self, queue: WorkQueue, address: Tuple[str, int] = ("127.0.0.1", QUEUE_PORT),
+                 authkey: Optional[bytes] = None) -> None:
+        authkey = resolve_authkey(authkey)
+        if authkey == INGEST_AUTHKEY and not is_loopback(address[0]):
+            raise ValueError(f"Refusing to listen on {address[0]} with the default key; "
+                             f"set --authkey or {INGEST_KEY_ENV}")
+        self.queue = queue
+        self._listener = Listener(address, authkey=authkey, backlog=64)
+        self._closed = threading.Event()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._listener.address
+
+    def __enter__(self) -> "WorkQueueServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start(self) -> "WorkQueueServer":
+        threading.Thread(target=self._accept_loop, name="queue-accept", daemon=True).start()
+        logger.info(f"Work queue server listening on {self.address[0]}:{self.address[1]} -> {self.queue.db_path}")
+        return self
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            while not self._closed.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if not self._closed.is_set():
+            self._closed.set()
+            self._listener.close()
+
+    def _accept_loop(self) -> None:
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._closed.is_set():
+                    return
+                logger.warning("Work queue server: rejected a connection (bad authkey?)")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="queue-conn", daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        while True:
+            try:
+                method, args = _recv(conn)
+            except (EOFError, OSError):
+                return
+            except Exception as e: # 格式不对的消息
+                logger.warning(f"Work queue server: malformed request ({e}); closing connection")
+                conn.close()
+                return
+            try:
+                reply = ["ok", self._call(method, args)]
+            except Exception as e:
+                logger.error(f"Work queue request {method} failed: {e}")
+                reply = ["error", f"{type(e).__name__}: {e}"]
+            try:
+                _send(conn, reply)
+            except (OSError, EOFError):
+                return
+
+    def _call(self, method: str, args: List[Any]) -> Any:
+        if method not in REMOTE_CALLS:
+            raise ValueError(f"unsupported operation: {method}")
+        if method in ("complete", "fail"):
+            args = [Task(*args[0]), *args[1:]]
+        result = getattr(self.queue, method)(*args)
+        return [_task_fields(t) for t in result] if method == "claim" else result
+
+
+class RemoteWorkQueue:
+    """WorkQueueServer 的客户端，接口与 WorkQueue 兼容 (可直接传给 QueueWorker / run_writer).
+
+    一个连接由各线程共享，请求按顺序同步执行.
+    """
+
+    def __init__(self, address: Tuple[str, int], authkey: Optional[bytes] = None) -> None:
+        self.address = address
+        self._conn = Client(address, authkey=resolve_authkey(authkey))
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "RemoteWorkQueue":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _call(self, method: str, *args: Any) -> Any:
+        with self._lock:
+            _send(self._conn, [method, list(args)])
+            status, result = _recv(self._conn)
+        if status != "ok":
+            raise RuntimeError(f"work queue server: {result}")
+        return result
+
+    def enqueue(self, tasks: Iterable[Tuple[str, str, Any]]) -> int:
+        return self._call("enqueue", [list(t) for t in tasks])
+
+    def claim(self, owner: str, lease_seconds: float = 60.0, limit: int = 1) -> List[Task]:
+        return [Task(*fields) for fields in self._call("claim", owner, lease_seconds, limit)]
+
+    def heartbeat(self, task_ids: Iterable[int], owner: str, lease_seconds: float = 60.0) -> List[int]:
+        return self._call("heartbeat", list(task_ids), owner, lease_seconds)
+
+    def complete(self, task: Task, owner: str, records: List[Dict[str, str]],
+                 follow_up: Iterable[Tuple[str, str, Any]] = ()) -> bool:
+        return self._call("complete", _task_fields(task), owner, records, [list(t) for t in follow_up])
+
+    def fail(self, task: Task, owner: str, error: str) -> None:
+        self._call("fail", _task_fields(task), owner, error)
+
+    def reap(self) -> int:
+        return self._call("reap")
+
+    def pending_results(self, limit: int = 100) -> List[Tuple[int, List[Dict[str, str]]]]:
+        return [(i, records) for i, records in self._call("pending_results", limit)]
+
+    def mark_ingested(self, result_ids: Iterable[int]) -> None:
+        self._call("mark_ingested", list(result_ids))
+
+    def counts(self) -> Dict[str, int]:
+        return self._call("counts")
+
+    def drained(self) -> bool:
+        return self._call("drained")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+__all__ = ["Task", "WorkQueue", "WorkQueueServer", "RemoteWorkQueue", "WORK_QUEUE_DB", "QUEUE_PORT"]
@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Protocol
+
+from utils.logger import logger
+
+
+class RecordSink(Protocol):
+    """BufferedWriter 的写入目标: MovieRepository，或经入库服务写入的 IngestClient (只需要 save_all)."""
+
+    def save_all(self, records: List[Dict[str, str]]) -> Dict[str, int]:
+        ...
+
+
+class BufferedWriter:
+    """跨列表页的缓冲写入.
+
+    爬虫每抓完一页就回调一次 add()，记录先进入缓冲区，累计到 max_records 条或最早一条已缓冲
+    max_seconds 秒时才调用一次 repo.save_all (一个事务)。checkpoint() 在进度回调时检查时间阈值，
+    close() 在结束/中断时写入剩余记录。每次写入成功后调用 on_flush (例如让爬取前沿把对应列表页标记为已入库)。
+    线程安全: pipeline 引擎中 add() 与 checkpoint() 来自不同线程.
+    """
+
+    def __init__(self, repo: RecordSink, max_records: int = 500, max_seconds: float = 30.0,
+                 on_flush: Optional[Callable[[], None]] = None, verbose: bool = True) -> None:
+        self.repo = repo
+        self.max_records = max(1, max_records)
+        self.max_seconds = max_seconds
+        self.on_flush = on_flush
+        self.verbose = verbose
+        self.stats: Dict[str, float] = {"records": 0, "flushes": 0, "new": 0, "updated": 0, "seconds": 0.0}
+        self._buffer: List[Dict[str, str]] = []
+        self._first_at = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def add(self, records: List[Dict[str, str]]) -> None:
+        with self._lock:
+            if records and not self._buffer:
+                self._first_at = time.monotonic()
+            self._buffer.extend(records)
+            if len(self._buffer) >= self.max_records:
+                self.flush()
+            else:
+                self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """进度检查点: 缓冲时间超过阈值时写入."""
+        with self._lock:
+            if self._buffer and time.monotonic() - self._first_at >= self.max_seconds:
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._buffer:
+                started = time.perf_counter()
+                result = self.repo.save_all(self._buffer)
+                self.stats["seconds"] += time.perf_counter() - started
+                self.stats["records"] += len(self._buffer)
+                self.stats["flushes"] += 1
+                self.stats["new"] += result["new"]
+                self.stats["updated"] += result["updated"]
+                if self.verbose:
+                    logger.info(f"  [Flushed {len(self._buffer)} records: {result['new']} new, {result['updated']} updated]")
+                self._buffer = []
+            if self.on_flush: # 即使本次没有记录 (例如整页都是已知电影)，之前的页面也已完整入库
+                self.on_flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self.verbose and self.stats["flushes"]:
+            s = self.stats
+            rate = s["records"] / s["seconds"] if s["seconds"] else 0.0
+            logger.info(f"Buffered writer: {s['records']} records in {s['flushes']} transactions "
+                        f"({s['seconds']:.2f}s, {rate:.0f} records/s)")
+
+
+__all__ = ["BufferedWriter", "RecordSink"]
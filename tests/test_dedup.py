@@ -0,0 +1,62 @@
+import unittest
+
+from benchmarks.replay_server import ReplayServer, SyntheticCorpus
+from spider.dedup import SeenSubjects
+from spider.douban_spider import DoubanSpider
+from spider.transport import OriginRewriteTransport, PooledTransport
+
+
+def _link(i: int) -> str:
+    return f"https://movie.douban.com/subject/{1000 + i}/"
+
+
+class SeenSubjectsTest(unittest.TestCase):
+    def setUp(self):
+        self.seen = SeenSubjects()
+        self.a, self.b = self.seen.new_owner(), self.seen.new_owner()
+
+    def test_first_owner_wins(self):
+        self.assertTrue(self.seen.claim(_link(1), self.a))
+        self.assertTrue(self.seen.claim("http://movie.douban.com/subject/1001", self.a)) # 按 subject id 比较
+        self.assertFalse(self.seen.claim(_link(1), self.b))
+        self.assertEqual(self.seen.duplicates, 1)
+
+    def test_release_drops_only_unsettled_claims(self):
+        for i in range(3):
+            self.seen.claim(_link(i), self.a)
+        self.seen.settle([_link(0)], self.a)
+        self.assertEqual(self.seen.release(self.a), 2)
+        self.assertFalse(self.seen.claim(_link(0), self.b))
+        self.assertTrue(self.seen.claim(_link(1), self.b))
+        self.assertEqual(self.seen.release(self.a), 0)
+        self.assertEqual(self.seen.release(self.b), 1)
+
+
+class FailedJobTest(unittest.TestCase):
+    def _spider(self, server: ReplayServer, seen: SeenSubjects) -> DoubanSpider:
+        return DoubanSpider(base_url="JSON_API", tag="剧情", limit=40, delay=0.0, engine="async", rate=1000.0,
+                            transport=OriginRewriteTransport(PooledTransport(), server.url), seen=seen)
+
+    def test_failed_job_releases_its_claims(self):
+        seen = SeenSubjects()
+        saved = []
+
+        def _fail_on_second_page(batch):
+            if saved:
+                raise RuntimeError("disk full")
+            saved.extend(batch)
+
+        with ReplayServer(SyntheticCorpus(subjects=40)) as server:
+            with self.assertRaises(RuntimeError):
+                self._spider(server, seen).fetch(save_callback=_fail_on_second_page)
+            self.assertEqual(len(saved), 20)
+            records = []
+            self._spider(server, seen).fetch(save_callback=records.extend)
+        # 第一页已交给写入方，第二个任务只刷新评分；第二页的认领已撤销，由第二个任务完整抓取
+        complete = [r for r in records if r.get("introduction")]
+        self.assertEqual(len(complete), 20)
+        self.assertEqual({r["info_link"] for r in complete} & {r["info_link"] for r in saved}, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
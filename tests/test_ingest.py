@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from multiprocessing import AuthenticationError
+
+from storage.ingest import INGEST_AUTHKEY, IngestClient, IngestError, IngestServer
+from storage.repository import MovieRepository
+
+
+def _records(prefix: int, n: int):
+    return [{"info_link": f"https://movie.douban.com/subject/{prefix * 1000 + i}/", "cname": f"m{prefix}-{i}",
+             "score": "8.0", "rated": "100人评价"} for i in range(n)]
+
+
+class IngestServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, "movie.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _server(self, **kwargs) -> IngestServer:
+        return IngestServer(self.db, ("127.0.0.1", 0), authkey=b"test-key", **kwargs)
+
+    def _client(self, server: IngestServer) -> IngestClient:
+        return IngestClient(server.address, "movies", authkey=b"test-key")
+
+    def test_group_commit_merges_concurrent_batches(self):
+        with self._server(max_wait=0.5) as server:
+            with self._client(server) as client:
+                client.create_table_if_not_exists()
+                commits = server.stats["commits"]
+                for i in range(5):
+                    client.submit(_records(i, 10))
+                client.flush()
+                self.assertEqual(server.stats["commits"] - commits, 1) # 5 个批次合并为一个事务
+                self.assertEqual(client.durable_offset, 50)
+        self.assertEqual(MovieRepository(self.db, "movies").count_movies(), 50)
+
+    def test_many_clients(self):
+        with self._server() as server:
+            with self._client(server) as client:
+                client.create_table_if_not_exists()
+
+            def _worker(prefix):
+                with self._client(server) as client:
+                    for batch in range(4):
+                        client.save_all(_records(prefix * 10 + batch, 5))
+
+            threads = [threading.Thread(target=_worker, args=(i,)) for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(server.stats["records"], 160)
+            self.assertLessEqual(server.stats["commits"], server.stats["requests"])
+        self.assertEqual(MovieRepository(self.db, "movies").count_movies(), 160)
+
+    def test_failed_request_is_isolated(self):
+        with self._server(max_wait=0.5) as server:
+            with self._client(server) as client:
+                client.create_table_if_not_exists()
+                client.submit(_records(1, 3))
+                client._send("call", "drop_everything") # 不支持的操作: 整组失败后逐个重试
+                client.submit(_records(2, 4))
+                with self.assertRaises(IngestError):
+                    client.flush()
+                self.assertEqual(client.durable_offset, 7)
+            self.assertEqual(server.stats["errors"], 1)
+        self.assertEqual(MovieRepository(self.db, "movies").count_movies(), 7)
+
+    def test_ack_offsets_are_monotonic(self):
+        with self._server() as server:
+            with self._client(server) as client:
+                client.create_table_if_not_exists()
+                offsets = []
+                for i in range(4):
+                    result = client.save_all(_records(i, i + 1))
+                    self.assertEqual(result["new"], i + 1)
+                    offsets.append(client.durable_offset)
+                self.assertEqual(offsets, [1, 3, 6, 10])
+
+    def test_defer_refresh_goes_through_the_server(self):
+        with self._server() as server:
+            with self._client(server) as client:
+                client.create_table_if_not_exists()
+                client.save_all(_records(1, 2))
+                repo = MovieRepository(self.db, "movies")
+                due = repo.get_refresh_due(10, now=1e12)
+                self.assertEqual(len(due), 2)
+                client.defer_refresh([m["id"] for m in due], 1e13)
+                self.assertEqual(repo.get_refresh_due(10, now=1e12), [])
+            self.assertEqual(server.stats["errors"], 0)
+
+    def test_rejects_wrong_key(self):
+        with self._server() as server:
+            with self.assertRaises(AuthenticationError):
+                IngestClient(server.address, "movies", authkey=b"wrong-key")
+
+    def test_default_key_only_on_loopback(self):
+        with self.assertRaises(ValueError):
+            IngestServer(self.db, ("0.0.0.0", 0), authkey=INGEST_AUTHKEY)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from storage.repository import MovieRepository, decode_cursor
+
+
+def _movie(i: int, **fields):
+    record = {
+        "info_link": f"https://movie.douban.com/subject/{1000 + i}/", "pic_link": f"https://img/{i}.jpg",
+        "cname": f"电影{i}", "score": f"{5 + (i % 5) * 0.5:.1f}", "rated": f"{100 * (i + 1)}人评价",
+        "introduction": f"第{i}部电影的剧情简介", "year_release": str(1990 + i % 20), "country": "美国",
+        "category": "剧情 / 喜剧", "directors": "导演甲", "actors": "演员乙 / 演员丙",
+    }
+    record.update(fields)
+    return record
+
+
+class RepositoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.repo = MovieRepository(os.path.join(self.tmp, "movie.db"), "movies")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class SaveAllTest(RepositoryTestCase):
+    def test_insert_update_skip(self):
+        self.assertEqual(self.repo.save_all([_movie(i) for i in range(3)]), {"new": 3, "updated": 0, "skipped": 0})
+        result = self.repo.save_all([_movie(0), _movie(1, score="9.9"), _movie(3)])
+        self.assertEqual(result, {"new": 1, "updated": 1, "skipped": 1})
+        self.assertEqual(self.repo.count_movies(), 4)
+
+    def test_duplicate_links_in_one_batch(self):
+        result = self.repo.save_all([_movie(0), _movie(0, score="9.0"), {"cname": "没有链接"}])
+        self.assertEqual(result["new"], 1)
+        self.assertEqual(self.repo.count_movies(), 1)
+
+    def test_empty_values_do_not_overwrite(self):
+        self.repo.save_all([_movie(0)])
+        self.repo.save_all([_movie(0, introduction="", directors="", score="8.8")])
+        row = self.repo.get_movies_by_ids([1])[0]
+        self.assertEqual(row[3], "电影0")
+        self.assertEqual(row[4], "8.8")
+        self.assertEqual(row[6], "第0部电影的剧情简介")
+        self.assertEqual(row[10], "导演甲")
+
+    def test_update_bumps_data_version_only_on_change(self):
+        self.repo.save_all([_movie(0)])
+        version = self.repo.get_data_version()
+        self.repo.save_all([_movie(0)])
+        self.assertEqual(self.repo.get_data_version(), version)
+        self.repo.save_all([_movie(0, score="9.1")])
+        self.assertGreater(self.repo.get_data_version(), version)
+
+    def test_schema_ddl_runs_once(self):
+        self.repo.save_all([_movie(0)])
+        statements = []
+        with self.repo._db.writer() as conn:
+            conn.set_trace_callback(statements.append)
+        try:
+            for i in range(1, 4):
+                self.repo.save_all([_movie(i)])
+        finally:
+            with self.repo._db.writer() as conn:
+                conn.set_trace_callback(None)
+        ddl = [s for s in statements if s.lstrip().lower().startswith(("pragma", "create", "alter"))]
+        self.assertEqual(ddl, [])
+
+
+class KeysetPaginationTest(RepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.repo.save_all([_movie(i) for i in range(23)])
+
+    def _walk(self, sort):
+        rows, cursor = [], None
+        while True:
+            page, cursor, _ = self.repo.get_movies_page(cursor, limit=5, sort=sort)
+            rows += page
+            if cursor is None:
+                return rows
+
+    def test_forward_matches_offset_pagination(self):
+        for sort in ("id", "score", "year"):
+            expected = []
+            for page in range(1, 6):
+                expected += self.repo.get_paginated_movies(page, 5, sort=sort)[0]
+            self.assertEqual([r[0] for r in self._walk(sort)], [r[0] for r in expected], sort)
+
+    def test_backward_returns_previous_page(self):
+        first, next_cursor, prev_cursor = self.repo.get_movies_page(None, limit=5, sort="score")
+        self.assertIsNone(prev_cursor)
+        second, _, prev_cursor = self.repo.get_movies_page(next_cursor, limit=5, sort="score")
+        self.assertNotEqual([r[0] for r in second], [r[0] for r in first])
+        back, _, _ = self.repo.get_movies_page(prev_cursor, limit=5, sort="score", backward=True)
+        self.assertEqual([r[0] for r in back], [r[0] for r in first])
+
+    def test_cursor_is_bound_to_sort(self):
+        _, cursor, _ = self.repo.get_movies_page(None, limit=5, sort="score")
+        self.assertEqual(len(decode_cursor(cursor, "score")), 2)
+        with self.assertRaises(ValueError):
+            self.repo.get_movies_page(cursor, limit=5, sort="year")
+
+
+class FullTextSearchTest(RepositoryTestCase):
+    def test_search_and_reindex_on_update(self):
+        self.repo.save_all([_movie(0, cname="霸王别姬", introduction="京剧名伶的半生故事"),
+                            _movie(1, cname="大话西游", introduction="至尊宝与紫霞仙子")])
+        self.assertEqual([r[3] for r in self.repo.search_movies("霸王")], ["霸王别姬"])
+        self.assertEqual(self.repo.count_search_results("紫霞"), 1)
+
+        self.repo.save_all([_movie(1, cname="大话西游", introduction="月光宝盒穿越时空")])
+        self.assertEqual(self.repo.count_search_results("紫霞"), 0)
+        self.assertEqual([r[3] for r in self.repo.search_movies("穿越")], ["大话西游"])
+
+    def test_snippet_highlight(self):
+        self.repo.save_all([_movie(0, cname="霸王别姬", introduction="京剧名伶的半生故事")])
+        row = self.repo.search_movies("京剧", with_snippet=True)[0]
+        self.assertIn("<mark>", row[-1])
+
+    def test_clear_table_empties_index(self):
+        self.repo.save_all([_movie(0, cname="霸王别姬")])
+        self.repo.clear_table()
+        self.assertEqual(self.repo.search_movies("霸王"), [])
+        self.assertEqual(self.repo.count_movies(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from analysis.snapshot import MovieSnapshot
+
+META = {
+    11: {"year": "1993", "score": "9.6", "country": "中国大陆 / 中国香港", "category": "剧情 / 爱情",
+         "director": "陈凯歌", "actor": "张国荣 / 张丰毅"},
+    7: {"year": "1995(中国香港)", "score": "9.2", "country": "中国香港", "category": "喜剧 / 奇幻",
+        "director": "刘镇伟", "actor": "周星驰 / 吴孟达"},
+    42: {"year": None, "score": "", "country": "美国", "category": None, "director": "", "actor": None},
+}
+
+
+class MovieSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = MovieSnapshot.from_meta([11, 7, 42], META)
+
+    def _ids(self, **filters):
+        return self.snapshot.ids[self.snapshot.filter(**filters)].tolist()
+
+    def test_row_index_follows_movie_ids(self):
+        self.assertEqual([self.snapshot.row(i) for i in (11, 7, 42)], [0, 1, 2])
+        self.assertIsNone(self.snapshot.row(1))
+
+    def test_numeric_columns(self):
+        self.assertEqual(self.snapshot.year.tolist(), [1993, 1995, 0])
+        self.assertTrue(np.isnan(self.snapshot.score[2]))
+
+    def test_filters_match_substrings(self):
+        self.assertEqual(self._ids(country="中国香港"), [11, 7])
+        self.assertEqual(self._ids(actor="周星"), [7])
+        self.assertEqual(self._ids(year_min=1990, year_max=1994), [11])
+        self.assertEqual(self._ids(min_score="9.5"), [11])
+        self.assertEqual(self._ids(category="剧情", director="陈"), [11])
+        self.assertEqual(self._ids(), [11, 7, 42])
+
+    def test_rejects_unknown_or_malformed_filters(self):
+        with self.assertRaises(TypeError):
+            self.snapshot.filter(contry="美国")
+        with self.assertRaises(ValueError):
+            self.snapshot.filter(year_min="九十年代")
+
+
+if __name__ == "__main__":
+    unittest.main()
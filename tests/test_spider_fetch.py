@@ -0,0 +1,39 @@
+import asyncio
+import time
+import unittest
+
+from benchmarks.replay_server import ReplayBehavior, ReplayServer, SyntheticCorpus
+from spider.douban_spider import DoubanSpider
+from spider.transport import OriginRewriteTransport, PooledTransport
+
+URL = "https://movie.douban.com/subject/1000/"
+
+
+class RetryThroughLimiterTest(unittest.TestCase):
+    def _spider(self, server: ReplayServer) -> DoubanSpider:
+        spider = DoubanSpider(engine="async", rate=1000.0, transport=OriginRewriteTransport(PooledTransport(), server.url))
+        self.acquired = []
+        acquire = spider.limiter.acquire
+        spider.limiter.acquire = lambda url: self.acquired.append(url) or acquire(url)
+        return spider
+
+    def test_async_retries_draw_tokens(self):
+        with ReplayServer(SyntheticCorpus(subjects=1), ReplayBehavior(error_rate=1.0)) as server:
+            spider = self._spider(server)
+            started = time.perf_counter()
+            self.assertEqual(asyncio.run(spider._get_async(URL)), "")
+            elapsed = time.perf_counter() - started
+            requests = sum(server.stats.values())
+        self.assertEqual(requests, 3)
+        self.assertEqual(len(self.acquired), 3) # 每次尝试 (包括重试) 都取令牌
+        self.assertLess(elapsed, 2.0) # 没有固定的 2s/4s 等待
+
+    def test_get_page_single_attempt(self):
+        with ReplayServer(SyntheticCorpus(subjects=1)) as server:
+            spider = self._spider(server)
+            self.assertIn("<html", spider.get_page(URL).lower())
+        self.assertEqual(self.acquired, [URL])
+
+
+if __name__ == "__main__":
+    unittest.main()
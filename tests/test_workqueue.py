@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from benchmarks.replay_server import ReplayBehavior, ReplayServer, SyntheticCorpus
+from spider.worker import QueueWorker, list_task
+from storage.workqueue import RemoteWorkQueue, WorkQueue, WorkQueueServer
+
+
+def _tasks(n: int):
+    return [("list", f"list:{i}", {"tag": "剧情", "sort": "recommend", "start": i * 20}) for i in range(n)]
+
+
+class WorkQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = WorkQueue(os.path.join(self.tmp, "workqueue.db"), max_attempts=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class LeaseTest(WorkQueueTestCase):
+    def test_queue_db_does_not_use_wal(self):
+        with self.queue._db.writer() as conn:
+            self.assertEqual(conn.execute("pragma journal_mode").fetchone()[0].lower(), "delete")
+        self.assertFalse(os.path.exists(self.queue.db_path + "-shm"))
+
+    def test_claim_is_exclusive(self):
+        self.assertEqual(self.queue.enqueue(_tasks(3)), 3)
+        self.assertEqual(self.queue.enqueue(_tasks(3)), 0) # 相同 key 不重复入队
+        first = self.queue.claim("a", limit=2)
+        second = self.queue.claim("b", limit=2)
+        self.assertEqual([t.key for t in first], ["list:0", "list:1"])
+        self.assertEqual([t.key for t in second], ["list:2"])
+        self.assertEqual(self.queue.claim("c", limit=2), [])
+        self.assertEqual(first[0].attempts, 1)
+        self.assertEqual(self.queue.counts()["leased"], 3)
+
+    def test_expired_lease_is_reclaimed(self):
+        self.queue.enqueue(_tasks(1))
+        task, = self.queue.claim("a", lease_seconds=-1)
+        other, = self.queue.claim("b") # claim 先回收过期租约
+        self.assertEqual(other.id, task.id)
+        self.assertEqual(other.attempts, 2)
+        self.assertFalse(self.queue.complete(task, "a", [{"cname": "过期的结果"}]))
+        self.assertTrue(self.queue.complete(other, "b", [{"cname": "m"}]))
+        self.assertEqual(self.queue.pending_results(), [(1, [{"cname": "m"}])])
+
+    def test_heartbeat_extends_only_own_leases(self):
+        self.queue.enqueue(_tasks(2))
+        mine, theirs = self.queue.claim("a", lease_seconds=0.2, limit=1) + self.queue.claim("b", lease_seconds=0.2)
+        self.assertEqual(self.queue.heartbeat([mine.id, theirs.id], "a", lease_seconds=60), [mine.id])
+        time.sleep(0.3)
+        self.assertEqual(self.queue.reap(), 1)
+        self.assertEqual(self.queue.counts(), {"leased": 1, "queued": 1, "pending_results": 0})
+
+    def test_retries_until_max_attempts(self):
+        self.queue.enqueue(_tasks(1))
+        for attempt in range(1, 4):
+            task, = self.queue.claim("a")
+            self.assertEqual(task.attempts, attempt)
+            self.queue.fail(task, "a", "boom")
+        self.assertEqual(self.queue.claim("a"), [])
+        self.assertEqual(self.queue.counts()["failed"], 1)
+        self.assertTrue(self.queue.drained())
+
+    def test_expired_last_attempt_is_failed(self):
+        self.queue.enqueue(_tasks(1))
+        for _ in range(3):
+            self.queue.claim("a", lease_seconds=-1)
+        self.assertEqual(self.queue.reap(), 1)
+        self.assertEqual(self.queue.counts()["failed"], 1)
+
+    def test_follow_up_tasks_commit_with_result(self):
+        self.queue.enqueue(_tasks(1))
+        task, = self.queue.claim("a")
+        self.assertTrue(self.queue.complete(task, "a", [], [("detail", "detail:1", {}), ("detail", "detail:2", {})]))
+        self.assertEqual(self.queue.counts()["queued"], 2)
+        self.assertEqual(self.queue.pending_results(), [])
+
+
+class QueueWorkerTest(WorkQueueTestCase):
+    def _worker(self, server: ReplayServer) -> QueueWorker:
+        return QueueWorker(self.queue, owner="test", concurrency=4, rate=1000.0, lease_seconds=30,
+                           origin=server.url)
+
+    def test_crawls_list_and_detail_pages(self):
+        with ReplayServer(SyntheticCorpus(subjects=30)) as server:
+            self.queue.enqueue([list_task("剧情", "recommend", start) for start in (0, 20)])
+            stats = self._worker(server).run(idle_wait=0.05)
+        self.assertEqual((stats["list"], stats["detail"], stats["failed"]), (2, 30, 0))
+        records = [r for _, batch in self.queue.pending_results(limit=100) for r in batch]
+        self.assertEqual(len({r["info_link"] for r in records}), 30)
+
+    def test_failed_fetches_are_retried_through_the_queue(self):
+        with ReplayServer(SyntheticCorpus(subjects=5), ReplayBehavior(error_rate=1.0)) as server:
+            self.queue.enqueue([list_task("剧情", "recommend", 0)])
+            worker = self._worker(server)
+            acquired = []
+            acquire = worker.limiter.acquire
+            worker.limiter.acquire = lambda url: acquired.append(url) or acquire(url)
+            started = time.perf_counter()
+            stats = worker.run(idle_wait=0.05)
+            elapsed = time.perf_counter() - started
+            requests = sum(server.stats.values())
+        self.assertEqual(stats["failed"], 3)
+        self.assertEqual(self.queue.counts()["failed"], 1)
+        self.assertEqual(requests, 3) # 每次领取只请求一次，重试次数由 max_attempts 决定
+        self.assertEqual(len(acquired), 3) # 每次请求都经过限速器
+        self.assertLess(elapsed, 2.0) # 不再固定等待 2s/4s
+
+
+class RemoteWorkQueueTest(WorkQueueTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = WorkQueueServer(self.queue, ("127.0.0.1", 0), authkey=b"test-key").start()
+        self.remote = RemoteWorkQueue(self.server.address, authkey=b"test-key")
+
+    def tearDown(self):
+        self.remote.close()
+        self.server.close()
+        super().tearDown()
+
+    def test_lease_cycle_through_the_server(self):
+        self.assertEqual(self.remote.enqueue(_tasks(2)), 2)
+        task, = self.remote.claim("a")
+        self.assertEqual((task.key, task.payload["start"], task.attempts), ("list:0", 0, 1))
+        self.assertEqual(self.remote.heartbeat([task.id], "a"), [task.id])
+        self.assertTrue(self.remote.complete(task, "a", [{"cname": "m"}], [("detail", "detail:1", {"sub": {}})]))
+        other, = self.remote.claim("b")
+        self.remote.fail(other, "b", "boom")
+        self.assertFalse(self.remote.complete(other, "b", []))
+        self.assertEqual(self.remote.pending_results(), [(1, [{"cname": "m"}])])
+        self.remote.mark_ingested([1])
+        self.assertEqual(self.remote.counts(), self.queue.counts())
+        self.assertFalse(self.remote.drained())
+
+    def test_rejects_unknown_method(self):
+        with self.assertRaises(RuntimeError):
+            self.remote._call("_db")
+
+    def test_default_key_only_on_loopback(self):
+        with self.assertRaises(ValueError):
+            WorkQueueServer(self.queue, ("0.0.0.0", 0))
+
+    def test_worker_through_the_server(self):
+        with ReplayServer(SyntheticCorpus(subjects=10)) as server:
+            self.remote.enqueue([list_task("剧情", "recommend", 0)])
+            worker = QueueWorker(self.remote, owner="remote", concurrency=4, rate=1000.0, origin=server.url)
+            stats = worker.run(idle_wait=0.05)
+        self.assertEqual((stats["list"], stats["detail"]), (1, 10))
+        self.assertTrue(self.queue.drained())
+
+
+if __name__ == "__main__":
+    unittest.main()
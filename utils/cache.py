@@ -0,0 +1,32 @@
+import threading
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class VersionedCache:
+    """按数据版本失效的小型内存缓存.
+
+    缓存项记录生成时的数据版本号 (MovieRepository.get_data_version)，
+    读取时版本不一致即视为过期；超过容量时淘汰最早写入的项.
+    """
+
+    def __init__(self, maxsize: int = 32) -> None:
+        self.maxsize = maxsize
+        self._items: Dict[Hashable, Tuple[int, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+        if item is None or item[0] != version:
+            return None
+        return item[1]
+
+    def set(self, key: Hashable, version: int, value: Any) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (version, value)
+            while len(self._items) > self.maxsize:
+                self._items.pop(next(iter(self._items)))
+
+
+__all__ = ["VersionedCache"]
@@ -0,0 +1,136 @@
+"""分布式爬取任务队列 (基于租约的 SQLite 队列，见 storage/workqueue.py).
+
+用法:
+    python work_queue.py seed --tags 剧情,喜剧 --sort recommend,rank --limit 200   # 按标签分页入队
+    python work_queue.py worker --concurrency 4 --rate 2                           # 任意多个工作进程 / 机器
+    python work_queue.py writer --db data/movie.db --table movies                   # 唯一的中央写入进程
+    python work_queue.py status
+
+多台机器时由一台机器持有队列库并提供队列服务，其他机器上的命令加 --server 连接 (不要把队列库放在网络文件系统上):
+    DOUBAN_INGEST_KEY=<密钥> python work_queue.py serve --host 0.0.0.0 --port 8766
+    DOUBAN_INGEST_KEY=<密钥> python work_queue.py --server 10.0.0.5:8766 worker --concurrency 4
+
+工作进程领取任务时获得一个有时限的租约并定期续租；进程崩溃或失联后租约过期，任务重新排队由其他进程接手。
+结果写回队列库，由中央写入进程批量入库 (save_all 为 UPSERT，重复入库同一结果是安全的).
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List, Union
+
+from spider.worker import PAGE_SIZE, QueueWorker, list_task
+from storage.repository import MovieRepository
+from storage.ingest import INGEST_KEY_ENV, parse_address
+from storage.workqueue import QUEUE_PORT, WORK_QUEUE_DB, RemoteWorkQueue, WorkQueue, WorkQueueServer
+from utils.logger import logger
+
+
+def seed(queue: Union[WorkQueue, RemoteWorkQueue], tags: List[str], sorts: List[str], limit: int, start: int = 0) -> int:
+    """把 (标签 x 排序) 的每个 API 分页作为列表任务入队 (limit 向上取整到整页)."""
+    tasks = [list_task(tag, sort, offset) for tag in tags for sort in sorts
+             for offset in range(start, start + limit, PAGE_SIZE)]
+    added = queue.enqueue(tasks)
+    logger.info(f"Queued {added} list tasks ({len(tasks) - added} already queued).")
+    return added
+
+
+def run_writer(queue: Union[WorkQueue, RemoteWorkQueue], db_path: str, table: str, batch: int = 100, poll: float = 2.0,
+               forever: bool = False) -> Dict[str, int]:
+    """中央写入进程: 不断取出未入库的结果，合并为一个事务写入电影表，直到队列完成 (forever 时一直运行)."""
+    parent = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(parent, exist_ok=True)
+    repo = MovieRepository(db_path, table)
+    repo.create_table_if_not_exists()
+    stats = {"results": 0, "records": 0, "new": 0, "updated": 0}
+    while True:
+        pending = queue.pending_results(batch)
+        if pending:
+            records = [record for _, chunk in pending for record in chunk]
+            result = repo.save_all(records)
+            queue.mark_ingested([result_id for result_id, _ in pending])
+            stats["results"] += len(pending)
+            stats["records"] += len(records)
+            stats["new"] += result["new"]
+            stats["updated"] += result["updated"]
+            logger.info(f"  [Ingested {len(records)} records: {result['new']} new, {result['updated']} updated]")
+            continue
+        counts = queue.counts() # 任务状态先于结果读取: 期间完成的任务，其结果一定能在这里看到
+        if not forever and not counts.get("queued") and not counts.get("leased") and not counts["pending_results"]:
+            break
+        time.sleep(poll)
+    logger.info(f"Writer finished: {stats}")
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="基于租约的分布式爬取任务队列")
+    parser.add_argument("--queue", default=WORK_QUEUE_DB, help=f"任务队列数据库 (默认: {WORK_QUEUE_DB})")
+    parser.add_argument("--max-attempts", type=int, default=3, help="每个任务的最大尝试次数 (默认: 3)")
+    parser.add_argument("--server", default="", help="连接队列服务 host:port，而不是直接打开队列库")
+    parser.add_argument("--authkey", default="", help=f"队列服务密钥 (默认取环境变量 {INGEST_KEY_ENV})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_seed = sub.add_parser("seed", help="按标签分页入队")
+    p_seed.add_argument("--tags", required=True, help="以逗号分隔的标签列表")
+    p_seed.add_argument("--sort", default="recommend", help="排序方式，可多选(逗号分隔): recommend, rank, time")
+    p_seed.add_argument("--limit", type=int, default=100, help="每个标签抓取的数量")
+    p_seed.add_argument("--start", type=int, default=0, help="起始偏移量")
+
+    p_worker = sub.add_parser("worker", help="领取并执行任务")
+    p_worker.add_argument("--concurrency", type=int, default=4, help="并发线程数 (默认: 4)")
+    p_worker.add_argument("--rate", type=float, default=2.0, help="本进程每个域名每秒的最大请求数 (默认: 2.0)")
+    p_worker.add_argument("--lease", type=float, default=60.0, help="租约时长 (秒, 默认: 60)")
+    p_worker.add_argument("--origin", default="", help="把请求改发到该地址 (例如本地回放服务器)")
+    p_worker.add_argument("--parser", default="auto", choices=["auto", "lxml", "soup-fast", "soup"], help="HTML 解析器")
+    p_worker.add_argument("--forever", action="store_true", help="队列为空时继续等待新任务")
+
+    p_writer = sub.add_parser("writer", help="把结果写入电影数据库")
+    p_writer.add_argument("--db", default=os.path.join("data", "movie.db"), help="数据库保存路径")
+    p_writer.add_argument("--table", default="movies", help="保存到的数据库表名")
+    p_writer.add_argument("--batch", type=int, default=100, help="每个事务最多合并多少个任务结果 (默认: 100)")
+    p_writer.add_argument("--forever", action="store_true", help="队列完成后继续等待新结果")
+
+    sub.add_parser("status", help="显示各状态的任务数")
+
+    p_serve = sub.add_parser("serve", help="持有队列库，为其他机器提供队列服务")
+    p_serve.add_argument("--host", default="127.0.0.1", help="监听地址 (默认: 127.0.0.1；非回环地址必须设置密钥)")
+    p_serve.add_argument("--port", type=int, default=QUEUE_PORT, help=f"监听端口 (默认: {QUEUE_PORT})")
+    args = parser.parse_args()
+
+    authkey = args.authkey.encode() or None
+    if args.command == "serve":
+        if args.server:
+            logger.error("serve 直接打开队列库，不能与 --server 同时使用")
+            return 1
+        try:
+            server = WorkQueueServer(WorkQueue(args.queue, max_attempts=args.max_attempts),
+                                     (args.host, args.port), authkey=authkey)
+        except ValueError as e:
+            logger.error(str(e))
+            return 1
+        server.serve_forever()
+        return 0
+
+    if args.server:
+        queue = RemoteWorkQueue(parse_address(args.server), authkey=authkey)
+    else:
+        queue = WorkQueue(args.queue, max_attempts=args.max_attempts)
+    if args.command == "seed":
+        tags = [t.strip() for t in args.tags.split(",") if t.strip()]
+        sorts = [s.strip() for s in args.sort.split(",") if s.strip()]
+        if not tags or not sorts:
+            logger.error("标签列表与排序列表不能为空")
+            return 1
+        seed(queue, tags, sorts, args.limit, args.start)
+    elif args.command == "worker":
+        QueueWorker(queue, concurrency=args.concurrency, rate=args.rate, lease_seconds=args.lease,
+                    origin=args.origin, parser=args.parser).run(forever=args.forever)
+    elif args.command == "writer":
+        run_writer(queue, args.db, args.table, batch=args.batch, forever=args.forever)
+    print(queue.counts())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())